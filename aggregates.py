@@ -0,0 +1,308 @@
+import copy
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+BINS = 32
+QUANTILES = (0.25, 0.5, 0.75)
+# Cube files kept per name; older versions are pruned, least recently used first
+KEEP_VERSIONS = 3
+
+
+class AggregateCube:
+    """Materialized count/sum/sum-of-squares/min/max and histogram sketches per cell
+    of a set of categorical dimensions.
+
+    Only occupied cells are stored, identified by a flat code over `dims`.
+    Histograms use per-measure bin edges shared by every cell, so quantiles
+    are approximate to one bin width. When appended values fall outside a
+    measure's range, the range is doubled and adjacent bins are merged until
+    they fit, so no value is clipped into an end bin.
+    """
+
+    def __init__(self, dims, measures, edges, version=None):
+        self.dims = {name: list(levels) for name, levels in dims.items()}
+        self.measures = list(measures)
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.version = version
+        self.shape = tuple(len(levels) for levels in self.dims.values())
+        n_measures, bins = len(self.measures), self.edges.shape[1] - 1
+        if bins % 2:
+            raise ValueError("the number of histogram bins must be even")
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.count = np.zeros((0, n_measures), dtype=np.int64)
+        self.sum = np.zeros((0, n_measures))
+        self.sumsq = np.zeros((0, n_measures))
+        self.min = np.zeros((0, n_measures))
+        self.max = np.zeros((0, n_measures))
+        self.hist = np.zeros((0, n_measures, bins), dtype=np.int64)
+
+    @classmethod
+    def from_frame(cls, frame, dims, measures, bins=BINS, version=None):
+        """Build a cube, taking histogram ranges from this first batch of rows."""
+        edges = []
+        for col in measures:
+            values = pd.to_numeric(frame[col], errors="coerce").to_numpy(dtype=np.float64)
+            values = values[np.isfinite(values)]
+            lo, hi = (values.min(), values.max()) if len(values) else (0.0, 1.0)
+            pad = (hi - lo) * 0.1 or 1.0
+            edges.append(np.linspace(lo - pad, hi + pad, bins + 1))
+        cube = cls(dims, measures, edges, version=version)
+        cube.append(frame)
+        return cube
+
+    def _cell_codes(self, frame):
+        codes = [pd.Categorical(frame[name], categories=levels).codes.astype(np.int64)
+                 for name, levels in self.dims.items()]
+        # Values outside the declared levels are dropped
+        valid = np.logical_and.reduce([c >= 0 for c in codes]) if codes else np.ones(len(frame), dtype=bool)
+        flat = np.ravel_multi_index([c[valid] for c in codes], self.shape) if codes else np.zeros(valid.sum(), dtype=np.int64)
+        return flat, valid
+
+    def _widen(self, j, lo, hi):
+        # Double measure j's range towards the values outside it, merging
+        # adjacent bin pairs, until [lo, hi] fits. New arrays, not in place
+        edges, hist = self.edges[j], self.hist[:, j, :]
+        bins = len(edges) - 1
+        if edges[0] <= lo and hi <= edges[-1]:
+            return
+        while lo < edges[0] or hi > edges[-1]:
+            width = edges[-1] - edges[0]
+            pairs = hist.reshape(len(hist), bins // 2, 2).sum(axis=2)
+            empty = np.zeros_like(pairs)
+            if hi > edges[-1]:
+                edges = np.linspace(edges[0], edges[-1] + width, bins + 1)
+                hist = np.concatenate([pairs, empty], axis=1)
+            else:
+                edges = np.linspace(edges[0] - width, edges[-1], bins + 1)
+                hist = np.concatenate([empty, pairs], axis=1)
+        self.edges = self.edges.copy()
+        self.edges[j] = edges
+        self.hist = self.hist.copy()
+        self.hist[:, j, :] = hist
+
+    def append(self, frame):
+        """Fold new rows into the cube in place."""
+        flat, valid = self._cell_codes(frame)
+        keys, inverse = np.unique(flat, return_inverse=True)
+        n_cells, n_measures, bins = len(keys), len(self.measures), self.edges.shape[1] - 1
+        columns = [pd.to_numeric(frame[col], errors="coerce").to_numpy(dtype=np.float64)[valid] for col in self.measures]
+        for j, values in enumerate(columns):
+            finite = values[np.isfinite(values)]
+            if len(finite):
+                self._widen(j, finite.min(), finite.max())
+
+        part_rows = np.bincount(inverse, minlength=n_cells)
+        part_count = np.zeros((n_cells, n_measures), dtype=np.int64)
+        part_sum = np.zeros((n_cells, n_measures))
+        part_sumsq = np.zeros((n_cells, n_measures))
+        part_min = np.full((n_cells, n_measures), np.inf)
+        part_max = np.full((n_cells, n_measures), -np.inf)
+        part_hist = np.zeros((n_cells, n_measures, bins), dtype=np.int64)
+        for j, values in enumerate(columns):
+            ok = np.isfinite(values)
+            cells, x = inverse[ok], values[ok]
+            part_count[:, j] = np.bincount(cells, minlength=n_cells)
+            part_sum[:, j] = np.bincount(cells, weights=x, minlength=n_cells)
+            part_sumsq[:, j] = np.bincount(cells, weights=x * x, minlength=n_cells)
+            np.minimum.at(part_min[:, j], cells, x)
+            np.maximum.at(part_max[:, j], cells, x)
+            b = np.clip(np.searchsorted(self.edges[j], x, side="right") - 1, 0, bins - 1)
+            part_hist[:, j, :] = np.bincount(cells * bins + b, minlength=n_cells * bins).reshape(n_cells, bins)
+
+        # Merge the partial cells into the stored ones
+        merged = np.union1d(self.keys, keys)
+        old, new = np.searchsorted(merged, self.keys), np.searchsorted(merged, keys)
+
+        def combine(current, part, fill, op):
+            out = np.full((len(merged),) + current.shape[1:], fill, dtype=current.dtype)
+            out[old] = current
+            out[new] = op(out[new], part)
+            return out
+
+        self.rows = combine(self.rows, part_rows, 0, np.add)
+        self.count = combine(self.count, part_count, 0, np.add)
+        self.sum = combine(self.sum, part_sum, 0.0, np.add)
+        self.sumsq = combine(self.sumsq, part_sumsq, 0.0, np.add)
+        self.min = combine(self.min, part_min, np.inf, np.minimum)
+        self.max = combine(self.max, part_max, -np.inf, np.maximum)
+        self.hist = combine(self.hist, part_hist, 0, np.add)
+        self.keys = merged
+        return self
+
+    def _groups(self, by):
+        # Group index of every stored cell for a roll-up onto the `by` dimensions
+        if not by:
+            return np.zeros(len(self.keys), dtype=np.int64), pd.MultiIndex.from_tuples([()])
+        codes = np.unravel_index(self.keys, self.shape)
+        names = list(self.dims)
+        positions = [names.index(name) for name in by]
+        sub_shape = tuple(self.shape[p] for p in positions)
+        group = np.ravel_multi_index([codes[p] for p in positions], sub_shape)
+        present, inverse = np.unique(group, return_inverse=True)
+        labels = np.unravel_index(present, sub_shape)
+        index = pd.MultiIndex.from_arrays(
+            [np.asarray(self.dims[name], dtype=object)[labels[i]] for i, name in enumerate(by)], names=by)
+        return inverse, index
+
+    def _reduce(self, by):
+        inverse, index = self._groups(by)
+        n = len(index)
+
+        def add(values):
+            out = np.zeros((n,) + values.shape[1:], dtype=values.dtype)
+            np.add.at(out, inverse, values)
+            return out
+
+        def extreme(values, fill, op):
+            out = np.full((n,) + values.shape[1:], fill)
+            op.at(out, inverse, values)
+            return out
+
+        return index, {
+            "rows": add(self.rows), "count": add(self.count), "sum": add(self.sum), "sumsq": add(self.sumsq),
+            "min": extreme(self.min, np.inf, np.minimum), "max": extreme(self.max, -np.inf, np.maximum),
+            "hist": add(self.hist),
+        }
+
+    def _quantile(self, hist, j, q):
+        # Linear interpolation within the bin holding the q-th value
+        cdf = np.cumsum(hist)
+        if cdf[-1] == 0:
+            return np.nan
+        target = q * cdf[-1]
+        b = int(np.searchsorted(cdf, target))
+        before = cdf[b - 1] if b else 0
+        frac = (target - before) / max(hist[b], 1)
+        lo, hi = self.edges[j, b], self.edges[j, b + 1]
+        return lo + frac * (hi - lo)
+
+    def _stats(self, agg, g, j):
+        n = agg["count"][g, j]
+        mean = agg["sum"][g, j] / n if n else np.nan
+        var = (agg["sumsq"][g, j] - n * mean * mean) / (n - 1) if n > 1 else np.nan
+        stats = {"count": n, "mean": mean, "std": np.sqrt(max(var, 0.0)) if n > 1 else np.nan,
+                 "min": agg["min"][g, j] if n else np.nan}
+        for q in QUANTILES:
+            value = self._quantile(agg["hist"][g, j], j, q)
+            # Keep sketch quantiles inside the exact observed range
+            stats[f"{q:.0%}"] = min(max(value, stats["min"]), agg["max"][g, j]) if n else np.nan
+        stats["max"] = agg["max"][g, j] if n else np.nan
+        return stats
+
+    def value_counts(self, dim):
+        """Row counts per level of one dimension, largest first."""
+        index, agg = self._reduce([dim])
+        return pd.Series(agg["rows"], index=index.get_level_values(0), name="count").sort_values(ascending=False)
+
+    def rollup(self, by, measures=None, stats=("mean",)):
+        """Statistics of `measures` grouped by the `by` dimensions, one row per group."""
+        measures = measures or self.measures
+        index, agg = self._reduce(by)
+        columns = {}
+        for m in measures:
+            j = self.measures.index(m)
+            per_group = [self._stats(agg, g, j) for g in range(len(index))]
+            for s in stats:
+                name = m if len(stats) == 1 else f"{m}_{s}"
+                columns[name] = [row[s] for row in per_group]
+        return pd.DataFrame(columns, index=index).reset_index()
+
+    def describe(self, measures=None):
+        """Equivalent of DataFrame.describe() for the measures, read from the cube."""
+        measures = measures or self.measures
+        _, agg = self._reduce([])
+        return pd.DataFrame({m: self._stats(agg, 0, self.measures.index(m)) for m in measures})
+
+    def save(self, path):
+        meta = {"dims": self.dims, "measures": self.measures, "version": self.version}
+        np.savez(path, meta=np.array(json.dumps(meta)), edges=self.edges, keys=self.keys, rows=self.rows,
+                 count=self.count, sum=self.sum, sumsq=self.sumsq, min=self.min, max=self.max, hist=self.hist)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            cube = cls(meta["dims"], meta["measures"], data["edges"], version=meta["version"])
+            for name in ("keys", "rows", "count", "sum", "sumsq", "min", "max", "hist"):
+                setattr(cube, name, data[name])
+        return cube
+
+
+def cached_cube(cache_dir, name, version, build):
+    """Load the cube for `version` from disk, or build and persist it."""
+    path = os.path.join(cache_dir, f"{name}-{version}.npz")
+    if os.path.exists(path):
+        try:
+            # Marks the version as in use, so save_cube keeps it
+            os.utime(path)
+            return AggregateCube.load(path)
+        except OSError:
+            pass  # pruned meanwhile; build it again
+    cube = build()
+    cube.version = version
+    save_cube(cache_dir, name, cube)
+    return cube
+
+
+def save_cube(cache_dir, name, cube, keep=KEEP_VERSIONS):
+    """Persist a cube under its version, keeping the `keep` most recently used
+    versions, so workers still on an older data version do not lose theirs."""
+    path = os.path.join(cache_dir, f"{name}-{cube.version}.npz")
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    cube.save(tmp)
+    os.replace(tmp, path)
+    versions = []
+    for old in glob.glob(os.path.join(glob.escape(cache_dir), f"{glob.escape(name)}-*.npz")):
+        if old != path and not old.endswith(".tmp.npz"):
+            try:
+                versions.append((os.path.getmtime(old), old))
+            except OSError:
+                pass
+    for _, old in sorted(versions, reverse=True)[max(0, keep - 1):]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+
+
+def build_sensor_cube(store, patients, dims, measures, chunk_rows=1_000_000):
+    """Cube over HAR rows, with patient-level dimensions looked up per row.
+
+    Rows are folded in chunk by chunk, so the joined rows never exist in full.
+    """
+    lookup = patients.set_index("Patient_ID").reindex(store.patient_ids)
+    patient_dims = [name for name in dims if name in lookup.columns]
+    cube = None
+    for start in range(0, max(len(store), 1), chunk_rows):
+        rows = slice(start, start + chunk_rows)
+        frame = store.frame(rows)
+        for name in patient_dims:
+            frame[name] = lookup[name].to_numpy()[store.codes[rows]]
+        cube = AggregateCube.from_frame(frame, dims, measures) if cube is None else cube.append(frame)
+    return cube
+
+
+def append_sensor_rows(cube, store, patients, rows, enrolled=()):
+    """A copy of a build_sensor_cube cube with new HAR `rows` (a typed frame) folded in.
+
+    Rows of patients not in `patients` have no patient dimensions and are left
+    out, as in build_sensor_cube. Patients in `enrolled` were added to
+    `patients` since the cube was built, so all of their rows in `store` are
+    folded in, earlier ones included. Readers of the original cube are not
+    affected.
+    """
+    enrolled = [pid for pid in enrolled if pid in store]
+    frame = rows
+    if enrolled:
+        frame = rows[~pd.Index(rows["Patient_ID"], dtype=object).isin(enrolled)]
+        frame = pd.concat([frame] + [store.patient(pid) for pid in enrolled], ignore_index=True)
+    lookup = patients.set_index("Patient_ID").reindex(frame["Patient_ID"])
+    frame = frame.assign(**{name: lookup[name].to_numpy() for name in cube.dims if name in lookup.columns})
+    # append() replaces the cube's arrays rather than writing into them
+    return copy.copy(cube).append(frame)
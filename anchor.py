@@ -1,12 +1,16 @@
 import streamlit as st
-import google.generativeai as genai
 import os
+import llm_client
+import metrics
+import document_store
+import application_store
 import re
 
 
 # Configure Google Generative AI
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY', st.secrets.get("GOOGLE_API_KEY"))
-genai.configure(api_key=GOOGLE_API_KEY)
+llm_client.configure(GOOGLE_API_KEY)
+metrics.start_exporter()
 
 # App title and description
 st.title("Medicaid Enrollment Assistant")
@@ -15,8 +19,31 @@ This application simplifies the Medicaid enrollment process for high-needs indiv
 leveraging Google Generative AI for conversational assistance and compliance.
 """)
 
+# Enrollment applications and status history, shared by all sessions on this server
+@metrics.cached(st.cache_resource)
+def load_application_store():
+    return application_store.ApplicationStore()
+
+# Polls the background check of the uploaded document
+@st.fragment(run_every=2)
+def verification_status(document):
+    row = document_store.describe(document)
+    if row["Status"] == "queued":
+        st.info("Verification in progress...")
+    elif row["Status"] == "verified":
+        st.success(f"Verification complete: {row['Details']}")
+        application_id = st.session_state.get("application_id")
+        applications = load_application_store()
+        current = applications.status(application_id)
+        if current is not None and current["status"] == "submitted":
+            applications.update_status([application_id], "documents_verified", note=row["Document"], changed_by="document check")
+    else:
+        st.error(f"We could not verify this document: {row['Details']}")
+
 # Navigation menu
 menu = st.sidebar.radio("Navigation", ["Home", "Enrollment", "Document Upload", "Progress Tracker", "Help"])
+# Time this rerun; finished after the footer
+render = metrics.page_render("anchor", menu, st.session_state)
 
 # Home page
 if menu == "Home":
@@ -32,9 +59,12 @@ elif menu == "Enrollment":
     # AI-assisted conversation
     user_input = st.text_input("Type your question or concern here:")
     if user_input:
-        # Connect to Google Generative AI
-        response = generativeai.chat(prompt=user_input)
-        st.text_area("AI Response", response["output"], height=200)
+        # Connect to Google Generative AI through the shared client
+        st.write("**AI Response**")
+        try:
+            st.write_stream(llm_client.get_client().stream(user_input))
+        except Exception as e:
+            st.error("Sorry, I couldn't process your request. Please try again later.")
     
     # Basic information form
     st.write("### Basic Information")
@@ -44,7 +74,12 @@ elif menu == "Enrollment":
     income = st.number_input("Monthly Income ($)", min_value=0, step=100)
     
     if st.button("Submit Information"):
-        st.success("Your information has been saved. Proceed to the Document Upload step.")
+        if not name.strip():
+            st.error("Please enter your full name.")
+        else:
+            st.session_state.application_id = load_application_store().submit(name, dob, {"address": address, "income": income})
+            st.success("Your information has been saved. Proceed to the Document Upload step.")
+            st.caption(f"Application ID: {st.session_state.application_id}")
 
 # Document Upload page
 elif menu == "Document Upload":
@@ -52,21 +87,39 @@ elif menu == "Document Upload":
     st.write("Upload necessary documents for Medicaid enrollment.")
     
     # File upload
-    uploaded_file = st.file_uploader("Upload your ID or proof of eligibility (PDF, PNG, JPG)")
+    uploaded_file = st.file_uploader("Upload your ID or proof of eligibility (PDF, PNG, JPG)", type=["pdf", "png", "jpg", "jpeg"])
     if uploaded_file:
-        st.success(f"{uploaded_file.name} uploaded successfully.")
-        st.write("Our system will verify your document automatically.")
-        # Placeholder for document verification
-        st.info("Verification in progress...")
+        # Streamed to disk in chunks and stored once per content hash
+        document, = document_store.store_uploads([uploaded_file], st.session_state.setdefault("documents", {}))
+        if "error" in document:
+            st.error(document["error"])
+        else:
+            st.success(f"{uploaded_file.name} uploaded successfully.")
+            st.write("Our system will verify your document automatically.")
+            verification_status(document)
 
 # Progress Tracker
 elif menu == "Progress Tracker":
     st.header("Track Your Application Progress")
     st.write("Check the status of your Medicaid application.")
     
-    # Simulated progress tracker
-    progress = st.progress(50)
-    st.write("Current Status: Verification Complete. Awaiting Review.")
+    applications = load_application_store()
+    if "application_id" not in st.session_state:
+        # Returning applicants look up their most recent application
+        lookup_name = st.text_input("Full Name", key="tracker_name")
+        lookup_dob = st.date_input("Date of Birth", key="tracker_dob")
+        if st.button("Find My Application"):
+            found = applications.find(lookup_name, lookup_dob)
+            if found:
+                st.session_state.application_id = found[0]["application_id"]
+            else:
+                st.warning("No application found for that name and date of birth.")
+
+    current = applications.status(st.session_state.get("application_id"))
+    if current is not None:
+        progress = st.progress(current["progress"])
+        st.write(f"Current Status: {current['message']}")
+        st.caption(f"Application ID: {current['application_id']}")
 
 # Help Section
 elif menu == "Help":
@@ -82,3 +135,5 @@ elif menu == "Help":
 
 # Footer
 st.sidebar.write("© 2025 Medicaid Enrollment Assistant. All rights reserved.")
+
+render.finish()
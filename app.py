@@ -1,24 +1,34 @@
 import streamlit as st
 from datetime import datetime
-import google.generativeai as genai
-import random
+import metrics
+import feed
+import member_search
+import case_notes
 
 # Set page title
 st.set_page_config(page_title="Supportive Community App", layout="wide")
-
-# Initialize Google Generative AI API (Replace 'your_api_key_here' with an actual API key)
-genai.configure(api_key="your_api_key_here")
-
-# Synthetic data generator for patient stories
-def generate_synthetic_story():
-    emotions = ["hopeful", "anxious", "grateful", "struggling"]
-    events = [
-        "attended a support group", 
-        "shared their story for the first time", 
-        "received positive feedback from followers",
-        "reached a milestone in their recovery"
-    ]
-    return f"Today, I am feeling {random.choice(emotions)}. I {random.choice(events)} and it has made a difference in my journey."
+metrics.start_exporter()
+
+# Community feed shared by all sessions. There is no sign-in yet, so every
+# session acts as the demo member of the seeded community.
+@metrics.cached(st.cache_resource)
+def load_feed():
+    store = feed.FeedStore()
+    member_id = feed.demo_community(store)
+    metrics.register_collector("hot_timeline", metrics.hit_miss_collector("hot_timeline", store.cache))
+    return store, member_id
+
+# Find Friends index over every public member, built once per server and
+# topped up with members who joined since
+@metrics.cached(st.cache_resource)
+def load_member_index():
+    feed_store, _ = load_feed()
+    return member_search.MemberIndex.from_store(feed_store)
+
+# Case notes log, shared with the SUD dashboard's case reports
+@metrics.cached(st.cache_resource)
+def load_case_notes():
+    return case_notes.CaseNotes()
 
 # Header
 st.title("Welcome to Your Safe Space")
@@ -27,15 +37,26 @@ st.write("Express yourself, connect with others, and share your journey in a sup
 
 # Navigation
 menu = st.sidebar.selectbox("Menu", ["Home", "Audio Sharing", "Community", "Profile", "Support Groups", "Case Management"])
+# Time this rerun; finished after the footer
+render = metrics.page_render("app", menu, st.session_state)
 
 if menu == "Home":
     st.header("Discover, Reflect, and Connect")
     st.write("Explore shared stories, daily check-ins, and more.")
     
-    # Suggested posts
+    # Newest posts from people you follow, one page at a time
     st.subheader("Community Highlights")
-    for _ in range(3):
-        st.write(f"- {generate_synthetic_story()}")
+    feed_store, member_id = load_feed()
+    cursor = st.session_state.get("feed_cursor")
+    posts, next_cursor = feed_store.timeline(member_id, cursor, limit=5)
+    for post in posts:
+        st.write(f"- **{post['author']}**: {post['text']}")
+    if next_cursor is not None and st.button("Show older stories"):
+        st.session_state.feed_cursor = next_cursor
+        st.rerun()
+    if cursor is not None and st.button("Back to newest"):
+        del st.session_state.feed_cursor
+        st.rerun()
 
 elif menu == "Audio Sharing":
     st.header("Audio Sharing")
@@ -58,28 +79,35 @@ elif menu == "Audio Sharing":
     # Share or Save Option
     share_option = st.radio("What would you like to do with this recording?", ["Keep Private", "Share with Community"])
     if share_option == "Share with Community":
-        st.text_area("Add a description or context to your audio log:")
-        st.button("Post Audio")
-        st.success("Your audio has been shared!")
+        description = st.text_area("Add a description or context to your audio log:")
+        if st.button("Post Audio"):
+            feed_store, member_id = load_feed()
+            feed_store.post(member_id, description.strip() or "Shared a new audio log.")
+            st.success("Your audio has been shared!")
 
 elif menu == "Community":
     st.header("Community")
     st.image("SafeSpace.PNG", use_container_width=True)
     st.write("Follow others, join discussions, and build your network.")
     
+    feed_store, member_id = load_feed()
     st.subheader("Your Network")
-    st.write("**Following**: 20 | **Followers**: 15")
+    network = feed_store.network(member_id)
+    st.write(f"**Following**: {network['following']} | **Followers**: {network['followers']}")
 
     st.subheader("Trending Stories")
-    for _ in range(3):
-        st.write(f"- {generate_synthetic_story()}")
+    for post in feed_store.trending(3):
+        st.write(f"- **{post['author']}**: {post['text']}")
     
     st.subheader("Find Friends")
     search = st.text_input("Search for community members:")
     if search:
+        members = load_member_index().sync(feed_store).search(search)
         st.write(f"Results for {search}:")
-        st.write("- [Alex Smith](#)")
-        st.write("- [Chris Doe](#)")
+        for member in members:
+            st.write(f"- [{member['name']}](#)")
+        if not members:
+            st.write("No members found.")
 
 elif menu == "Profile":
     st.header("Your Profile")
@@ -87,10 +115,19 @@ elif menu == "Profile":
     st.write("Customize your experience and control your privacy.")
 
     # Profile Details
-    name = st.text_input("Name", "Your Name")
+    feed_store, member_id = load_feed()
+    profile = feed_store.user(member_id)
+    name = st.text_input("Name", profile["name"])
     bio = st.text_area("Bio", "Share a bit about yourself.")
-    st.checkbox("Make my profile private")
-    st.button("Save Changes")
+    private = st.checkbox("Make my profile private", value=bool(profile["private"]))
+    if st.button("Save Changes"):
+        if not name.strip():
+            st.error("Please enter a name.")
+        else:
+            feed_store.update_profile(member_id, name.strip(), private)
+            # Private members drop out of Find Friends right away
+            load_member_index().add(member_id, name.strip(), private)
+            st.success("Your profile has been updated.")
 
 elif menu == "Support Groups":
     st.header("Join Support Groups")
@@ -107,21 +144,54 @@ elif menu == "Case Management":
     st.image("SafeSpace.PNG", use_container_width=True)
     st.write("Manage and monitor patient cases efficiently.")
 
-    # Example Case List
+    notes_log = load_case_notes()
+
+    # Case list, from the latest note for each patient; filled in below so a
+    # note saved on this rerun is already counted
     st.subheader("Current Cases")
-    st.table({
-        "Patient ID": ["P001", "P002", "P003"],
-        "Status": ["In Progress", "Completed", "Pending"],
-        "Last Update": ["2024-12-01", "2024-11-15", "2024-12-03"]
-    })
+    case_list = st.container()
 
     # Add Notes Section
     st.subheader("Add Case Notes")
-    patient_id = st.selectbox("Select Patient ID", ["P001", "P002", "P003"])
+    patient_id = st.text_input("Patient ID", placeholder="E.g., P001")
+    status = st.selectbox("Case Status", ["In Progress", "Completed", "Pending"])
     notes = st.text_area("Enter case notes here:")
     if st.button("Save Notes"):
-        st.success("Notes saved successfully for patient {}!".format(patient_id))
+        if not patient_id.strip() or not notes.strip():
+            st.error("Please enter a patient ID and notes.")
+        else:
+            notes_log.append(patient_id.strip(), notes.strip(), status=status)
+            st.success("Notes saved successfully for patient {}!".format(patient_id.strip()))
+
+    with case_list:
+        cases = sorted(notes_log.summary(), key=lambda case: case["patient_id"])
+        if cases:
+            st.dataframe({
+                "Patient ID": [case["patient_id"] for case in cases],
+                "Status": [case["status"] or "Pending" for case in cases],
+                "Notes": [case["notes"] for case in cases],
+                "Last Update": [datetime.fromtimestamp(case["updated_at"]).strftime("%Y-%m-%d") for case in cases],
+            }, hide_index=True)
+        else:
+            st.info("No case notes yet.")
+
+    if patient_id.strip():
+        st.subheader(f"Notes for {patient_id.strip()}")
+        for note in reversed(notes_log.history(patient_id.strip(), limit=10)):
+            st.write(f"- {datetime.fromtimestamp(note['created_at']):%Y-%m-%d %H:%M} ({note['author']}): {note['text']}")
+
+    # Full-text search across every patient's notes
+    st.subheader("Search Case Notes")
+    query = st.text_input("Find notes containing:")
+    if query:
+        hits = notes_log.search(query)
+        for note in hits:
+            st.write(f"- **{note['patient_id']}** {datetime.fromtimestamp(note['created_at']):%Y-%m-%d}: {note['text']}")
+        if not hits:
+            st.write("No matching notes.")
 
 # Footer
 st.write("---")
 st.write("Powered by Streamlit and Google Generative AI")
+
+render.finish()
@@ -0,0 +1,306 @@
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import warnings
+
+import metrics
+
+APPLICATIONS_DB = os.getenv("THRIVE_APPLICATIONS_DB", "applications.db")
+
+# At most this many writes per transaction. Writes queued while a commit is
+# running go into the next one, so bursts share commits instead of waiting in line
+BATCH_SIZE = 256
+# Seconds a caller waits for its write to be committed
+WRITE_TIMEOUT = float(os.getenv("THRIVE_APPLICATION_WRITE_TIMEOUT", 30))
+
+# status -> (tracker progress, tracker message)
+STATUSES = {
+    "submitted": (25, "Application Submitted. Awaiting Review."),
+    "documents_verified": (50, "Verification Complete. Awaiting Review."),
+    "in_review": (70, "Application Under Review."),
+    "more_information_needed": (70, "More Information Needed. A caseworker will contact you."),
+    "approved": (100, "Application Approved."),
+    "denied": (100, "Decision Made. A letter with details has been sent."),
+}
+
+
+def applicant_key(name, dob):
+    """Lookup key for an applicant: whitespace/case-normalized name plus date of birth."""
+    return f"{' '.join(str(name).split()).casefold()}|{dob}"
+
+
+class _Pending:
+    def __init__(self, apply):
+        self.apply = apply
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=WRITE_TIMEOUT):
+        if not self.done.wait(timeout):
+            raise TimeoutError("application store write not committed in time")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class ApplicationStore:
+    """Enrollment applications and their status history in SQLite (WAL mode).
+
+    All writes go through one writer thread that commits them in batches.
+    Reads use a connection per thread and never wait for the writer.
+    """
+
+    def __init__(self, path=APPLICATIONS_DB, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._writer_lock = threading.Lock()
+        self._closed = False
+
+        conn = self._connect()
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS applications ("
+            " application_id TEXT PRIMARY KEY,"
+            " applicant_key TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " details TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " submitted_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS applications_applicant ON applications (applicant_key, submitted_at);"
+            "CREATE INDEX IF NOT EXISTS applications_status ON applications (status, updated_at);"
+            "CREATE TABLE IF NOT EXISTS status_history ("
+            " application_id TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " note TEXT,"
+            " changed_by TEXT,"
+            " changed_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS status_history_application ON status_history (application_id, changed_at);"
+        )
+        conn.close()
+
+        self._writer = None
+        self._start_writer()
+
+    def _start_writer(self):
+        # Also restarts a writer that died, so queued writes are not stranded
+        with self._writer_lock:
+            if not self._closed and (self._writer is None or not self._writer.is_alive()):
+                self._writer = threading.Thread(target=self._write_loop, daemon=True, name="thrive-application-writer")
+                self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only syncs at checkpoints; a crash can lose the last
+        # commits but never corrupts the database
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # Writes
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            writes = [p for p in batch if p is not None]
+            try:
+                self._commit(conn, writes)
+            except Exception as e:
+                # Fail this batch rather than the thread, so later writes still commit
+                warnings.warn(f"application store commit failed: {e!r}")
+                for pending in writes:
+                    if not pending.done.is_set():
+                        pending.error = e
+                        pending.done.set()
+            if stop:
+                conn.close()
+                return
+
+    def _commit(self, conn, batch):
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            with conn:
+                for pending in batch:
+                    pending.result = pending.apply(conn)
+        except Exception:
+            # Retry one by one so a single bad write does not fail the whole
+            # batch; its error, whatever the type, goes back to its caller
+            for pending in batch:
+                try:
+                    with conn:
+                        pending.result = pending.apply(conn)
+                except Exception as e:
+                    pending.error = e
+        finally:
+            for pending in batch:
+                pending.done.set()
+        metrics.observe("thrive_application_commit_seconds", time.perf_counter() - start)
+        metrics.inc("thrive_application_commits_total")
+        metrics.inc("thrive_application_writes_total", len(batch))
+
+    def _enqueue(self, apply):
+        pending = _Pending(apply)
+        self._queue.put(pending)
+        self._start_writer()
+        return pending
+
+    def submit(self, name, dob, details=None, wait=True):
+        """Record a new application and return its ID.
+
+        With wait=False the ID is returned before the write is committed,
+        which is enough for callers that only show it back to the applicant.
+        """
+        application_id = f"APP-{uuid.uuid4().hex[:10].upper()}"
+        key = applicant_key(name, dob)
+        payload = json.dumps(dict(details or {}, name=name, dob=str(dob)), default=str)
+
+        def apply(conn):
+            now = time.time()
+            conn.execute(
+                "INSERT INTO applications (application_id, applicant_key, name, details, status, submitted_at, updated_at)"
+                " VALUES (?, ?, ?, ?, 'submitted', ?, ?)",
+                (application_id, key, name, payload, now, now),
+            )
+            conn.execute(
+                "INSERT INTO status_history (application_id, status, note, changed_by, changed_at)"
+                " VALUES (?, 'submitted', NULL, 'applicant', ?)",
+                (application_id, now),
+            )
+
+        pending = self._enqueue(apply)
+        if wait:
+            pending.wait()
+        return application_id
+
+    def update_status(self, application_ids, status, note=None, changed_by="caseworker"):
+        """Move many applications to `status` in one transaction; returns how many changed.
+
+        Applications already in `status` are left alone and get no history entry.
+        """
+        if status not in STATUSES:
+            raise ValueError(f"Unknown application status: {status}")
+        ids = list(application_ids)
+
+        def apply(conn):
+            now = time.time()
+            updated = 0
+            for application_id in ids:
+                changed = conn.execute(
+                    "UPDATE applications SET status = ?, updated_at = ? WHERE application_id = ? AND status != ?",
+                    (status, now, application_id, status),
+                ).rowcount
+                if changed:
+                    conn.execute(
+                        "INSERT INTO status_history (application_id, status, note, changed_by, changed_at) VALUES (?, ?, ?, ?, ?)",
+                        (application_id, status, note, changed_by, now),
+                    )
+                    updated += 1
+            return updated
+
+        return self._enqueue(apply).wait()
+
+    def flush(self):
+        """Wait until every write queued so far is committed."""
+        self._enqueue(lambda conn: None).wait()
+
+    def close(self):
+        with self._writer_lock:
+            self._closed = True
+        self._queue.put(None)
+        if self._writer.is_alive():
+            self._writer.join()
+
+    # Reads
+
+    def status(self, application_id):
+        """Current status with tracker progress and message, or None for an unknown ID."""
+        row = self._reader().execute(
+            "SELECT status, updated_at FROM applications WHERE application_id = ?", (application_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        progress, message = STATUSES[row[0]]
+        return {"application_id": application_id, "status": row[0], "progress": progress,
+                "message": message, "updated_at": row[1]}
+
+    def history(self, application_id):
+        rows = self._reader().execute(
+            "SELECT status, note, changed_by, changed_at FROM status_history WHERE application_id = ? ORDER BY changed_at",
+            (application_id,),
+        ).fetchall()
+        return [dict(zip(("status", "note", "changed_by", "changed_at"), row)) for row in rows]
+
+    def find(self, name, dob):
+        """Applications of one applicant, newest first."""
+        rows = self._reader().execute(
+            "SELECT application_id, status, submitted_at FROM applications WHERE applicant_key = ? ORDER BY submitted_at DESC",
+            (applicant_key(name, dob),),
+        ).fetchall()
+        return [dict(zip(("application_id", "status", "submitted_at"), row)) for row in rows]
+
+    def counts(self):
+        return dict(self._reader().execute("SELECT status, COUNT(*) FROM applications GROUP BY status").fetchall())
+
+    def page(self, status, page, page_size=50):
+        """Applications in `status`, oldest update first (a caseworker queue); `page` starts at 0."""
+        rows = self._reader().execute(
+            "SELECT application_id, name, submitted_at, updated_at FROM applications WHERE status = ?"
+            " ORDER BY updated_at LIMIT ? OFFSET ?",
+            (status, page_size, page * page_size),
+        ).fetchall()
+        return [dict(zip(("application_id", "name", "submitted_at", "updated_at"), row)) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Caseworker tools for the enrollment application store.")
+    parser.add_argument("--db", default=APPLICATIONS_DB)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("counts", help="applications per status")
+    queue_cmd = commands.add_parser("queue", help="list applications in a status")
+    queue_cmd.add_argument("status", choices=list(STATUSES))
+    queue_cmd.add_argument("--page", type=int, default=0)
+    set_cmd = commands.add_parser("set-status", help="move applications to a new status")
+    set_cmd.add_argument("status", choices=list(STATUSES))
+    set_cmd.add_argument("application_ids", nargs="*", help="IDs to update; read from stdin if omitted")
+    set_cmd.add_argument("--note")
+    set_cmd.add_argument("--by", default="caseworker")
+    args = parser.parse_args()
+
+    store = ApplicationStore(args.db)
+    if args.command == "counts":
+        for status, count in sorted(store.counts().items()):
+            print(f"{status}: {count}")
+    elif args.command == "queue":
+        for entry in store.page(args.status, args.page):
+            print(f"{entry['application_id']}  {entry['name']}  updated {time.ctime(entry['updated_at'])}")
+    else:
+        ids = args.application_ids or [line.strip() for line in sys.stdin if line.strip()]
+        print(f"Updated {store.update_status(ids, args.status, note=args.note, changed_by=args.by)} applications")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import threading
+import wave
+
+import av
+from streamlit_webrtc import AudioProcessorBase
+
+# Format advertised in the saved WAV files
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # 16-bit audio
+CHANNELS = 1
+
+
+class AudioProcessor(AudioProcessorBase):
+    """WebRTC audio processor that streams 16 kHz mono PCM straight into a WAV file on disk.
+
+    Incoming frames are resampled and downmixed as they arrive and written out
+    immediately, so memory use stays constant however long the session runs.
+    """
+
+    def __init__(self, spool_dir=None):
+        self.spool_dir = spool_dir
+        self.samples_written = 0
+        self._lock = threading.Lock()
+        self._resampler = None
+        self._wav = None
+        self._path = None
+
+    def _open(self):
+        fd, self._path = tempfile.mkstemp(suffix=".wav", dir=self.spool_dir)
+        os.close(fd)
+        self._wav = wave.open(self._path, "wb")
+        self._wav.setnchannels(CHANNELS)
+        self._wav.setsampwidth(SAMPLE_WIDTH)
+        self._wav.setframerate(SAMPLE_RATE)
+        self._resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+        self.samples_written = 0
+
+    def _write(self, frames):
+        # AudioResampler returns a list of frames (or a single frame on older av releases)
+        if frames is None:
+            return
+        if not isinstance(frames, list):
+            frames = [frames]
+        for out in frames:
+            pcm = out.to_ndarray()
+            self._wav.writeframesraw(pcm.tobytes())
+            self.samples_written += pcm.shape[-1]
+
+    def recv(self, frame):
+        with self._lock:
+            if self._wav is None:
+                self._open()
+            self._write(self._resampler.resample(frame))
+        return frame
+
+    # Name used by earlier versions of this class
+    recv_audio = recv
+
+    @property
+    def recording(self):
+        return self._wav is not None
+
+    @property
+    def duration(self):
+        """Seconds of audio captured in the current take."""
+        return self.samples_written / SAMPLE_RATE
+
+    def finish(self):
+        """Close the current take and return its WAV path; the next frame starts a new take."""
+        with self._lock:
+            if self._wav is None:
+                self._open()
+            self._write(self._resampler.resample(None))
+            self._wav.close()
+            path = self._path
+            self._wav = self._resampler = self._path = None
+            return path
+
+    def save_audio(self, filename):
+        shutil.move(self.finish(), filename)
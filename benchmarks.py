@@ -0,0 +1,342 @@
+"""Benchmarks for the SUD analysis hot paths on a generated cohort.
+
+    python benchmarks.py --patients 10000 --minutes 1440
+    python benchmarks.py --patients 100000 --minutes 60 --skip legacy_merge --compare
+
+Each run appends one JSON record (commit, parameters, and per-benchmark best
+wall time and peak traced memory) to --out, so results can be compared
+across commits; --compare prints the ratio against the previous record with
+the same parameters.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import sud_data
+import synthetic_cohort
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+class Context:
+    """Generated input files plus state shared between benchmarks."""
+
+    def __init__(self, data_dir, audio_seconds):
+        self.data_dir = data_dir
+        self.sud_path = os.path.join(data_dir, sud_data.SUD_CSV)
+        self.har_path = os.path.join(data_dir, sud_data.HAR_CSV)
+        self.audio_seconds = audio_seconds
+
+    def fresh_cache(self):
+        sud_data.CACHE_DIR = tempfile.mkdtemp(dir=self.data_dir)
+
+    def load(self):
+        return sud_data.load_sud(self.sud_path), sud_data.load_har(self.har_path)
+
+    def patients(self):
+        from har_store import HarStore
+
+        sud, har = self.load()
+        return pd.merge(sud, HarStore(har).patient_features(), on="Patient_ID", how="inner")
+
+
+@benchmark("load_cold")
+def bench_load_cold(ctx):
+    # CSV parse with the explicit schema plus writing the column cache
+    ctx.fresh_cache()
+    return ctx.load()
+
+
+@benchmark("load_warm")
+def bench_load_warm(ctx):
+    return ctx.load()
+
+
+@benchmark("load_and_preprocess_data")
+def bench_preprocess(ctx):
+    # The per-patient rows thriveapp's pages use, from a warm cache
+    return ctx.patients()
+
+
+@benchmark("legacy_merge")
+def bench_legacy_merge(ctx):
+    # The old one-row-per-minute merge of demographics onto HAR rows
+    sud, har = ctx.load()
+    return pd.merge(sud, har, on="Patient_ID", how="inner")
+
+
+@benchmark("har_features")
+def bench_har_features(ctx):
+    from har_store import HarStore
+
+    store = HarStore(ctx.load()[1])
+    return store.patient_features(), store.window_features("1h")
+
+
+@benchmark("har_stream")
+def bench_har_stream(ctx):
+    # The early-warning monitor fed one minute of every wearable at a time
+    from har_store import HarStore
+    from har_stream import HarMonitor, replay
+
+    _, har = ctx.load()
+    replay(HarStore(har), HarMonitor())
+
+
+@benchmark("ingest_append")
+def bench_ingest_append(ctx):
+    # One new minute from every wearable appended to the HAR CSV, then one
+    # refresh: parse, validate and store only those rows and update the
+    # per-patient table. Runs against copies, as the appends accumulate
+    import shutil
+    import ingest
+
+    if not hasattr(ctx, "dataset"):
+        copies = tempfile.mkdtemp(dir=ctx.data_dir)
+        for path in (ctx.sud_path, ctx.har_path):
+            shutil.copy(path, copies)
+        ctx.dataset = ingest.Dataset(os.path.join(copies, sud_data.SUD_CSV), os.path.join(copies, sud_data.HAR_CSV),
+                                     state_dir=os.path.join(copies, "ingest"))
+        ctx.ingest_minute = int(ctx.dataset.har.timestamps.max().astype("datetime64[m]").astype(np.int64)
+                                - np.datetime64(synthetic_cohort.HAR_START, "m").astype(np.int64)) + 1
+    patients = len(ctx.dataset.sud)
+    rng = np.random.default_rng(ctx.ingest_minute)
+    minute = synthetic_cohort.har_chunk(rng, 0, patients, 1, synthetic_cohort.timestamp_strings(ctx.ingest_minute + 1)[-1:])
+    minute.to_csv(ctx.dataset.sources["har"].path, mode="a", header=False, index=False)
+    ctx.ingest_minute += 1
+    return ctx.dataset.refresh()
+
+
+@benchmark("dashboard_aggregations")
+def bench_aggregations(ctx):
+    import aggregates
+    from har_store import HarStore
+
+    sud, har = ctx.load()
+    patients = ctx.patients()
+    dims = {name: sud_data.SUD_SCHEMA[name] + [sud_data.MISSING_CATEGORY]
+            for name in ["Relapse_Risk", "Gender", "Substance_Type", "Treatment_Type", "Support_System"]}
+    patient_cube = aggregates.AggregateCube.from_frame(patients, dims, patients.select_dtypes("number").columns)
+    sensor_dims = dict(dims, Activity=sud_data.HAR_SCHEMA["Activity"] + [sud_data.MISSING_CATEGORY])
+    sensor_cube = aggregates.build_sensor_cube(HarStore(har), sud, sensor_dims, ["Heart_Rate", "X_accel", "Y_accel", "Z_accel"])
+    return (patient_cube.value_counts("Relapse_Risk"), patient_cube.describe(),
+            sensor_cube.rollup(["Relapse_Risk"], ["Heart_Rate", "X_accel", "Y_accel", "Z_accel"]))
+
+
+@benchmark("filtering")
+def bench_filtering(ctx):
+    from patient_table import IndexedTable
+
+    table = IndexedTable(ctx.patients(), ["Relapse_Risk", "Gender", "Substance_Type", "Treatment_Type"])
+    return [table.query({"Relapse_Risk": "High", "Gender": ["Male", "Female"]}, sort_by="Age", page=p)
+            for p in range(10)]
+
+
+@benchmark("model_scoring")
+def bench_scoring(ctx):
+    from risk_scoring import RiskScorer
+
+    sud, _ = ctx.load()
+    return RiskScorer.load().score(sud)
+
+
+def retrain_dataset(ctx):
+    # One dataset and model directory shared by the retraining benchmarks
+    import ingest
+
+    if not hasattr(ctx, "retrain_dataset"):
+        ctx.retrain_dataset = ingest.Dataset(ctx.sud_path, ctx.har_path,
+                                             state_dir=os.path.join(tempfile.mkdtemp(dir=ctx.data_dir), "ingest"))
+        ctx.model_dir = os.path.join(ctx.data_dir, "models")
+    return ctx.retrain_dataset
+
+
+@benchmark("retrain_search")
+def bench_retrain_search(ctx):
+    # Cross-validated search over C with the fits spread over every core
+    import retrain
+
+    return retrain.retrain(retrain_dataset(ctx), "search", ctx.model_dir)
+
+
+@benchmark("retrain_warm")
+def bench_retrain_warm(ctx):
+    # Daily refresh: refit from the promoted model's coefficients
+    import retrain
+    from risk_scoring import current_version
+
+    dataset = retrain_dataset(ctx)
+    if current_version(ctx.model_dir) is None:
+        retrain.retrain(dataset, "search", ctx.model_dir)
+    return retrain.retrain(dataset, "warm", ctx.model_dir)
+
+
+@benchmark("save_audio")
+def bench_save_audio(ctx):
+    import av
+    from audio_recorder import AudioProcessor
+
+    # 20 ms stereo frames at 48 kHz, as delivered by WebRTC
+    samples = (np.sin(np.arange(960) / 8.0) * 8000).astype(np.int16)
+    interleaved = np.repeat(samples, 2)[None, :]
+    processor = AudioProcessor(spool_dir=ctx.data_dir)
+    for i in range(int(ctx.audio_seconds * 50)):
+        frame = av.AudioFrame.from_ndarray(interleaved, format="s16", layout="stereo")
+        frame.sample_rate = 48000
+        frame.pts = i * 960
+        processor.recv(frame)
+    target = os.path.join(ctx.data_dir, "bench.wav")
+    processor.save_audio(target)
+    os.remove(target)
+
+
+@benchmark("application_store")
+def bench_application_store(ctx):
+    # An open-enrollment burst: 16 sessions submitting at once, then tracker reads
+    import threading
+    from application_store import ApplicationStore
+
+    store = ApplicationStore(os.path.join(tempfile.mkdtemp(dir=ctx.data_dir), "applications.db"))
+    ids = []
+
+    def session(n):
+        ids.extend(store.submit(f"Applicant {n}-{i}", "1990-01-01", {"income": i}) for i in range(250))
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for application_id in ids:
+        store.status(application_id)
+    store.update_status(ids[::2], "in_review")
+    store.close()
+
+
+@benchmark("case_notes")
+def bench_case_notes(ctx):
+    # 16 caseworkers saving notes at once, then history and search reads
+    import threading
+    from case_notes import CaseNotes
+
+    notes = CaseNotes(os.path.join(tempfile.mkdtemp(dir=ctx.data_dir), "case_notes.log"))
+    words = ["missed", "appointment", "relapse", "housing", "stable", "medication", "craving", "therapy"]
+
+    def session(n):
+        for i in range(250):
+            notes.append(f"P{n:02d}{i % 25:03d}", f"{words[i % 8]} {words[(i * 3 + n) % 8]} visit {i}")
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for n in range(16):
+        notes.history(f"P{n:02d}000")
+    for word in words:
+        notes.search(f"{word} visit")
+    notes.close()
+
+
+def measure(fn, ctx, repeat):
+    """Best wall time over `repeat` runs, then one extra run under tracemalloc for peak memory."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn(ctx)
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    fn(ctx)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(min(times), 4), "peak_mb": round(peak / 2 ** 20, 2)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def previous_record(path, params):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    matching = [r for r in records if r.get("params") == params]
+    return matching[-1] if matching else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=10_000)
+    parser.add_argument("--minutes", type=int, default=60, help="HAR minutes per patient")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--audio-seconds", type=int, default=600)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--skip", nargs="*", default=[], choices=list(BENCHMARKS))
+    parser.add_argument("--out", default="bench_results.jsonl")
+    parser.add_argument("--compare", action="store_true", help="compare with the previous run with the same parameters")
+    args = parser.parse_args()
+
+    # Model artifacts are resolved relative to the repo root
+    os.chdir(ROOT)
+    params = {"patients": args.patients, "minutes": args.minutes, "seed": args.seed,
+              "audio_seconds": args.audio_seconds}
+    baseline = previous_record(args.out, params) if args.compare else None
+
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        print(f"Generating {args.patients} patients x {args.minutes} minutes ...", flush=True)
+        synthetic_cohort.generate(data_dir, args.patients, args.minutes, seed=args.seed)
+        ctx = Context(data_dir, args.audio_seconds)
+        ctx.fresh_cache()
+        for name, fn in BENCHMARKS.items():
+            if (args.only and name not in args.only) or name in args.skip:
+                continue
+            try:
+                results[name] = measure(fn, ctx, args.repeat)
+            except ImportError as e:
+                results[name] = {"skipped": str(e)}
+            line = f"{name:28s} " + (f"{results[name]['seconds']:9.4f} s  {results[name]['peak_mb']:9.2f} MB"
+                                     if "seconds" in results[name] else f"skipped ({results[name]['skipped']})")
+            if baseline and "seconds" in results[name] and "seconds" in baseline["results"].get(name, {}):
+                line += f"  x{results[name]['seconds'] / max(baseline['results'][name]['seconds'], 1e-9):.2f} vs {baseline['commit'][:8]}"
+            print(line, flush=True)
+
+    record = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    with open(args.out, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""Append-only case-notes log with per-patient history and full-text search.
+
+Notes are JSON lines in one log file and are never rewritten. A note's ID is
+its byte offset in the log. In memory, each patient maps to the offsets of
+their notes and each word maps to the offsets of the notes containing it,
+so history and search read only the notes they return. Both indexes are
+built by one pass over the log at startup and then extended with whatever
+has been appended since, including notes written by other processes.
+
+    python case_notes.py history P001
+    python case_notes.py search "missed appointment"
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import threading
+import time
+import warnings
+from array import array
+from bisect import bisect_left
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # no cross-process lock; one worker per host
+    fcntl = None
+
+CASE_NOTES_LOG = os.getenv("THRIVE_CASE_NOTES", "case_notes.log")
+
+# At most this many notes per write and fsync; notes queued while one is
+# running go into the next, as in the application store
+BATCH_SIZE = 256
+READ_BYTES = 4096
+# Bytes read at a time when indexing the log
+SCAN_BYTES = 1 << 20
+# Seconds a caller waits for its note to be written
+WRITE_TIMEOUT = float(os.getenv("THRIVE_CASE_NOTES_WRITE_TIMEOUT", 30))
+
+WORD = re.compile(r"\w\w+")
+
+
+def tokenize(text):
+    return WORD.findall(text.casefold())
+
+
+def _parse(line):
+    # None for a line that is not a case note: one torn by a crash mid-append,
+    # or written by something else
+    try:
+        note = json.loads(line)
+    except ValueError:
+        return None
+    if (not isinstance(note, dict) or not isinstance(note.get("patient_id"), str)
+            or not isinstance(note.get("text"), str) or not isinstance(note.get("created_at"), (int, float))):
+        return None
+    return note
+
+
+class _Pending:
+    def __init__(self, record):
+        self.record = record
+        self.note_id = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=WRITE_TIMEOUT):
+        if not self.done.wait(timeout):
+            raise TimeoutError("case note not written in time")
+        if isinstance(self.note_id, Exception):
+            raise self.note_id
+        return self.note_id
+
+
+class CaseNotes:
+    """Case notes keyed by patient ID, in an append-only log file.
+
+    Writes go through one writer thread that appends and fsyncs them in
+    batches. Reads never wait for the writer.
+    """
+
+    def __init__(self, path=CASE_NOTES_LOG, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._patients = {}     # patient ID -> note offsets, oldest first
+        self._postings = {}     # word -> note offsets, oldest first
+        self._summary = {}      # patient ID -> latest status and note time
+        self._end = 0           # offset just past the last indexed line
+
+        self._fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o600)
+        self._catch_up()
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name="thrive-case-notes-writer")
+        self._writer.start()
+
+    # Indexing
+
+    def _catch_up(self):
+        # Index complete lines appended since the last call, by any process
+        with self._lock:
+            size = os.fstat(self._fd).st_size
+            while self._end < size:
+                chunk = os.pread(self._fd, min(size - self._end, SCAN_BYTES), self._end)
+                last = chunk.rfind(b"\n")
+                if last < 0:
+                    # A partial last line is left for the next call; a complete
+                    # line longer than a chunk is no note and is skipped
+                    end = self._next_line(self._end + len(chunk), size)
+                    if end is None:
+                        break
+                    self._skip(self._end)
+                    self._end = end
+                    continue
+                offset = self._end
+                for line in chunk[:last + 1].splitlines(keepends=True):
+                    note = _parse(line)
+                    if note is None:
+                        self._skip(offset)
+                    else:
+                        self._index(offset, note)
+                    offset += len(line)
+                self._end = offset
+
+    def _next_line(self, offset, size):
+        # Offset just past the next newline at or after `offset`, or None
+        while offset < size:
+            chunk = os.pread(self._fd, min(size - offset, SCAN_BYTES), offset)
+            newline = chunk.find(b"\n")
+            if newline >= 0:
+                return offset + newline + 1
+            offset += len(chunk)
+        return None
+
+    def _skip(self, offset):
+        warnings.warn(f"{self.path}: skipped the line at offset {offset}, which is not a case note")
+        metrics.inc("thrive_case_notes_skipped_total")
+
+    def _index(self, offset, note):
+        patient_id = note["patient_id"]
+        self._patients.setdefault(patient_id, array("q")).append(offset)
+        for word in set(tokenize(note["text"])):
+            self._postings.setdefault(word, array("q")).append(offset)
+        summary = self._summary.setdefault(patient_id, {"patient_id": patient_id, "status": None, "notes": 0})
+        summary["notes"] += 1
+        summary["updated_at"] = note["created_at"]
+        if note.get("status"):
+            summary["status"] = note["status"]
+
+    # Writes
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            writes = [p for p in batch if p is not None]
+            try:
+                self._commit(writes)
+            except Exception as e:
+                # Fail this batch rather than the thread, so later notes are still written
+                warnings.warn(f"case notes commit failed: {e!r}")
+                for pending in writes:
+                    if not pending.done.is_set():
+                        pending.note_id = e
+                        pending.done.set()
+            if stop:
+                return
+
+    def _append(self, data):
+        # One append and one fsync for the whole batch; returns the offset the
+        # data starts at. With O_APPEND the write lands at the end even if
+        # another process appended meanwhile. Appends from every process hold
+        # an exclusive flock, so a log that does not end in a newline under the
+        # lock was torn by a crash: the partial line is ended rather than cut,
+        # so the next note does not run into it and nothing committed is lost
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            size = os.fstat(self._fd).st_size
+            torn = fcntl is not None and size and os.pread(self._fd, 1, size - 1) != b"\n"
+            os.write(self._fd, b"\n" + data if torn else data)
+            end = os.lseek(self._fd, 0, os.SEEK_CUR)
+            os.fsync(self._fd)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return end - len(data)
+
+    def _commit(self, batch):
+        if not batch:
+            return
+        start = time.perf_counter()
+        notes = [p for p in batch if p.record is not None]
+        lines = [(json.dumps(p.record, separators=(",", ":")) + "\n").encode() for p in notes]
+        # A failed append raises to the write loop, which fails the batch
+        offset = self._append(b"".join(lines)) if notes else None
+        for pending, line in zip(notes, lines):
+            pending.note_id = offset
+            offset += len(line)
+        try:
+            self._catch_up()
+        finally:
+            # The notes are on disk, so their callers get their IDs either way
+            for pending in batch:
+                pending.done.set()
+        metrics.observe("thrive_case_notes_commit_seconds", time.perf_counter() - start)
+        metrics.inc("thrive_case_notes_written_total", len(notes))
+
+    def append(self, patient_id, text, author="caseworker", status=None, wait=True):
+        """Append a note and return its ID; with wait=False, return before it is on disk."""
+        record = {"patient_id": str(patient_id), "text": text, "author": author, "created_at": time.time()}
+        if status:
+            record["status"] = status
+        pending = _Pending(record)
+        self._queue.put(pending)
+        return pending.wait() if wait else None
+
+    def flush(self):
+        """Wait until every note queued so far is on disk."""
+        # A pending write with no record is a marker; nothing is appended for it
+        pending = _Pending(None)
+        self._queue.put(pending)
+        pending.wait()
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        os.close(self._fd)
+
+    # Reads
+
+    def _read(self, offset):
+        data = b""
+        while True:
+            chunk = os.pread(self._fd, READ_BYTES, offset + len(data))
+            end = chunk.find(b"\n")
+            if end >= 0 or not chunk:
+                data += chunk[:end] if end >= 0 else chunk
+                break
+            data += chunk
+        return dict(json.loads(data), note_id=offset)
+
+    def history(self, patient_id, limit=None):
+        """A patient's notes, oldest first; the newest `limit` if given."""
+        self._catch_up()
+        offsets = self._patients.get(str(patient_id), ())
+        if limit is not None:
+            offsets = offsets[-limit:] if limit else ()
+        return [self._read(offset) for offset in offsets]
+
+    def prior_notes(self, patient_id, limit=20):
+        """The patient's newest notes as dated lines, for a case report prompt."""
+        return "\n    ".join(
+            f"{time.strftime('%Y-%m-%d', time.localtime(note['created_at']))} ({note['author']}): {note['text']}"
+            for note in self.history(patient_id, limit))
+
+    def search(self, query, patient_id=None, limit=20):
+        """Notes containing every word of `query`, newest first, optionally for one patient."""
+        words = set(tokenize(query))
+        if not words:
+            return []
+        with metrics.timed("thrive_case_notes_search"):
+            self._catch_up()
+            lists = [self._postings.get(word, ()) for word in words]
+            if patient_id is not None:
+                lists.append(self._patients.get(str(patient_id), ()))
+            lists.sort(key=len)
+            # Walk the shortest list newest first; the others are sorted, so
+            # membership is a bisect
+            offsets = []
+            for offset in reversed(lists[0]):
+                if all(_contains(other, offset) for other in lists[1:]):
+                    offsets.append(offset)
+                    if len(offsets) == limit:
+                        break
+            return [self._read(offset) for offset in offsets]
+
+    def summary(self):
+        """One row per patient: latest status, note count and last note time."""
+        self._catch_up()
+        with self._lock:
+            return [dict(row) for row in self._summary.values()]
+
+
+def _contains(offsets, offset):
+    i = bisect_left(offsets, offset)
+    return i < len(offsets) and offsets[i] == offset
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read the case-notes log.")
+    parser.add_argument("--log", default=CASE_NOTES_LOG)
+    commands = parser.add_subparsers(dest="command", required=True)
+    history_cmd = commands.add_parser("history", help="a patient's notes, oldest first")
+    history_cmd.add_argument("patient_id")
+    search_cmd = commands.add_parser("search", help="notes containing every word, newest first")
+    search_cmd.add_argument("query")
+    search_cmd.add_argument("--patient")
+    search_cmd.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    notes = CaseNotes(args.log)
+    if args.command == "history":
+        found = notes.history(args.patient_id)
+    else:
+        found = notes.search(args.query, patient_id=args.patient, limit=args.limit)
+    for note in found:
+        print(f"{time.ctime(note['created_at'])}  {note['patient_id']}  {note['author']}: {note['text']}")
+    notes.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import llm_client
+
+REPORTS_DB = os.getenv("THRIVE_REPORTS_DB", "case_reports.db")
+
+# Scheduler limits for bulk runs
+REQUESTS_PER_MINUTE = int(os.getenv("THRIVE_REPORTS_RPM", 60))
+IN_FLIGHT = int(os.getenv("THRIVE_REPORTS_IN_FLIGHT", 8))
+MIN_REQUESTS_PER_MINUTE = 5
+# Requests per minute added back after each success, up to the configured rate
+RECOVERY_REQUESTS_PER_MINUTE = 1
+# Attempts per report when the API reports a rate limit; the limiter paces them
+MAX_ATTEMPTS = 6
+
+
+def case_report_prompt(patient_id, notes):
+    return f"""
+    Generate a detailed case report for a Substance Use Disorder (SUD) patient.
+    Patient ID: {patient_id}.
+    Case notes:
+    {notes}
+    Include the following sections:
+    1. Patient Overview
+    2. Diagnosis
+    3. Treatment Plan
+    4. Medication Dosage and Instructions (if applicable)
+    5. Recommendations and Referrals
+    6. Follow-Up Plan
+    Format the report for professional documentation.
+    """
+
+
+def _known(row, name):
+    # Patients without HAR rows have NaN features after the left merge
+    value = row.get(name)
+    return value is not None and not (isinstance(value, float) and math.isnan(value))
+
+
+def patient_notes(row):
+    """Case notes for a bulk report, built from the patient's record and HAR features."""
+    fields = ["Age", "Gender", "Substance_Type", "Treatment_Type", "Support_System",
+              "Comorbidities", "Treatment_Outcome", "Relapse_Risk"]
+    lines = [f"{name.replace('_', ' ')}: {row[name]}" for name in fields if _known(row, name)]
+    if _known(row, "Heart_Rate_mean") and _known(row, "Heart_Rate_max"):
+        lines.append(f"Mean heart rate: {row['Heart_Rate_mean']:.0f} bpm (max {row['Heart_Rate_max']:.0f})")
+    if _known(row, "Relapse_Indicator_rate"):
+        lines.append(f"Share of sensor minutes flagged for relapse: {row['Relapse_Indicator_rate']:.0%}")
+    return "\n    ".join(lines)
+
+
+class ReportStore:
+    """SQLite-backed store of generated reports; also the checkpoint for bulk runs."""
+
+    def __init__(self, path=REPORTS_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            " patient_id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " report TEXT,"
+            " error TEXT,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reports_status ON reports (status, patient_id)")
+        self._conn.commit()
+
+    def _upsert(self, patient_id, status, report=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reports (patient_id, status, report, error, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (patient_id, status, report, error, time.time()),
+            )
+            self._conn.commit()
+
+    def save(self, patient_id, report):
+        self._upsert(patient_id, "done", report=report)
+
+    def fail(self, patient_id, error):
+        self._upsert(patient_id, "failed", error=str(error))
+
+    def completed(self):
+        with self._lock:
+            return {pid for (pid,) in self._conn.execute("SELECT patient_id FROM reports WHERE status = 'done'")}
+
+    def get(self, patient_id):
+        with self._lock:
+            row = self._conn.execute("SELECT report FROM reports WHERE patient_id = ? AND status = 'done'", (patient_id,)).fetchone()
+        return row[0] if row else None
+
+    def count(self, status="done"):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reports WHERE status = ?", (status,)).fetchone()[0]
+
+    def page(self, page, page_size=20, status="done"):
+        """Reports ordered by patient ID; `page` starts at 0."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT patient_id, report, error, updated_at FROM reports WHERE status = ? ORDER BY patient_id LIMIT ? OFFSET ?",
+                (status, page_size, page * page_size),
+            ).fetchall()
+        return [dict(zip(("patient_id", "report", "error", "updated_at"), row)) for row in rows]
+
+
+class RateLimiter:
+    """Async token bucket with additive increase, multiplicative decrease: the
+    rate is halved whenever the API reports a rate limit and creeps back up to
+    `requests_per_minute` with each success."""
+
+    def __init__(self, requests_per_minute):
+        self.max_rate = self.rate = requests_per_minute / 60.0
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+    def slow_down(self):
+        self.rate = max(MIN_REQUESTS_PER_MINUTE / 60.0, self.rate / 2)
+
+    def speed_up(self):
+        self.rate = min(self.max_rate, self.rate + RECOVERY_REQUESTS_PER_MINUTE / 60.0)
+
+
+async def generate_reports(patients, store, client=None, requests_per_minute=REQUESTS_PER_MINUTE,
+                           in_flight=IN_FLIGHT, progress=None):
+    """Generate reports for every patient row not already completed in `store`.
+
+    At most `in_flight` requests run at once, within the client's own limit,
+    and request starts are paced by a token bucket that slows down on every
+    rate-limit error and recovers as requests succeed; the client does not
+    retry on its own. Each finished
+    report is committed immediately, so an interrupted run resumes where it
+    stopped. Returns the number generated.
+    """
+    # The shared client by default: its response cache and concurrency limit
+    # are shared with the app's own calls
+    client = client or llm_client.get_client()
+    done = store.completed()
+    pending = iter([row for _, row in patients.iterrows() if row["Patient_ID"] not in done])
+    limiter = RateLimiter(requests_per_minute)
+    generated = 0
+
+    async def worker():
+        nonlocal generated
+        # Workers share one iterator, so in-flight requests never exceed the worker count
+        for row in pending:
+            patient_id = row["Patient_ID"]
+            prompt = case_report_prompt(patient_id, patient_notes(row))
+            for attempt in range(MAX_ATTEMPTS):
+                await limiter.acquire()
+                try:
+                    report = await client.agenerate(prompt, retries=0)
+                except Exception as e:
+                    if llm_client.is_retryable(e) and attempt + 1 < MAX_ATTEMPTS:
+                        limiter.slow_down()
+                        continue
+                    store.fail(patient_id, e)
+                else:
+                    limiter.speed_up()
+                    store.save(patient_id, report)
+                    generated += 1
+                break
+            if progress:
+                progress(patient_id)
+
+    await asyncio.gather(*(worker() for _ in range(in_flight)))
+    return generated
+
+
+def run(patients, store, **kwargs):
+    return asyncio.run(generate_reports(patients, store, **kwargs))
+
+
+def start_background(patients, store, **kwargs):
+    """Run a bulk job on a daemon thread; progress is read back from the store."""
+    thread = threading.Thread(target=run, args=(patients, store), kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    import pandas as pd
+    import sud_data
+    from har_store import HarStore
+
+    parser = argparse.ArgumentParser(description="Generate case reports for a patient cohort.")
+    parser.add_argument("--risk", default="High", help="Relapse_Risk level to report on, or 'all'")
+    parser.add_argument("--db", default=REPORTS_DB)
+    parser.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE)
+    parser.add_argument("--in-flight", type=int, default=IN_FLIGHT)
+    args = parser.parse_args()
+
+    llm_client.configure(os.getenv("GOOGLE_API_KEY"))
+    patients = pd.merge(sud_data.load_sud(), HarStore(sud_data.load_har()).patient_features(), on="Patient_ID", how="left")
+    if args.risk != "all":
+        patients = patients[patients["Relapse_Risk"] == args.risk]
+
+    store = ReportStore(args.db)
+    generated = run(patients, store, requests_per_minute=args.rpm, in_flight=args.in_flight,
+                    progress=lambda pid: print(f"{pid}: {store.count('done')}/{len(patients)} done", flush=True))
+    print(f"Generated {generated} reports; {store.count('failed')} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+# Content-addressed document store: every distinct file is kept once, under its SHA-256
+UPLOAD_DIR = os.getenv("THRIVE_UPLOAD_DIR", ".thrive_uploads")
+MAX_UPLOAD_BYTES = int(os.getenv("THRIVE_MAX_UPLOAD_MB", 25)) * 1024 * 1024
+CHUNK_BYTES = 1024 * 1024
+WORKERS = int(os.getenv("THRIVE_DOCUMENT_WORKERS", 2))
+
+THUMBNAIL_SIZE = (256, 256)
+MAX_IMAGE_PIXELS = 100_000_000
+
+# Accepted types, recognized from the first bytes rather than the file name
+SIGNATURES = {
+    "pdf": [b"%PDF-"],
+    "png": [b"\x89PNG\r\n\x1a\n"],
+    "jpg": [b"\xff\xd8\xff"],
+}
+EXTENSIONS = {"pdf": ["pdf"], "png": ["png"], "jpg": ["jpg", "jpeg"]}
+
+# PDF objects, page and page-tree dictionaries. Since PDF 1.5 objects may sit
+# in compressed object streams (/Type /ObjStm) instead of the file body
+PDF_OBJECT = re.compile(rb"\d+\s+\d+\s+obj\b(.*?)\bendobj", re.S)
+PDF_STREAM = re.compile(rb"\bstream\r?\n")
+PDF_PAGE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+PDF_PAGES = re.compile(rb"/Type\s*/Pages(?![a-zA-Z])")
+PDF_COUNT = re.compile(rb"/Count\s+(\d+)")
+PDF_PARENT = re.compile(rb"/Parent\s")
+PDF_OBJSTM = re.compile(rb"/Type\s*/ObjStm(?![a-zA-Z])")
+PDF_FIRST = re.compile(rb"/First\s+(\d+)")
+
+_pool = None
+_pool_lock = threading.Lock()
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+def sniff_kind(head):
+    for kind, signatures in SIGNATURES.items():
+        if any(head.startswith(s) for s in signatures):
+            return kind
+    return None
+
+
+def _blob_dir(sha256):
+    return os.path.join(UPLOAD_DIR, "blobs", sha256[:2])
+
+
+def blob_path(sha256, kind):
+    return os.path.join(_blob_dir(sha256), f"{sha256}.{kind}")
+
+
+def _status_path(sha256):
+    return os.path.join(_blob_dir(sha256), f"{sha256}.json")
+
+
+def store(fileobj, filename, max_bytes=MAX_UPLOAD_BYTES, chunk_bytes=CHUNK_BYTES):
+    """Stream `fileobj` to the store in chunks, hashing as it is written.
+
+    Type and size are checked as the bytes arrive, so a rejected upload is
+    never held in full. Returns a dict with the document's sha256, kind, size
+    and whether identical content was already stored.
+    """
+    extension = os.path.splitext(filename)[1].lstrip(".").lower()
+    head = fileobj.read(chunk_bytes)
+    kind = sniff_kind(head)
+    if kind is None:
+        raise UploadRejected(f"{filename}: not a PDF, PNG or JPG file")
+    if extension not in EXTENSIONS[kind]:
+        raise UploadRejected(f"{filename}: content is {kind.upper()} but the name ends in .{extension or '(none)'}")
+
+    tmp_dir = os.path.join(UPLOAD_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(f"{filename}: larger than {max_bytes / (1024 * 1024):g} MB")
+                digest.update(chunk)
+                out.write(chunk)
+                chunk = fileobj.read(chunk_bytes)
+
+        sha256 = digest.hexdigest()
+        target = blob_path(sha256, kind)
+        duplicate = os.path.exists(target)
+        if not duplicate:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    metrics.inc("thrive_uploads_total", kind=kind, result="duplicate" if duplicate else "stored")
+    metrics.inc("thrive_upload_bytes_total", size, kind=kind)
+    return {"sha256": sha256, "kind": kind, "size": size, "filename": filename, "duplicate": duplicate}
+
+
+def _pdf_objects(body):
+    # Dictionary part of every object in the file body or in an object stream
+    for match in PDF_OBJECT.finditer(body):
+        obj = match.group(1)
+        stream = PDF_STREAM.search(obj)
+        head = obj[:stream.start()] if stream else obj
+        yield head
+        if stream and PDF_OBJSTM.search(head):
+            yield from _object_stream(head, obj[stream.end():])
+
+
+def _object_stream(head, data):
+    # Objects of a compressed object stream; its header is N pairs of
+    # (object number, offset), and the objects start at /First
+    first = PDF_FIRST.search(head)
+    if first is None or b"/FlateDecode" not in head:
+        return
+    try:
+        data = zlib.decompressobj().decompress(data)
+    except zlib.error:
+        return
+    first = int(first.group(1))
+    offsets = [int(n) for n in data[:first].split()[1::2]]
+    for start, end in zip(offsets, offsets[1:] + [len(data) - first]):
+        yield data[first + start:first + end]
+
+
+def _pdf_page_count(path):
+    """Pages of a PDF: the /Count of the root page tree, else the number of
+    page objects, else None when neither can be found."""
+    pages, counts = 0, []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 1024))
+        if b"%%EOF" not in f.read():
+            raise ValueError("PDF is truncated (no %EOF marker)")
+        # Mapped rather than read, so large uploads are not buffered
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as body:
+            for head in _pdf_objects(body):
+                if PDF_PAGES.search(head):
+                    count = PDF_COUNT.search(head)
+                    if count and not PDF_PARENT.search(head):
+                        counts.append(int(count.group(1)))
+                elif PDF_PAGE.search(head):
+                    pages += 1
+    if counts:
+        return max(counts)
+    return pages or None
+
+
+def verify(path, kind):
+    """Validation run in a worker process: decode check plus a thumbnail or page count."""
+    if kind == "pdf":
+        # A page count that cannot be read is reported as unknown, not rejected
+        return {"pages": _pdf_page_count(path)}
+
+    from PIL import Image
+
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    with Image.open(path) as image:
+        image.verify()
+    # verify() leaves the image unusable, so decode it again for the thumbnail
+    with Image.open(path) as image:
+        width, height = image.size
+        image.thumbnail(THUMBNAIL_SIZE)
+        thumbnail = os.path.splitext(path)[0] + ".thumb.png"
+        image.convert("RGB").save(thumbnail, "PNG")
+    return {"width": width, "height": height, "thumbnail": thumbnail}
+
+
+def _get_pool():
+    # Same setup as the transcription pool: one per server process, "spawn" context
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _write_status(sha256, status):
+    path = _status_path(sha256)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(status, f)
+    os.replace(tmp, path)
+
+
+def _record_result(sha256, future):
+    try:
+        status = {"state": "verified", "details": future.result(), "error": None}
+    except Exception as e:
+        status = {"state": "rejected", "details": {}, "error": str(e) or type(e).__name__}
+    _write_status(sha256, status)
+    metrics.inc("thrive_document_checks_total", result=status["state"])
+    with _jobs_lock:
+        _jobs.pop(sha256, None)
+
+
+def submit(document):
+    """Queue background validation for a stored document, once per distinct content."""
+    sha256 = document["sha256"]
+    with _jobs_lock:
+        if sha256 in _jobs or os.path.exists(_status_path(sha256)):
+            return sha256
+        future = _get_pool().submit(verify, blob_path(sha256, document["kind"]), document["kind"])
+        _jobs[sha256] = future
+    future.add_done_callback(lambda f: _record_result(sha256, f))
+    return sha256
+
+
+def status(sha256):
+    """Validation state: "queued", "verified" or "rejected", with details or the error."""
+    path = _status_path(sha256)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    with _jobs_lock:
+        queued = sha256 in _jobs
+    if queued:
+        return {"state": "queued", "details": {}, "error": None}
+    return {"state": "unknown", "details": {}, "error": "No such document"}
+
+
+def store_uploads(uploads, stored):
+    """Store and queue each Streamlit upload once; `stored` maps file ids to results
+    and should live in session state so reruns do not re-read the files."""
+    for upload in uploads:
+        if upload.file_id not in stored:
+            try:
+                stored[upload.file_id] = store(upload, upload.name)
+                submit(stored[upload.file_id])
+            except UploadRejected as e:
+                stored[upload.file_id] = {"filename": upload.name, "error": str(e)}
+    return [stored[upload.file_id] for upload in uploads]
+
+
+def describe(document):
+    """One display row for an upload: name, type, size and current validation state."""
+    if "error" in document:
+        return {"Document": document["filename"], "Type": "", "Size (KB)": "", "Status": "rejected",
+                "Details": document["error"]}
+    current = status(document["sha256"])
+    details = current["details"]
+    if current["error"]:
+        note = current["error"]
+    elif "pages" in details:
+        note = f"{details['pages']} page(s)" if details["pages"] else "PDF, page count unknown"
+    elif "width" in details:
+        note = f"{details['width']}x{details['height']} image"
+    else:
+        note = "Checking file..."
+    if document["duplicate"]:
+        note += " (already on file)"
+    return {"Document": document["filename"], "Type": document["kind"].upper(),
+            "Size (KB)": round(document["size"] / 1024, 1), "Status": current["state"], "Details": note}
+
+
+def queue_depth():
+    with _jobs_lock:
+        return len(_jobs)
+
+
+def _collect_metrics():
+    yield "thrive_document_queue_depth", {}, queue_depth()
+
+
+metrics.register_collector("documents", _collect_metrics)
@@ -0,0 +1,184 @@
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+
+import numpy as np
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # no cross-process lock; one worker per host
+    fcntl = None
+
+# Answers learned from the LLM are kept with the other on-disk caches
+CACHE_DIR = os.getenv("THRIVE_CACHE_DIR", ".thrive_cache")
+LEARNED_PATH = os.path.join(CACHE_DIR, "faq_learned.json")
+MAX_LEARNED = 500
+
+# Cosine similarity needed to answer from the index instead of calling the LLM
+THRESHOLD = float(os.getenv("THRIVE_FAQ_THRESHOLD", 0.5))
+
+FAQ = [
+    ("What is Medicaid?", "Medicaid is a healthcare program for individuals in need."),
+    ("What documents do I need?", "Refer to the Document Hub for a complete list."),
+    ("Is my data secure?", "Yes, your data is encrypted and complies with HIPAA regulations."),
+    ("Who can I contact for help?", "Email support@medicaidassist.com or call (555) 123-4567."),
+]
+
+# (document, what counts as proof); keep in sync with the Document Hub list in turbo.py
+REQUIRED_DOCUMENTS = [
+    ("Proof of Identity", "Government-issued photo ID, birth certificate, or Social Security card."),
+    ("Proof of Citizenship or Immigration Status", "U.S. birth certificate, naturalization certificate, or green card."),
+    ("Proof of Residency", "Utility bill, lease agreement, or shelter address letter."),
+    ("Proof of Income", "Pay stubs, tax returns, employer letter, or self-employment records."),
+    ("Health Insurance Information", "Insurance card (if applicable)."),
+    ("Proof of Resources", "If required: bank statements, property ownership documents, or retirement accounts."),
+    ("Medical Necessity Documents", "If applicable: physician's statement, medical records, or hospital bills."),
+]
+
+STOPWORDS = set("""
+a an and are as at be by can do does for from have how i if in is it me my of on or our should so
+that the there this to was what when where which who why will with you your
+""".split())
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        # Crude plural folding so "documents" matches "document"
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _load_learned(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)[-MAX_LEARNED:]
+
+
+def default_entries():
+    entries = [{"question": q, "answer": a, "source": "faq"} for q, a in FAQ]
+    for document, proof in REQUIRED_DOCUMENTS:
+        entries.append({
+            "question": f"What counts as {document}? What do I need for {document}?",
+            "answer": f"**{document}**: {proof}",
+            "source": "documents",
+        })
+    return entries
+
+
+class FaqIndex:
+    """TF-IDF index over FAQ entries; answers close matches without the LLM.
+
+    Rows are L2-normalized term weights, so a query's cosine similarity to
+    every entry is one matrix-vector product. Questions count twice as much
+    as answers. LLM answers added with `learn` are searchable right away and
+    saved to `learned_path`.
+    """
+
+    def __init__(self, entries=None, learned_path=LEARNED_PATH, threshold=THRESHOLD):
+        self.base = list(entries if entries is not None else default_entries())
+        self.learned_path = learned_path
+        self.threshold = threshold
+        self.learned = _load_learned(learned_path) if learned_path else []
+        self._lock = threading.Lock()
+        self._build()
+
+    def _build(self):
+        entries = self.base + self.learned
+        # Learned entries are matched on the question only; long LLM answers would
+        # otherwise match loosely related questions
+        documents = [Counter(tokenize(e["question"]) * 2 + (tokenize(e["answer"]) if e["source"] != "learned" else []))
+                     for e in entries]
+        vocabulary = {term: i for i, term in enumerate(sorted(set().union(*documents)))}
+        matrix = np.zeros((len(entries), len(vocabulary)), dtype=np.float32)
+        for row, counts in enumerate(documents):
+            for term, count in counts.items():
+                matrix[row, vocabulary[term]] = count
+        # Smoothed IDF and sublinear term frequency, as in sklearn's TfidfVectorizer
+        document_frequency = (matrix > 0).sum(axis=0)
+        idf = np.log((1 + len(entries)) / (1 + document_frequency)) + 1
+        np.log1p(matrix, out=matrix)
+        matrix *= idf
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self.entries, self.vocabulary, self.idf, self.matrix = entries, vocabulary, idf.astype(np.float32), matrix
+        # Smoothed IDF of a term no entry contains
+        self.unseen_idf = float(np.log(1 + len(entries)) + 1)
+
+    def _vector(self, text):
+        # Terms outside the vocabulary match nothing but still count toward the
+        # norm, so one shared keyword in an otherwise unknown question scores low
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        unseen = 0.0
+        for term, count in Counter(tokenize(text)).items():
+            column = self.vocabulary.get(term)
+            if column is not None:
+                vector[column] = np.log1p(count) * self.idf[column]
+            else:
+                unseen += (np.log1p(count) * self.unseen_idf) ** 2
+        norm = np.sqrt(np.dot(vector, vector) + unseen)
+        return vector / norm if norm else vector
+
+    def search(self, query, k=3):
+        """Best `k` (similarity, entry) pairs for `query`."""
+        with self._lock:
+            entries, scores = self.entries, self.matrix @ self._vector(query)
+        best = np.argsort(-scores)[:k]
+        return [(float(scores[i]), entries[i]) for i in best if scores[i] > 0]
+
+    def answer(self, query):
+        """The matching entry if it clears the similarity threshold, else None."""
+        hits = self.search(query, k=1)
+        if hits and hits[0][0] >= self.threshold:
+            metrics.inc("thrive_faq_requests_total", result=hits[0][1]["source"])
+            return hits[0][1]
+        metrics.inc("thrive_faq_requests_total", result="miss")
+        return None
+
+    def learn(self, question, answer):
+        """Add an LLM answer so the same question is answered locally next time.
+
+        The answer is searchable even if saving it fails; the error is raised
+        after the index is updated.
+        """
+        entry = {"question": question, "answer": answer, "source": "learned"}
+        with self._lock:
+            learned = self.learned + [entry]
+            try:
+                if self.learned_path:
+                    learned = self._save(entry)
+            finally:
+                self.learned = learned[-MAX_LEARNED:]
+                self._build()
+
+    def _save(self, entry):
+        # Other workers learn too: the file is read, merged and replaced under
+        # a file lock so none of their answers are overwritten. Returns what
+        # was written, which includes theirs
+        directory = os.path.dirname(self.learned_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with open(f"{self.learned_path}.lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            learned = [e for e in _load_learned(self.learned_path) if e["question"] != entry["question"]]
+            learned = (learned + [entry])[-MAX_LEARNED:]
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix=".faq_learned-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(learned, f)
+                os.replace(tmp, self.learned_path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        return learned
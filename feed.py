@@ -0,0 +1,392 @@
+"""Community feed: append-only posts, follower timelines and a hot-timeline cache.
+
+Posts are fanned out on write into each follower's timeline, except for
+accounts with at least CELEBRITY_FOLLOWERS followers, whose posts are merged
+in at read time. Timelines are read newest first with a post-ID cursor, so a
+page costs the same however large the network is.
+
+    python feed.py --users 100000 --posts 1000000 --db feed-load.db
+"""
+import argparse
+import heapq
+import itertools
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+FEED_DB = os.getenv("THRIVE_FEED_DB", "feed.db")
+
+CELEBRITY_FOLLOWERS = 1000
+PAGE_SIZE = 10
+# Posts copied into a new follower's timeline from the account they followed
+FOLLOW_BACKFILL = 20
+
+# Every insert or profile change takes the next number of one sequence, so a
+# reader in any process can pick up exactly what changed since it last looked.
+# Computed inside the write statement, which SQLite runs for one writer at a time
+NEXT_CHANGE = "(SELECT COALESCE(MAX(changed), 0) + 1 FROM users)"
+
+# Hot-timeline cache: newest post IDs for the most recently read timelines
+HOT_USERS = 10_000
+HOT_LENGTH = 100
+
+EMOTIONS = ["hopeful", "anxious", "grateful", "struggling"]
+EVENTS = [
+    "attended a support group",
+    "shared their story for the first time",
+    "received positive feedback from followers",
+    "reached a milestone in their recovery",
+]
+FIRST_NAMES = ["Alex", "Chris", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery", "Quinn",
+               "Sam", "Drew", "Robin", "Skyler", "Reese", "Cameron", "Dana", "Emerson", "Hayden", "Kendall"]
+LAST_NAMES = ["Smith", "Doe", "Johnson", "Garcia", "Martinez", "Lee", "Brown", "Davis", "Lopez", "Wilson",
+              "Anderson", "Thomas", "Moore", "Jackson", "White", "Harris", "Clark", "Lewis", "Young", "Walker"]
+
+
+def generate_synthetic_story(rng=random):
+    return f"Today, I am feeling {rng.choice(EMOTIONS)}. I {rng.choice(EVENTS)} and it has made a difference in my journey."
+
+
+def synthetic_name(rng=random):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+class TimelineCache:
+    """LRU map of user ID -> newest timeline post IDs (newest first)."""
+
+    def __init__(self, max_users=HOT_USERS):
+        self.max_users = max_users
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            ids = self._entries.get(user_id)
+            if ids is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return ids
+
+    def put(self, user_id, ids):
+        with self._lock:
+            self._entries[user_id] = ids
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FeedStore:
+    """Users, follows, posts and per-follower timelines in SQLite (WAL mode)."""
+
+    def __init__(self, path=FEED_DB, celebrity_followers=CELEBRITY_FOLLOWERS, cache=None):
+        self.path = path
+        self.celebrity_followers = celebrity_followers
+        self.cache = cache if cache is not None else TimelineCache()
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._writer.executescript(
+            "CREATE TABLE IF NOT EXISTS users ("
+            " user_id INTEGER PRIMARY KEY,"
+            " name TEXT NOT NULL,"
+            " private INTEGER NOT NULL DEFAULT 0,"
+            " followers INTEGER NOT NULL DEFAULT 0,"
+            " following INTEGER NOT NULL DEFAULT 0,"
+            " changed INTEGER NOT NULL DEFAULT 0);"
+            # Trending reads the most-followed accounts without sorting every user
+            "CREATE INDEX IF NOT EXISTS users_followers ON users (followers DESC);"
+            "CREATE TABLE IF NOT EXISTS follows ("
+            " follower INTEGER NOT NULL,"
+            " followee INTEGER NOT NULL,"
+            " PRIMARY KEY (follower, followee)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS follows_followee ON follows (followee, follower);"
+            "CREATE TABLE IF NOT EXISTS posts ("
+            " post_id INTEGER PRIMARY KEY,"
+            " author_id INTEGER NOT NULL,"
+            " text TEXT NOT NULL,"
+            " created_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS posts_author ON posts (author_id, post_id);"
+            "CREATE TABLE IF NOT EXISTS timelines ("
+            " user_id INTEGER NOT NULL,"
+            " post_id INTEGER NOT NULL,"
+            " PRIMARY KEY (user_id, post_id)) WITHOUT ROWID;"
+        )
+        # Databases created before profile changes were sequenced
+        if "changed" not in {row[1] for row in self._writer.execute("PRAGMA table_info(users)")}:
+            self._writer.execute("ALTER TABLE users ADD COLUMN changed INTEGER NOT NULL DEFAULT 0")
+        self._writer.execute("CREATE INDEX IF NOT EXISTS users_changed ON users (changed, user_id)")
+        self._writer.commit()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # Writes
+
+    def add_users(self, names, private=False):
+        """Create users; returns their IDs."""
+        with self._write_lock, self._writer as conn:
+            first = conn.execute("SELECT COALESCE(MAX(user_id), 0) + 1 FROM users").fetchone()[0]
+            ids = list(range(first, first + len(names)))
+            conn.executemany("INSERT INTO users (user_id, name, private, changed) VALUES (?, ?, ?, " + NEXT_CHANGE + ")",
+                             ((user_id, name, int(private)) for user_id, name in zip(ids, names)))
+        return ids
+
+    def add_user(self, name, private=False):
+        return self.add_users([name], private)[0]
+
+    def update_profile(self, user_id, name, private):
+        with self._write_lock, self._writer as conn:
+            conn.execute("UPDATE users SET name = ?, private = ?, changed = " + NEXT_CHANGE + " WHERE user_id = ?",
+                         (name, int(private), user_id))
+
+    def follow_many(self, pairs, backfill=FOLLOW_BACKFILL):
+        """Add (follower, followee) edges, keeping follow counts and timelines up to date."""
+        with self._write_lock, self._writer as conn:
+            for follower, followee in pairs:
+                added = conn.execute("INSERT OR IGNORE INTO follows (follower, followee) VALUES (?, ?)",
+                                     (follower, followee)).rowcount
+                if not added:
+                    continue
+                conn.execute("UPDATE users SET following = following + 1 WHERE user_id = ?", (follower,))
+                # Backfilled posts are older than the cached window, so drop it
+                self.cache.discard(follower)
+                followers = conn.execute("UPDATE users SET followers = followers + 1 WHERE user_id = ? RETURNING followers",
+                                         (followee,)).fetchone()[0]
+                if backfill and followers < self.celebrity_followers:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO timelines (user_id, post_id)"
+                        " SELECT ?, post_id FROM posts WHERE author_id = ? ORDER BY post_id DESC LIMIT ?",
+                        (follower, followee, backfill),
+                    )
+
+    def follow(self, follower, followee):
+        self.follow_many([(follower, followee)])
+
+    def post_many(self, posts):
+        """Append (author_id, text) posts and fan them out; returns the new post IDs."""
+        ids = []
+        with self._write_lock, self._writer as conn:
+            now = time.time()
+            for author_id, text in posts:
+                post_id = conn.execute("INSERT INTO posts (author_id, text, created_at) VALUES (?, ?, ?)",
+                                       (author_id, text, now)).lastrowid
+                # Own timeline always; followers' only for accounts below the celebrity threshold
+                conn.execute("INSERT INTO timelines (user_id, post_id) VALUES (?, ?)", (author_id, post_id))
+                conn.execute(
+                    "INSERT INTO timelines (user_id, post_id)"
+                    " SELECT follower, ? FROM follows WHERE followee = ?"
+                    " AND (SELECT followers FROM users WHERE user_id = ?) < ?",
+                    (post_id, author_id, author_id, self.celebrity_followers),
+                )
+                ids.append(post_id)
+        metrics.inc("thrive_feed_posts_total", len(ids))
+        return ids
+
+    def post(self, author_id, text):
+        return self.post_many([(author_id, text)])[0]
+
+    # Reads
+
+    def user(self, user_id):
+        row = self._reader().execute(
+            "SELECT user_id, name, private, followers, following FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return dict(zip(("user_id", "name", "private", "followers", "following"), row)) if row else None
+
+    def network(self, user_id):
+        """Following and follower counts, kept as counters so this is one row lookup."""
+        user = self.user(user_id)
+        return {"following": user["following"], "followers": user["followers"]} if user else {"following": 0, "followers": 0}
+
+    def _celebrities(self, conn, user_id):
+        return [followee for (followee,) in conn.execute(
+            "SELECT followee FROM follows JOIN users ON users.user_id = follows.followee"
+            " WHERE follower = ? AND users.followers >= ?", (user_id, self.celebrity_followers))]
+
+    def _timeline_ids(self, user_id, before=None, after=None, limit=PAGE_SIZE):
+        """Newest-first post IDs in (after, before): the fanned-out timeline merged with
+        recent posts of followed high-follower accounts."""
+        conn = self._reader()
+        low = after if after is not None else -1
+        high = before if before is not None else 2 ** 62
+        sources = [[pid for (pid,) in conn.execute(
+            "SELECT post_id FROM timelines WHERE user_id = ? AND post_id > ? AND post_id < ? ORDER BY post_id DESC LIMIT ?",
+            (user_id, low, high, limit))]]
+        for author_id in self._celebrities(conn, user_id):
+            sources.append([pid for (pid,) in conn.execute(
+                "SELECT post_id FROM posts WHERE author_id = ? AND post_id > ? AND post_id < ? ORDER BY post_id DESC LIMIT ?",
+                (author_id, low, high, limit))])
+        ids = []
+        for post_id in heapq.merge(*sources, reverse=True):
+            if not ids or ids[-1] != post_id:
+                ids.append(post_id)
+                if len(ids) == limit:
+                    break
+        return ids
+
+    def _hot_ids(self, user_id):
+        # Cached newest IDs, topped up with anything posted since they were cached
+        ids = self.cache.get(user_id)
+        if ids is None:
+            ids = self._timeline_ids(user_id, limit=HOT_LENGTH)
+        else:
+            newer = self._timeline_ids(user_id, after=ids[0] if ids else None, limit=HOT_LENGTH)
+            if not newer:
+                return ids
+            ids = (newer + ids)[:HOT_LENGTH]
+        self.cache.put(user_id, ids)
+        return ids
+
+    def posts(self, post_ids):
+        """Posts with author names, in the order of `post_ids`."""
+        if not post_ids:
+            return []
+        rows = self._reader().execute(
+            f"SELECT post_id, author_id, name, text, created_at FROM posts JOIN users ON users.user_id = posts.author_id"
+            f" WHERE post_id IN ({','.join('?' * len(post_ids))})", list(post_ids)).fetchall()
+        by_id = {row[0]: dict(zip(("post_id", "author_id", "author", "text", "created_at"), row)) for row in rows}
+        return [by_id[pid] for pid in post_ids if pid in by_id]
+
+    def timeline(self, user_id, cursor=None, limit=PAGE_SIZE):
+        """One page of a user's timeline, newest first.
+
+        Returns (posts, next_cursor); pass next_cursor back to get the following
+        page. next_cursor is None at the end of the timeline.
+        """
+        with metrics.timed("thrive_feed_read", kind="timeline"):
+            hot = self._hot_ids(user_id)
+            if cursor is None:
+                ids = hot[:limit]
+            else:
+                ids = [pid for pid in hot if pid < cursor][:limit]
+            if len(ids) < limit and len(hot) == HOT_LENGTH:
+                # Past the cached window: read the rest of the page from the database
+                start = ids[-1] if ids else cursor
+                ids += self._timeline_ids(user_id, before=start, limit=limit - len(ids))
+            page = self.posts(ids)
+        return page, (ids[-1] if len(ids) == limit else None)
+
+    def trending(self, limit=PAGE_SIZE):
+        """Newest posts from the most-followed accounts."""
+        conn = self._reader()
+        authors = [uid for (uid,) in conn.execute("SELECT user_id FROM users ORDER BY followers DESC LIMIT 20")]
+        sources = [[pid for (pid,) in conn.execute(
+            "SELECT post_id FROM posts WHERE author_id = ? ORDER BY post_id DESC LIMIT ?", (author_id, limit))]
+            for author_id in authors]
+        return self.posts(list(heapq.merge(*sources, reverse=True))[:limit])
+
+    def iter_users(self, after=(-1, 0), batch=10_000):
+        """(changed, user_id, name, private) rows of users added or changed after
+        the (changed, user_id) position `after`, in batches, in change order."""
+        conn = self._reader()
+        while True:
+            rows = conn.execute("SELECT changed, user_id, name, private FROM users WHERE (changed, user_id) > (?, ?)"
+                                " ORDER BY changed, user_id LIMIT ?", (*after, batch)).fetchall()
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][:2]
+
+    def user_count(self):
+        return self._reader().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+def populate(store, users, posts, follows_per_user=20, seed=0, batch=10_000, progress=None):
+    """Synthetic community: power-law follower counts and story posts.
+
+    A few accounts attract most follows, so high-follower accounts exercise
+    the read-time merge. Returns the IDs of the new users.
+    """
+    rng = random.Random(seed)
+    ids = store.add_users([synthetic_name(rng) for _ in range(users)])
+    # Popularity ~ Pareto, so follows concentrate on a small set of accounts
+    cum_weights = list(itertools.accumulate(rng.paretovariate(1.2) for _ in ids))
+    pairs = []
+    for follower in ids:
+        for followee in rng.choices(ids, cum_weights=cum_weights, k=follows_per_user):
+            if followee != follower:
+                pairs.append((follower, followee))
+        if len(pairs) >= batch:
+            store.follow_many(pairs, backfill=0)
+            pairs = []
+    store.follow_many(pairs, backfill=0)
+
+    written = 0
+    while written < posts:
+        n = min(batch, posts - written)
+        store.post_many([(rng.choice(ids), generate_synthetic_story(rng)) for _ in range(n)])
+        written += n
+        if progress:
+            progress(written)
+    return ids
+
+
+def demo_community(store, users=500, posts=5000, follows=20, seed=0):
+    """Seed an empty store with a small synthetic community; returns the ID of the
+    member the app signs everyone in as (the first user)."""
+    if store.user_count() == 0:
+        member = store.add_user("Your Name")
+        ids = populate(store, users, posts, follows, seed)
+        store.follow_many((member, followee) for followee in random.Random(seed).sample(ids, follows))
+        store.follow_many((follower, member) for follower in random.Random(seed + 1).sample(ids, follows // 2))
+    return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--posts", type=int, default=1_000_000)
+    parser.add_argument("--follows", type=int, default=20, help="follows per user")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", default="feed-load.db")
+    parser.add_argument("--reads", type=int, default=2000, help="timeline reads to time after loading")
+    args = parser.parse_args()
+
+    store = FeedStore(args.db)
+    start = time.perf_counter()
+    ids = populate(store, args.users, args.posts, args.follows, args.seed,
+                   progress=lambda n: print(f"  {n} posts", flush=True) if n % 100_000 == 0 else None)
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {args.users} users and {args.posts} posts in {elapsed:.1f} s ({args.posts / elapsed:.0f} posts/s)")
+
+    rng = random.Random(args.seed + 1)
+    latencies = []
+    for _ in range(args.reads):
+        user_id = rng.choice(ids)
+        t = time.perf_counter()
+        page, cursor = store.timeline(user_id)
+        if cursor is not None:
+            store.timeline(user_id, cursor)
+        latencies.append((time.perf_counter() - t) * 1000)
+    latencies.sort()
+    print(f"Timeline (2 pages): p50 {latencies[len(latencies) // 2]:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
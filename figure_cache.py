@@ -0,0 +1,100 @@
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+
+MAX_ENTRIES = 64
+MAX_BYTES = 32 * 1024 * 1024
+DPI = 100
+
+
+def figure_key(version, chart, **params):
+    """Stable key for a chart rendered from data `version` with the given parameters."""
+    payload = json.dumps({"version": version, "chart": chart, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def render_png(fig, dpi=DPI):
+    """Rasterize a figure to PNG bytes and close it so it is not kept by pyplot."""
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    finally:
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+class FigureCache:
+    """LRU cache of rendered chart images, bounded by entry count and total bytes."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= len(self._entries.pop(key))
+            self._entries[key] = image
+            self.bytes += len(image)
+            while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def get_or_render(self, key, draw):
+        """PNG bytes for `key`; on a miss `draw()` must return a new matplotlib Figure."""
+        image = self.get(key)
+        if image is None:
+            image = render_png(draw())
+            self.put(key, image)
+        return image
+
+
+def bar_chart_spec(x, y, title):
+    """Vega-Lite spec for a bar chart rendered in the browser instead of on the server."""
+    return {
+        "title": title,
+        "mark": "bar",
+        "encoding": {
+            "x": {"field": x, "type": "nominal"},
+            "y": {"field": y, "type": "quantitative"},
+        },
+    }
+
+
+def stacked_bar_chart_spec(x, title):
+    """Stacked variant; expects the long-format frame produced by `long_format`."""
+    return {
+        "title": title,
+        "mark": "bar",
+        "encoding": {
+            "x": {"field": x, "type": "nominal"},
+            "y": {"field": "value", "type": "quantitative", "stack": "zero"},
+            "color": {"field": "series", "type": "nominal"},
+        },
+    }
+
+
+def long_format(frame, x, columns):
+    return frame.melt(id_vars=[x], value_vars=columns, var_name="series", value_name="value")
@@ -0,0 +1,193 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+SENSOR_COLUMNS = ["X_accel", "Y_accel", "Z_accel", "Heart_Rate"]
+
+
+class HarStore:
+    """HAR sensor rows sorted by (Patient_ID, Timestamp) with one contiguous slice per patient.
+
+    Columns are kept as plain NumPy arrays; `starts[i]:starts[i + 1]` is the
+    slice belonging to `patient_ids[i]`.
+    """
+
+    def __init__(self, har_df):
+        codes, patient_ids = pd.factorize(har_df["Patient_ID"], sort=True)
+        timestamps = har_df["Timestamp"].to_numpy(dtype="datetime64[ns]")
+        order = np.lexsort((timestamps, codes))
+
+        self.patient_ids = np.asarray(patient_ids, dtype=object)
+        self.codes = codes[order]
+        self.timestamps = timestamps[order]
+        self.sensors = {col: har_df[col].to_numpy(dtype=np.float32)[order] for col in SENSOR_COLUMNS}
+
+        activity = pd.Categorical(har_df["Activity"])
+        self.activities = list(activity.categories)
+        self.activity_codes = activity.codes[order]
+        self.relapse = (har_df["Relapse_Indicator"].astype(str).to_numpy() == "Yes")[order]
+
+        self.starts = np.searchsorted(self.codes, np.arange(len(self.patient_ids) + 1))
+        self._index = {pid: i for i, pid in enumerate(self.patient_ids)}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, patient_id):
+        return patient_id in self._index
+
+    @property
+    def counts(self):
+        return np.diff(self.starts)
+
+    def patient_slice(self, patient_id):
+        i = self._index[patient_id]
+        return slice(self.starts[i], self.starts[i + 1])
+
+    def latest(self, patient_ids):
+        """Timestamp of each patient's newest row; NaT for patients with no rows."""
+        codes = pd.Index(self.patient_ids).get_indexer(np.asarray(patient_ids, dtype=object))
+        out = np.full(len(codes), np.datetime64("NaT"), dtype="datetime64[ns]")
+        known = codes >= 0
+        known[known] = self.counts[codes[known]] > 0
+        out[known] = self.timestamps[self.starts[codes[known] + 1] - 1]
+        return out
+
+    def appended(self, har_df):
+        """A new store with the typed rows of `har_df` added.
+
+        Every new row must be later than the stored rows of its patient, so the
+        new rows are sorted on their own and inserted at the end of each
+        patient's slice instead of re-sorting the whole table. Patients not
+        seen before get the next codes and go after everyone else.
+        """
+        store = copy.copy(self)
+        codes = pd.Index(self.patient_ids).get_indexer(har_df["Patient_ID"])
+        unseen = codes < 0
+        if unseen.any():
+            new_codes, new_ids = pd.factorize(har_df["Patient_ID"].to_numpy(dtype=object)[unseen])
+            codes[unseen] = len(self.patient_ids) + new_codes
+            store.patient_ids = np.concatenate([self.patient_ids, np.asarray(new_ids, dtype=object)])
+            store._index = {pid: i for i, pid in enumerate(store.patient_ids)}
+        timestamps = har_df["Timestamp"].to_numpy(dtype="datetime64[ns]")
+        order = np.lexsort((timestamps, codes))
+        codes = codes[order]
+
+        # End of each new row's patient slice; new patients go after the last row
+        at = np.where(codes < len(self.patient_ids), self.starts[np.minimum(codes, len(self.patient_ids) - 1) + 1],
+                      len(self))
+        store.codes = np.insert(self.codes, at, codes)
+        store.timestamps = np.insert(self.timestamps, at, timestamps[order])
+        store.sensors = {col: np.insert(self.sensors[col], at, har_df[col].to_numpy(dtype=np.float32)[order])
+                         for col in SENSOR_COLUMNS}
+        activity = pd.Categorical(har_df["Activity"], categories=self.activities)
+        store.activity_codes = np.insert(self.activity_codes, at, activity.codes[order])
+        store.relapse = np.insert(self.relapse, at, (har_df["Relapse_Indicator"].astype(str).to_numpy() == "Yes")[order])
+        store.starts = np.searchsorted(store.codes, np.arange(len(store.patient_ids) + 1))
+        return store
+
+    def patient(self, patient_id):
+        """Rows for one patient, in time order."""
+        return self.frame(self.patient_slice(patient_id))
+
+    def frame(self, rows=slice(None)):
+        out = {
+            "Patient_ID": self.patient_ids[self.codes[rows]],
+            "Timestamp": self.timestamps[rows],
+            "Activity": pd.Categorical.from_codes(self.activity_codes[rows], categories=self.activities),
+        }
+        for col in SENSOR_COLUMNS:
+            out[col] = self.sensors[col][rows]
+        out["Relapse_Indicator"] = np.where(self.relapse[rows], "Yes", "No")
+        return pd.DataFrame(out)
+
+    def accel_magnitude(self):
+        x, y, z = (self.sensors[c].astype(np.float64) for c in ("X_accel", "Y_accel", "Z_accel"))
+        return np.sqrt(x * x + y * y + z * z)
+
+    def _reduce(self, boundaries, group_codes):
+        # One reduceat pass per statistic over contiguous groups starting at `boundaries`
+        counts = np.diff(np.append(boundaries, len(self)))
+        heart_rate = self.sensors["Heart_Rate"].astype(np.float64)
+        magnitude = self.accel_magnitude()
+
+        out = {"Samples": counts}
+        out["Heart_Rate_mean"] = np.add.reduceat(heart_rate, boundaries) / counts
+        out["Heart_Rate_max"] = np.maximum.reduceat(heart_rate, boundaries)
+        for col in ("X_accel", "Y_accel", "Z_accel"):
+            out[f"{col}_mean"] = np.add.reduceat(self.sensors[col].astype(np.float64), boundaries) / counts
+        mag_mean = np.add.reduceat(magnitude, boundaries) / counts
+        out["Accel_Magnitude_mean"] = mag_mean
+        out["Accel_Magnitude_var"] = np.maximum(np.add.reduceat(magnitude * magnitude, boundaries) / counts - mag_mean ** 2, 0.0)
+        out["Relapse_Indicator_rate"] = np.add.reduceat(self.relapse.astype(np.float64), boundaries) / counts
+
+        # Minutes in each activity: one bincount over (group, activity) pairs
+        n_groups, n_act = len(boundaries), len(self.activities)
+        group_of_row = np.repeat(np.arange(n_groups), counts)
+        minutes = np.bincount(group_of_row * n_act + self.activity_codes, minlength=n_groups * n_act).reshape(n_groups, n_act)
+        for j, activity in enumerate(self.activities):
+            out[f"Minutes_{activity}"] = minutes[:, j]
+
+        out = pd.DataFrame(out)
+        out.insert(0, "Patient_ID", self.patient_ids[group_codes])
+        return out
+
+    def patient_features(self):
+        """Compact one-row-per-patient feature table."""
+        present = self.counts > 0
+        return self._reduce(self.starts[:-1][present], np.flatnonzero(present)).reset_index(drop=True)
+
+    def window_features(self, window="1h"):
+        """The same aggregates per patient over fixed, non-overlapping time windows."""
+        if len(self) == 0:
+            return self._reduce(np.array([], dtype=np.intp), np.array([], dtype=np.intp))
+        window_ns = pd.Timedelta(window).value
+        buckets = self.timestamps.astype(np.int64) // window_ns
+        change = (np.diff(self.codes) != 0) | (np.diff(buckets) != 0)
+        boundaries = np.concatenate(([0], np.flatnonzero(change) + 1))
+        out = self._reduce(boundaries, self.codes[boundaries])
+        out.insert(1, "Window_Start", (buckets[boundaries] * window_ns).astype("datetime64[ns]"))
+        return out
+
+    def rolling_mean(self, column, samples):
+        """Trailing mean over the last `samples` rows of each patient, aligned with the sorted rows."""
+        values = self.accel_magnitude() if column == "Accel_Magnitude" else self.sensors[column].astype(np.float64)
+        cumulative = np.concatenate(([0.0], np.cumsum(values)))
+        idx = np.arange(len(values))
+        lo = np.maximum(idx - samples + 1, self.starts[self.codes])
+        return (cumulative[idx + 1] - cumulative[lo]) / (idx - lo + 1)
+
+
+def combine_features(features, more):
+    """Patient feature tables of two disjoint sets of rows, combined into the
+    table of all the rows. Both are indexed by Patient_ID; patients only in
+    `more` are added.
+
+    Every feature is a count, mean, maximum or variance, so this needs only
+    the new rows' table, not the rows behind `features`.
+    """
+    old = features.reindex(more.index)
+    n_old = old["Samples"].fillna(0).to_numpy(dtype=np.float64)
+    n_new = more["Samples"].to_numpy(dtype=np.float64)
+    n = n_old + n_new
+
+    def values(table, col):
+        return table[col].to_numpy(dtype=np.float64)
+
+    def pooled(old_values, new_values):
+        return (np.nan_to_num(old_values) * n_old + new_values * n_new) / n
+
+    out = more.copy()
+    out["Samples"] = n.astype(more["Samples"].dtype)
+    out["Heart_Rate_max"] = np.fmax(values(old, "Heart_Rate_max"), values(more, "Heart_Rate_max"))
+    for col in ("Heart_Rate_mean", "X_accel_mean", "Y_accel_mean", "Z_accel_mean", "Relapse_Indicator_rate"):
+        out[col] = pooled(values(old, col), values(more, col))
+    # Variance from the pooled mean of squares
+    mean = pooled(values(old, "Accel_Magnitude_mean"), values(more, "Accel_Magnitude_mean"))
+    squares = [values(table, "Accel_Magnitude_var") + values(table, "Accel_Magnitude_mean") ** 2 for table in (old, more)]
+    out["Accel_Magnitude_mean"] = mean
+    out["Accel_Magnitude_var"] = np.maximum(pooled(*squares) - mean ** 2, 0.0)
+    for col in (c for c in more.columns if c.startswith("Minutes_")):
+        out[col] = (old[col].fillna(0).to_numpy() + more[col].to_numpy()).astype(more[col].dtype)
+    return pd.concat([features[~pd.Index(features.index, dtype=object).isin(pd.Index(more.index, dtype=object))], out])
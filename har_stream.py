@@ -0,0 +1,324 @@
+"""Streaming early warnings over HAR sensor rows, per patient.
+
+Each patient has a fixed-size state: a fast and a slow EWMA of heart rate
+and of accel magnitude (the slow one with an EWMA variance, the patient's
+baseline), the share of minutes flagged by Relapse_Indicator and the rate
+of activity changes, each as a fast/slow pair. The state of every patient
+lives in NumPy arrays indexed by a patient slot, so a micro-batch is applied
+with a handful of vectorized updates instead of a loop over rows.
+
+An alert is raised when a patient's fast average drifts more than Z_ALERT
+baseline deviations from their slow one, or when their recent
+Relapse_Indicator or activity-change rate rises well above their own norm.
+Rows no later than a patient's last applied row are dropped, so history and
+a live feed can share one monitor as long as history is applied first
+(HarMonitor.prime). Missing or non-finite readings leave that signal's
+state as it was.
+
+    python har_stream.py --patients 5000 --minutes 120
+"""
+import argparse
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import sud_data
+
+ACTIVITIES = sud_data.HAR_SCHEMA["Activity"] + [sud_data.MISSING_CATEGORY]
+
+# Smoothing per sample (one sample per minute): the fast averages follow the
+# last ~10 minutes, the baselines the last few hours
+FAST_ALPHA = 0.1
+SLOW_ALPHA = 0.005
+# Samples a patient needs before their baseline is trusted
+WARMUP = 60
+# Baseline deviations between the fast and slow average that raise an alert
+Z_ALERT = 3.0
+# Baseline deviations beyond which a sample counts as this many when
+# updating the baseline
+BASELINE_CLIP = 4.0
+# Rise over the patient's own rate of relapse-flagged minutes or activity changes
+RATE_SHIFT = 0.3
+# Minimum time between two alerts of the same kind for one patient
+COOLDOWN = np.timedelta64(30, "m")
+MAX_ALERTS = 1000
+
+SIGNALS = ["heart_rate", "accel_magnitude"]
+RATES = ["relapse_indicator", "activity_changes"]
+ALERT_KINDS = SIGNALS + RATES
+
+
+class HarMonitor:
+    """Online per-patient statistics and alerts over HAR micro-batches."""
+
+    def __init__(self, capacity=1024, fast_alpha=FAST_ALPHA, slow_alpha=SLOW_ALPHA, warmup=WARMUP,
+                 z_alert=Z_ALERT, rate_shift=RATE_SHIFT, cooldown=COOLDOWN):
+        self.fast_alpha = fast_alpha
+        self.slow_alpha = slow_alpha
+        self.warmup = warmup
+        self.z_alert = z_alert
+        self.rate_shift = rate_shift
+        self.cooldown = np.timedelta64(cooldown).astype("timedelta64[ns]").astype(np.int64)
+        self.patient_ids = []
+        self._known = pd.Index([], dtype=object)
+        self._lock = threading.Lock()
+        self.alerts = deque(maxlen=MAX_ALERTS)
+        self.rows = 0
+
+        self.samples = np.zeros(capacity, dtype=np.int64)
+        self.last_seen = np.full(capacity, np.iinfo(np.int64).min, dtype=np.int64)
+        self.last_activity = np.full(capacity, -1, dtype=np.int8)
+        self.activity_changes = np.zeros(capacity, dtype=np.int64)
+        # signal -> (fast mean, slow mean, slow variance, finite samples)
+        self.signals = {name: np.zeros((4, capacity)) for name in SIGNALS}
+        # rate -> (fast, slow)
+        self.rates = {name: np.zeros((2, capacity)) for name in RATES}
+        self.last_alert = np.full((len(ALERT_KINDS), capacity), np.iinfo(np.int64).min // 2, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.patient_ids)
+
+    def _grow(self, needed):
+        capacity = len(self.samples)
+        if needed <= capacity:
+            return
+        extra = max(needed, 2 * capacity) - capacity
+
+        def pad(values, fill):
+            shape = values.shape[:-1] + (extra,)
+            return np.concatenate([values, np.full(shape, fill, dtype=values.dtype)], axis=-1)
+
+        self.samples = pad(self.samples, 0)
+        self.last_seen = pad(self.last_seen, np.iinfo(np.int64).min)
+        self.last_activity = pad(self.last_activity, -1)
+        self.activity_changes = pad(self.activity_changes, 0)
+        self.signals = {name: pad(values, 0.0) for name, values in self.signals.items()}
+        self.rates = {name: pad(values, 0.0) for name, values in self.rates.items()}
+        self.last_alert = pad(self.last_alert, np.iinfo(np.int64).min // 2)
+
+    def _slots_for(self, patient_ids):
+        # Hash lookup of the batch's distinct IDs against every known patient;
+        # unseen patients get the next free slots
+        codes, uniques = pd.factorize(patient_ids)
+        slots = self._known.get_indexer(uniques)
+        new = slots < 0
+        if new.any():
+            first = len(self.patient_ids)
+            slots[new] = np.arange(first, first + new.sum())
+            self.patient_ids.extend(uniques[new])
+            self._known = self._known.append(pd.Index(uniques[new], dtype=object))
+            self._grow(len(self.patient_ids))
+        return slots[codes]
+
+    def prime(self, store):
+        """Apply the stored rows of a HarStore in time order without raising
+        alerts, so live rows start from each patient's history."""
+        replay(store, self, alert=False)
+        return self
+
+    def update_frame(self, frame):
+        """Apply a batch of rows in the HAR CSV layout, raw or typed; returns new alerts."""
+        if not pd.api.types.is_datetime64_any_dtype(frame["Timestamp"]):
+            frame = sud_data.apply_schema(frame, sud_data.HAR_SCHEMA)
+        return self.update(
+            frame["Patient_ID"].to_numpy(dtype=object),
+            frame["Timestamp"].to_numpy(dtype="datetime64[ns]").astype(np.int64),
+            pd.Categorical(frame["Activity"], categories=ACTIVITIES).codes.astype(np.int8),
+            frame[["X_accel", "Y_accel", "Z_accel"]].to_numpy(dtype=np.float64),
+            frame["Heart_Rate"].to_numpy(dtype=np.float64),
+            np.asarray(frame["Relapse_Indicator"]).astype(str) == "Yes",
+        )
+
+    def update(self, patient_ids, timestamps, activity_codes, accel, heart_rate, relapse, alert=True):
+        """Apply one micro-batch given as column arrays (timestamps as int64 ns,
+        accel as an (n, 3) array); returns the alerts it raised. Rows at or
+        before a patient's last applied row are dropped."""
+        start = time.perf_counter()
+        with self._lock:
+            rows_before = self.rows
+            slots = self._slots_for(patient_ids)
+            # Rows of one patient must be applied in time order, so the batch is
+            # split into rounds: round r holds each patient's r-th row, and within
+            # a round every slot appears at most once
+            order = np.lexsort((timestamps, slots))
+            slots = slots[order]
+            first = np.r_[True, slots[1:] != slots[:-1]]
+            group_start = np.maximum.accumulate(np.where(first, np.arange(len(slots)), 0))
+            rank = np.arange(len(slots)) - group_start
+            values = {
+                "heart_rate": heart_rate[order],
+                "accel_magnitude": np.sqrt((accel[order] ** 2).sum(axis=1)),
+            }
+            timestamps, activity_codes, relapse = timestamps[order], activity_codes[order], relapse[order]
+
+            alerts = []
+            for r in range(int(rank.max()) + 1 if len(rank) else 0):
+                rows = np.flatnonzero(rank == r)
+                alerts += self._apply(slots[rows], timestamps[rows], activity_codes[rows],
+                                      {name: v[rows] for name, v in values.items()}, relapse[rows], alert)
+            self.alerts.extend(alerts)
+            applied = self.rows - rows_before
+
+        metrics.observe("thrive_har_batch_seconds", time.perf_counter() - start)
+        metrics.inc("thrive_har_rows_total", applied)
+        for alert in alerts:
+            metrics.inc("thrive_har_alerts_total", kind=alert["kind"])
+        return alerts
+
+    def _apply(self, slots, timestamps, activity_codes, values, relapse, alert=True):
+        # One row per slot. Stale rows would corrupt the averages and, being
+        # earlier than the last alert, hold back real alerts for a cooldown
+        fresh = timestamps > self.last_seen[slots]
+        if not fresh.all():
+            slots, timestamps, activity_codes, relapse = slots[fresh], timestamps[fresh], activity_codes[fresh], relapse[fresh]
+            values = {name: x[fresh] for name, x in values.items()}
+        self.rows += len(slots)
+
+        n = self.samples[slots] + 1
+        self.samples[slots] = n
+        fast, slow, warm = self._weights(n)
+
+        scores = {}
+        for name, x in values.items():
+            # A missing reading (NaN from the CSV) would poison the averages for
+            # good, so it leaves this signal's state as it was
+            finite = np.isfinite(x)
+            scores[name] = np.zeros(len(slots))
+            if finite.all():
+                scores[name] = self._apply_signal(self.signals[name], slots, x)
+            elif finite.any():
+                scores[name][finite] = self._apply_signal(self.signals[name], slots[finite], x[finite])
+
+        changed = (self.last_activity[slots] >= 0) & (self.last_activity[slots] != activity_codes)
+        self.activity_changes[slots] += changed
+        self.last_activity[slots] = activity_codes
+        self.last_seen[slots] = timestamps
+        for name, x in (("relapse_indicator", relapse), ("activity_changes", changed)):
+            state = self.rates[name]
+            state[0, slots] += fast * (x - state[0, slots])
+            scores[name] = np.where(warm, state[0, slots] - state[1, slots], 0.0)
+            state[1, slots] += slow * (x - state[1, slots])
+
+        alerts = []
+        if not alert:
+            return alerts
+        for k, kind in enumerate(ALERT_KINDS):
+            if kind in self.signals:
+                due = np.abs(scores[kind]) >= self.z_alert
+            else:
+                due = scores[kind] >= self.rate_shift
+            due &= timestamps - self.last_alert[k, slots] >= self.cooldown
+            for i in np.flatnonzero(due):
+                slot = slots[i]
+                self.last_alert[k, slot] = timestamps[i]
+                alerts.append(self._alert(kind, slot, timestamps[i], scores[kind][i]))
+        return alerts
+
+    def _weights(self, n):
+        # Early on the weights fall back to 1/n, so the averages start as
+        # plain means instead of being pulled towards zero
+        return np.maximum(self.fast_alpha, 1.0 / n), np.maximum(self.slow_alpha, 1.0 / n), n > self.warmup
+
+    def _apply_signal(self, state, slots, x):
+        # Fold one finite sample per slot into a signal; returns the scores
+        n = state[3, slots] + 1
+        state[3, slots] = n
+        fast, slow, warm = self._weights(n)
+        state[0, slots] += fast * (x - state[0, slots])
+        mean, var = state[1, slots], state[2, slots]
+        # Compare against the baseline before this sample is folded in
+        score = np.where(warm, (state[0, slots] - mean) / np.sqrt(var + 1e-6), 0.0)
+        # Once warm, a sample's pull on the baseline is capped, so a sudden
+        # change is not absorbed into the baseline before it can raise an alert
+        limit = BASELINE_CLIP * np.sqrt(var)
+        delta = np.where(warm, np.clip(x - mean, -limit, limit), x - mean)
+        state[1, slots] = mean + slow * delta
+        state[2, slots] = (1 - slow) * (var + slow * delta * delta)
+        return score
+
+    def _alert(self, kind, slot, timestamp, score):
+        if kind in self.signals:
+            fast, mean, var = self.signals[kind][:3, slot]
+            message = (f"{kind.replace('_', ' ')} {'above' if score > 0 else 'below'} baseline: "
+                       f"{fast:.1f} vs {mean:.1f} ± {np.sqrt(var):.1f}")
+        else:
+            fast, slow = self.rates[kind][:, slot]
+            message = f"{kind.replace('_', ' ')} rate up: {fast:.0%} of recent minutes vs {slow:.0%} usually"
+        return {"Patient_ID": self.patient_ids[slot], "Timestamp": pd.Timestamp(int(timestamp)),
+                "kind": kind, "score": round(float(score), 2), "message": message}
+
+    def snapshot(self):
+        """Current state of every patient, one row each, largest heart-rate drift first."""
+        with self._lock:
+            count = len(self.patient_ids)
+            out = {"Patient_ID": np.asarray(self.patient_ids, dtype=object),
+                   "Samples": self.samples[:count].copy(),
+                   "Last_Seen": pd.to_datetime(self.last_seen[:count])}
+            for name, state in self.signals.items():
+                out[f"{name}_recent"] = state[0, :count].copy()
+                out[f"{name}_baseline"] = state[1, :count].copy()
+                out[f"{name}_z"] = (state[0, :count] - state[1, :count]) / np.sqrt(state[2, :count] + 1e-6)
+            for name, state in self.rates.items():
+                out[f"{name}_recent"] = state[0, :count].copy()
+                out[f"{name}_baseline"] = state[1, :count].copy()
+            out["Activity_Changes"] = self.activity_changes[:count].copy()
+        frame = pd.DataFrame(out)
+        return frame.iloc[np.argsort(-np.abs(frame["heart_rate_z"].to_numpy()), kind="stable")]
+
+    def recent_alerts(self, limit=50):
+        with self._lock:
+            return list(self.alerts)[-limit:][::-1]
+
+
+def replay(store, monitor, alert=True):
+    """Apply the rows of a HarStore to a monitor one timestamp at a time, in
+    time order; `alert=False` applies them without raising alerts."""
+    order = np.argsort(store.timestamps, kind="stable")
+    times = store.timestamps[order]
+    bounds = np.flatnonzero(np.r_[True, times[1:] != times[:-1], True])
+    activity = np.array([ACTIVITIES.index(a) if a in ACTIVITIES else -1 for a in store.activities], dtype=np.int8)
+    accel = np.column_stack([store.sensors[c] for c in ("X_accel", "Y_accel", "Z_accel")]).astype(np.float64)
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        rows = order[begin:end]
+        monitor.update(store.patient_ids[store.codes[rows]], store.timestamps[rows].astype(np.int64),
+                       activity[store.activity_codes[rows]], accel[rows],
+                       store.sensors["Heart_Rate"][rows].astype(np.float64), store.relapse[rows], alert)
+    return monitor
+
+
+def main():
+    import synthetic_cohort
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--minutes", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # A generated cohort, delivered one minute (one row per wearable) at a time
+    rng = np.random.default_rng(args.seed)
+    raw = synthetic_cohort.har_chunk(rng, 0, args.patients, args.minutes,
+                                     synthetic_cohort.timestamp_strings(args.minutes))
+    har = sud_data.apply_schema(raw, sud_data.HAR_SCHEMA)
+    batches = [frame for _, frame in har.groupby("Timestamp", sort=True)]
+
+    monitor = HarMonitor(capacity=args.patients)
+    latencies = []
+    alerts = 0
+    for batch in batches:
+        t = time.perf_counter()
+        alerts += len(monitor.update_frame(batch))
+        latencies.append((time.perf_counter() - t) * 1000)
+    latencies.sort()
+    total = sum(latencies) / 1000
+    print(f"{monitor.rows} rows from {len(monitor)} wearables in {len(batches)} batches: "
+          f"{monitor.rows / total:.0f} rows/s, batch p50 {latencies[len(latencies) // 2]:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:.2f} ms, {alerts} alerts")
+
+
+if __name__ == "__main__":
+    main()
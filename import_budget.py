@@ -0,0 +1,148 @@
+"""Import-time report and startup budget check for the Streamlit entry points.
+
+    python import_budget.py                   # print the report
+    python import_budget.py --json out.json   # also write it as JSON
+    python import_budget.py --check           # exit 1 if an entry point is over budget
+    THRIVE_IMPORT_BUDGET=1 python -m pytest tests/test_import_budget.py   # the same, as a test
+
+Startup cost is the module-level imports every worker pays when it loads the
+script. Imports inside functions are reported separately, per function, as
+the extra cost the first time that page is opened.
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ENTRY_POINTS = ["thriveapp.py", "turbo.py", "anchor.py", "app.py"]
+
+# Startup budget per entry point, in milliseconds of module-level import time
+BUDGET_MS = {
+    "thriveapp.py": 1500,
+    "turbo.py": 800,
+    "anchor.py": 800,
+    "app.py": 800,
+}
+RUNS = 3
+
+
+def _module_name(node):
+    if isinstance(node, ast.Import):
+        return [alias.name for alias in node.names]
+    if node.level == 0 and node.module:
+        return [node.module]
+    return []
+
+
+def collect_imports(path):
+    """Module-level imports of a script, and deferred imports per top-level function."""
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+    startup, deferred = [], {}
+
+    def visit(node, owner):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                visit(child, owner or child.name)
+            elif isinstance(child, (ast.Import, ast.ImportFrom)):
+                target = startup if owner is None else deferred.setdefault(owner, [])
+                target.extend(m for m in _module_name(child) if m not in target)
+            else:
+                visit(child, owner)
+
+    visit(tree, None)
+    return startup, deferred
+
+
+def _parse_importtime(stderr):
+    # Lines look like "import time:  self |  cumulative | <indent>name" and are printed
+    # when an import finishes; top-level imports have a single space of indent.
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.startswith(" ") and not name.startswith("  "):
+            modules.append((name.strip(), int(cumulative) / 1000.0))
+    return modules
+
+
+def measure(preload, modules, runs=RUNS):
+    """Milliseconds spent importing `modules` after `preload` is already imported (best of `runs`)."""
+    code = "; ".join(f"import {m}" for m in preload + modules)
+    roots = {m.split(".")[0] for m in modules}
+    best = None
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {"ms": None, "modules": {}, "error": proc.stderr.strip().splitlines()[-1]}
+        timings = _parse_importtime(proc.stderr)
+        # Skip interpreter startup and the preloaded imports; modules already loaded
+        # are not reported again, so shared dependencies count once
+        loaded = [i for i, (name, _) in enumerate(timings) if name in preload]
+        own = {name: ms for name, ms in timings[max(loaded, default=-1) + 1:] if name.split(".")[0] in roots}
+        total = sum(own.values())
+        if best is None or total < best[0]:
+            best = (total, own)
+    return {"ms": round(best[0], 1), "modules": {k: round(v, 1) for k, v in sorted(best[1].items(), key=lambda kv: -kv[1])}}
+
+
+def entry_report(entry):
+    startup_modules, deferred = collect_imports(os.path.join(ROOT, entry))
+    startup = measure([], startup_modules)
+    report = {
+        "startup_ms": startup["ms"],
+        "budget_ms": BUDGET_MS.get(entry),
+        "modules": startup["modules"],
+        "pages": {},
+    }
+    if "error" in startup:
+        report["error"] = startup["error"]
+    for owner, modules in deferred.items():
+        extra = [m for m in modules if m not in startup_modules]
+        if extra:
+            report["pages"][owner] = measure(startup_modules, extra)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--check", action="store_true", help="fail when an entry point exceeds its budget")
+    parser.add_argument("entries", nargs="*", default=ENTRY_POINTS)
+    args = parser.parse_args()
+
+    reports = {entry: entry_report(entry) for entry in args.entries}
+    failures = []
+    for entry, report in reports.items():
+        budget = report["budget_ms"]
+        if "error" in report:
+            status = f"ERROR {report['error']}"
+            failures.append(entry)
+        elif budget is not None and report["startup_ms"] > budget:
+            status = "OVER BUDGET"
+            failures.append(entry)
+        else:
+            status = "ok"
+        print(f"{entry}: startup {report['startup_ms']} ms (budget {budget} ms) {status}")
+        for name, ms in list(report["modules"].items())[:5]:
+            print(f"    {ms:8.1f} ms  {name}")
+        for owner, page in report["pages"].items():
+            if "error" in page:
+                print(f"  + {owner}: not measured ({page['error']})")
+            else:
+                print(f"  + {owner}: {page['ms']} ms on first use")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
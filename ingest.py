@@ -0,0 +1,457 @@
+"""Incremental ingestion of rows appended to the SUD and HAR source CSVs.
+
+Each source has a watermark in CACHE_DIR/ingest/<source>/manifest.json: the
+byte offset up to which the file has been ingested, with digests of the
+file's first bytes and of the bytes just before that offset, and a running
+digest of every byte up to it that goes into the data version. A file that was
+rewritten rather than appended to fails those checks and is loaded again in
+full. Ingested rows are stored as column-cache parts (see
+sud_data.write_cache): one part per ingest, merged into one when there are
+too many.
+
+A refresh parses only the complete lines past the offset, validates them
+against what is already loaded, appends them to the in-memory tables and
+publishes a new data version. Values derived from the data are updated from
+each batch of new rows instead of being rebuilt (Dataset.derive). Workers on
+one host share the parts, so rows ingested by one are read by the others
+from disk rather than parsed again.
+
+    python ingest.py               # ingest what was appended since the last run
+    python ingest.py --watch 60    # and keep checking every minute
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+import warnings
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import sud_data
+from har_store import HarStore, combine_features
+
+try:
+    import fcntl
+except ImportError:  # no cross-process lock; one worker per host
+    fcntl = None
+
+INGEST_DIR = os.path.join(sud_data.CACHE_DIR, "ingest")
+
+# Seconds between checks of the source files in the background
+WATCH_INTERVAL = float(os.getenv("THRIVE_INGEST_INTERVAL", "60"))
+
+# Bytes parsed at a time, so a long backlog is not read into memory at once
+READ_BYTES = 64 << 20
+# Bytes hashed at the start of a file and just before its watermark
+HEAD_BYTES = 64 << 10
+TAIL_BYTES = 4 << 10
+# Parts kept before they are merged into one
+MAX_PARTS = 64
+# Builds of a Derived value raced by a refresh before one is run under the lock
+BUILD_ATTEMPTS = 3
+
+# One published batch of new rows: `sud` and `har` are typed frames of the
+# rows added and `patients` the IDs whose per-patient row changed. After a
+# source was rewritten and loaded again, `reset` is set, the frames are None
+# and everything derived from the data has to be rebuilt.
+Delta = namedtuple("Delta", "version sud har patients reset")
+
+
+def _digest(f, start, end):
+    # Hashed a block at a time, so a first run does not read the whole file at once
+    digest = hashlib.sha256()
+    f.seek(start)
+    while start < end:
+        block = f.read(min(end - start, READ_BYTES))
+        if not block:
+            break
+        digest.update(block)
+        start += len(block)
+    return digest.hexdigest()
+
+
+def _line_end(f, start, end):
+    # Offset just past the last newline in [start, end), or `start` if there is none
+    while end > start:
+        block_start = max(start, end - READ_BYTES)
+        f.seek(block_start)
+        newline = f.read(end - block_start).rfind(b"\n")
+        if newline >= 0:
+            return block_start + newline + 1
+        end = block_start
+    return start
+
+
+@contextlib.contextmanager
+def _locked(path):
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+class Source:
+    """One append-only CSV: its watermark and the stored parts holding its rows.
+
+    Callers hold `lock()` around ingest() and read().
+    """
+
+    def __init__(self, name, path, schema, state_dir=INGEST_DIR):
+        self.name = name
+        self.path = path
+        self.schema = schema
+        self.dir = os.path.join(state_dir, name)
+        os.makedirs(self.dir, exist_ok=True)
+
+    def lock(self):
+        return _locked(os.path.join(self.dir, "lock"))
+
+    def manifest(self):
+        try:
+            with open(os.path.join(self.dir, "manifest.json")) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (manifest["schema_version"] != sud_data.SCHEMA_VERSION or manifest["path"] != os.path.abspath(self.path)
+                or "digest" not in manifest):
+            return None
+        return manifest
+
+    def _save(self, manifest):
+        path = os.path.join(self.dir, "manifest.json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, path)
+        # Parts of older epochs and parts merged by a compaction
+        listed = {part["name"] for part in manifest["parts"]}
+        for entry in os.listdir(self.dir):
+            if entry[0].isdigit() and entry not in listed:
+                shutil.rmtree(os.path.join(self.dir, entry), ignore_errors=True)
+
+    def _parse(self, f, start, end, columns):
+        # Typed rows of the lines in [start, end), parsed block by block
+        frames = []
+        while start < end:
+            stop = _line_end(f, start, min(end, start + READ_BYTES)) if end - start > READ_BYTES else end
+            f.seek(start)
+            frames.append(sud_data.parse_rows(f.read(stop - start), self.schema, columns))
+            start = stop
+        if not frames:
+            return sud_data.parse_rows(b"", self.schema, columns)
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+    def _add_part(self, manifest, rows):
+        start = manifest["rows"]
+        name = f"{manifest['epoch']:04d}-{start:012d}-{len(rows):012d}"
+        sud_data.write_cache(rows, self.schema, os.path.join(self.dir, name))
+        manifest["parts"].append({"name": name, "start": start, "rows": len(rows)})
+        manifest["rows"] = start + len(rows)
+
+    def ingest(self, validate):
+        """Store the complete lines appended since the watermark that pass
+        `validate(rows)`, or everything if the file was rewritten. Returns
+        whether the watermark moved."""
+        manifest = self.manifest()
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if manifest is not None and (
+                    size < manifest["offset"]
+                    or _digest(f, 0, min(manifest["offset"], HEAD_BYTES)) != manifest["head"]
+                    or _digest(f, max(0, manifest["offset"] - TAIL_BYTES), manifest["offset"]) != manifest["tail"]):
+                manifest = None
+            if manifest is None:
+                # First run, or the file no longer starts with what was ingested
+                epochs = [int(entry.split("-")[0]) for entry in os.listdir(self.dir) if entry[0].isdigit()]
+                header = f.readline()
+                manifest = {
+                    "schema_version": sud_data.SCHEMA_VERSION, "path": os.path.abspath(self.path),
+                    "columns": header.decode().strip().split(","), "offset": len(header),
+                    "epoch": max(epochs, default=0) + 1, "rows": 0, "parts": [],
+                    "digest": hashlib.sha256(header).hexdigest(),
+                }
+                validate = None
+            start = manifest["offset"]
+            # A row still being written is left for the next refresh
+            end = _line_end(f, start, size)
+            if end == start and manifest["parts"]:
+                return False
+
+            with metrics.timed("thrive_ingest", table=self.name):
+                parsed = self._parse(f, start, end, manifest["columns"])
+                rows = parsed if validate is None else validate(parsed)
+                metrics.inc("thrive_ingest_rows_total", len(rows), table=self.name, result="accepted")
+                metrics.inc("thrive_ingest_rows_total", len(parsed) - len(rows), table=self.name, result="rejected")
+                if len(rows) or not manifest["parts"]:
+                    self._add_part(manifest, rows)
+                if len(manifest["parts"]) > MAX_PARTS:
+                    rows = self.read(manifest, 0)
+                    manifest["parts"], manifest["rows"] = [], 0
+                    self._add_part(manifest, rows)
+                # Chained, so only the new bytes are hashed
+                manifest["digest"] = hashlib.sha256(f"{manifest['digest']}{_digest(f, start, end)}".encode()).hexdigest()
+                manifest["offset"] = end
+                manifest["head"] = _digest(f, 0, min(end, HEAD_BYTES))
+                manifest["tail"] = _digest(f, max(0, end - TAIL_BYTES), end)
+                self._save(manifest)
+        return True
+
+    def read(self, manifest, after=0):
+        """Typed rows stored from row number `after` on; numeric columns are memory-mapped."""
+        parts = [part for part in manifest["parts"] if part["start"] + part["rows"] > after] or manifest["parts"][-1:]
+        frames = [sud_data.read_cache(os.path.join(self.dir, part["name"])).iloc[max(0, after - part["start"]):]
+                  for part in parts]
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+class Derived:
+    """A value computed from a Dataset and kept current as rows are added.
+
+    `value` is replaced on each published Delta by `update(value, delta)`.
+    After a source was reloaded in full, or an update failed, it is rebuilt
+    with `build(dataset)` the next time it is read. Builds run outside the
+    dataset lock, so a slow one does not hold up refreshes or other readers;
+    one that raced a refresh is run again.
+    """
+
+    def __init__(self, dataset, build, update=None):
+        self.dataset = dataset
+        self.build = build
+        self.update = update
+        self._value = None
+        self._stale = True
+        self._build_lock = threading.Lock()
+
+    @property
+    def value(self):
+        if self._stale:
+            with self._build_lock:
+                if self._stale:
+                    self._rebuild()
+        return self._value
+
+    def _rebuild(self):
+        dataset = self.dataset
+        for _ in range(BUILD_ATTEMPTS):
+            version = dataset.version
+            value = self.build(dataset)
+            with dataset._lock:
+                # Deltas published during the build were skipped while stale;
+                # the build saw them only if the version did not move
+                if dataset.version == version:
+                    self._value, self._stale = value, False
+                    return
+        # Refreshes keep landing mid-build: build once with them held off
+        with dataset._lock:
+            self._value, self._stale = self.build(dataset), False
+
+    def __call__(self, delta):
+        # Runs under the dataset lock
+        if self._stale:
+            return
+        if self.update is not None and not delta.reset:
+            try:
+                self._value = self.update(self._value, delta)
+                return
+            except Exception as e:
+                warnings.warn(f"incremental update failed, rebuilding: {e!r}")
+        self._stale = True
+
+
+class Dataset:
+    """The SUD table, the HAR rows as a HarStore and their per-patient join,
+    kept current with rows appended to the source CSVs.
+
+    `sud`, `har` and patients() are replaced, never modified, when rows are
+    added, so a reader holding one keeps a consistent view. `version`
+    identifies the rows loaded so far.
+    """
+
+    def __init__(self, sud_path=sud_data.SUD_CSV, har_path=sud_data.HAR_CSV, state_dir=INGEST_DIR):
+        self.sources = {
+            "sud": Source("sud", sud_path, sud_data.SUD_SCHEMA, state_dir),
+            "har": Source("har", har_path, sud_data.HAR_SCHEMA, state_dir),
+        }
+        self.sud = None
+        self.har = None
+        self.version = None
+        self._features = None   # HAR features of every patient with rows, by Patient_ID
+        self._patients = None
+        self._loaded = {}       # source name -> (epoch, rows, digest) in memory
+        self._empty = {}        # source name -> typed frame with no rows
+        self._subscribers = []
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._watcher = None
+        self.refresh()
+
+    # Validation of appended rows against what is already loaded
+
+    def _valid_sud(self, rows):
+        # One row per patient; later rows for an enrolled patient are dropped
+        ids = pd.Index(rows["Patient_ID"], dtype=object)
+        ok = ~ids.isna() & ~ids.isin(pd.Index(self.sud["Patient_ID"], dtype=object)) & ~ids.duplicated()
+        return rows[ok].reset_index(drop=True)
+
+    def _valid_har(self, rows):
+        # Each patient's readings only move forward in time; rows at or before
+        # the patient's newest stored reading are repeats or arrived too late
+        rows = rows[(rows["Patient_ID"].notna() & rows["Timestamp"].notna()).to_numpy()]
+        timestamps = rows["Timestamp"].to_numpy(dtype="datetime64[ns]")
+        latest = self.har.latest(rows["Patient_ID"])
+        ok = np.isnat(latest) | (timestamps > latest)
+        rows = rows[ok]
+        return rows[~rows.duplicated(["Patient_ID", "Timestamp"]).to_numpy()].reset_index(drop=True)
+
+    # Loading
+
+    def _catch_up(self, source):
+        # Load rows stored since the last call, by this or another worker, into
+        # memory; returns them and whether the table was loaded from scratch
+        manifest = source.manifest()
+        if manifest is None:
+            return None, False
+        loaded = self._loaded.get(source.name)
+        reset = loaded is None or loaded[0] != manifest["epoch"]
+        if not reset and loaded[1] == manifest["rows"]:
+            return None, False
+        rows = source.read(manifest, 0 if reset else loaded[1])
+        self._loaded[source.name] = (manifest["epoch"], manifest["rows"], manifest["digest"])
+        if reset:
+            self._empty[source.name] = rows.iloc[:0]
+        if source.name == "sud":
+            self.sud = rows if reset else pd.concat([self.sud, rows], ignore_index=True)
+        else:
+            self.har = HarStore(rows) if reset else self.har.appended(rows)
+        return rows, reset
+
+    def refresh(self):
+        """Ingest rows appended to the source files and publish them.
+
+        Returns the published Delta, or None if there was nothing new.
+        """
+        with self._lock:
+            added, reset = {}, False
+            for name, source in self.sources.items():
+                validate = self._valid_sud if name == "sud" else self._valid_har
+                with source.lock():
+                    # Rows other workers stored come first, so new rows are
+                    # validated against them
+                    batches = [self._catch_up(source)]
+                    if source.ingest(validate):
+                        batches.append(self._catch_up(source))
+                for rows, reloaded in batches:
+                    reset = reset or reloaded
+                    if rows is not None and not reloaded:
+                        added.setdefault(name, []).append(rows)
+            if not added and not reset:
+                return None
+
+            if reset:
+                sud_rows = har_rows = None
+                features = self.har.patient_features()
+                self._features = features.set_index("Patient_ID")
+                self._patients = pd.merge(self.sud, features, on="Patient_ID", how="inner")
+                touched = self._patients["Patient_ID"].to_numpy()
+            else:
+                sud_rows, har_rows = (pd.concat(added[name], ignore_index=True) if name in added else self._empty[name]
+                                      for name in ("sud", "har"))
+                touched = pd.unique(np.concatenate([sud_rows["Patient_ID"].to_numpy(dtype=object),
+                                                    har_rows["Patient_ID"].to_numpy(dtype=object)]))
+                self._update_patients(touched, har_rows)
+            # The source bytes, not just the row counts: two different appends
+            # of as many rows must not share a version
+            key = "|".join([str(sud_data.SCHEMA_VERSION)] + [f"{name}:{epoch}:{rows}:{digest}" for name, (epoch, rows, digest)
+                                                             in sorted(self._loaded.items())])
+            self.version = hashlib.sha256(key.encode()).hexdigest()[:16]
+            delta = Delta(self.version, sud_rows, har_rows, touched, reset)
+            for callback in list(self._subscribers):
+                try:
+                    callback(delta)
+                except Exception as e:
+                    warnings.warn(f"ingest subscriber failed: {e!r}")
+            return delta
+
+    def _update_patients(self, touched, har_rows):
+        # Features of the new sensor rows alone, folded into each patient's
+        # existing features; then the joined rows of the touched patients only
+        if len(har_rows):
+            self._features = combine_features(self._features, HarStore(har_rows).patient_features().set_index("Patient_ID"))
+        touched = pd.Index(touched, dtype=object)
+        sud_ids = pd.Index(self.sud["Patient_ID"], dtype=object)
+        changed = self.sud[sud_ids.isin(touched)].merge(self._features, left_on="Patient_ID", right_index=True)
+        kept = self._patients[~pd.Index(self._patients["Patient_ID"], dtype=object).isin(touched)]
+        combined = pd.concat([kept, changed], ignore_index=True)
+        # Same row order as a full merge, the SUD table's
+        order = sud_ids.get_indexer(pd.Index(combined["Patient_ID"], dtype=object))
+        self._patients = combined.iloc[np.argsort(order, kind="stable")].reset_index(drop=True)
+
+    def patients(self):
+        """One row per patient: the SUD columns joined with the HAR feature table."""
+        return self._patients
+
+    def snapshot(self):
+        """(version, patients()) read together, so the rows match the version."""
+        with self._lock:
+            return self.version, self._patients
+
+    # Publishing
+
+    def subscribe(self, callback):
+        """Call `callback(delta)` after each refresh that added rows."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def derive(self, build, update=None):
+        """A Derived value built now and kept current from then on; no Delta
+        is missed between the build and the first update."""
+        derived = Derived(self, build, update)
+        with self._lock:
+            self._subscribers.append(derived)
+        derived.value  # built here, outside the lock
+        return derived
+
+    def watch(self, interval=WATCH_INTERVAL):
+        """Refresh every `interval` seconds in a background thread."""
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True, name="thrive-ingest")
+            self._watcher.start()
+        return self
+
+    def _watch(self, interval):
+        while not self._stopped.wait(interval):
+            try:
+                self.refresh()
+            except Exception as e:  # a bad file must not stop later refreshes
+                warnings.warn(f"ingest failed: {e!r}")
+
+    def stop(self):
+        self._stopped.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sud", default=sud_data.SUD_CSV)
+    parser.add_argument("--har", default=sud_data.HAR_CSV)
+    parser.add_argument("--watch", type=float, metavar="SECONDS", help="keep checking for appended rows")
+    args = parser.parse_args()
+
+    dataset = Dataset(args.sud, args.har)
+    print(f"{len(dataset.sud)} patients, {len(dataset.har)} sensor rows, version {dataset.version}")
+    if args.watch:
+        dataset.subscribe(lambda delta: print(
+            f"version {delta.version}: reloaded, {len(dataset.sud)} patients, {len(dataset.har)} sensor rows"
+            if delta.reset else f"version {delta.version}: +{len(delta.sud)} patients, +{len(delta.har)} sensor rows, "
+            f"{len(delta.patients)} patients updated", flush=True))
+        dataset.watch(args.watch)
+        dataset._watcher.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+DEFAULT_MODEL = os.getenv("THRIVE_LLM_MODEL", "gemini-pro")
+MAX_CONCURRENCY = int(os.getenv("THRIVE_LLM_CONCURRENCY", 4))
+
+# Response cache
+CACHE_SIZE = 512
+CACHE_TTL_SECONDS = 6 * 60 * 60
+
+# Retry with exponential backoff and jitter on rate limits / transient errors
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+# How often an async request waiting for a free slot checks again
+SLOT_POLL_SECONDS = 0.05
+RETRYABLE_ERRORS = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError"}
+# The generated transport retries 503s on its own schedule; turned off so only
+# the retries above (or the caller's, with retries=0) are made
+NO_TRANSPORT_RETRY = {"request_options": {"retry": None}}
+
+
+def prompt_key(prompt, model_name):
+    """Cache key: hash of the model name and the whitespace/case-normalized prompt."""
+    normalized = " ".join(prompt.split()).casefold()
+    return hashlib.sha256(f"{model_name}\0{normalized}".encode()).hexdigest()
+
+
+def is_retryable(exc):
+    return type(exc).__name__ in RETRYABLE_ERRORS or getattr(exc, "code", None) in (429, 503)
+
+
+def backoff_delay(attempt):
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class ResponseCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL_SECONDS, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LLMClient:
+    """Shared text-generation client: one model instance, response cache, retries,
+    streaming and an asyncio path. At most `max_concurrency` requests are in
+    flight at once, counted across threads and event loops.
+
+    `model_factory(name)` builds the underlying model; it defaults to
+    genai.GenerativeModel and can be replaced with a fake in tests.
+    google.generativeai is only imported when the first default model is built.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL, model_factory=None, cache=None,
+                 max_concurrency=MAX_CONCURRENCY, max_retries=MAX_RETRIES):
+        self.model_name = model_name
+        self.model_factory = model_factory
+        self.cache = cache if cache is not None else ResponseCache()
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._options = {} if model_factory else NO_TRANSPORT_RETRY
+
+    @property
+    def model(self):
+        with self._model_lock:
+            if self._model is None:
+                factory = self.model_factory or _genai().GenerativeModel
+                self._model = factory(self.model_name)
+            return self._model
+
+    def _call(self, fn, method):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn()
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                metrics.inc("thrive_llm_retries_total", method=method)
+                time.sleep(backoff_delay(attempt))
+
+    def generate(self, prompt):
+        """Blocking generation, served from the cache when the same prompt was seen recently."""
+        key = prompt_key(prompt, self.model_name)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        with self._slots, metrics.timed("thrive_llm_request", method="generate"):
+            text = self._call(lambda: self.model.generate_content(prompt, **self._options), "generate").text
+        self.cache.put(key, text)
+        return text
+
+    def stream(self, prompt):
+        """Yield the response text as it arrives (suitable for st.write_stream)."""
+        key = prompt_key(prompt, self.model_name)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        parts = []
+        # The slot is held until the stream ends or the generator is closed
+        with self._slots, metrics.timed("thrive_llm_request", method="stream"):
+            response = self._call(lambda: self.model.generate_content(prompt, stream=True, **self._options), "stream")
+            for chunk in response:
+                parts.append(chunk.text)
+                yield chunk.text
+        self.cache.put(key, "".join(parts))
+
+    async def _acquire_slot(self):
+        # Polled rather than awaited in a thread, so a cancelled task never
+        # ends up holding a slot
+        while not self._slots.acquire(blocking=False):
+            await asyncio.sleep(SLOT_POLL_SECONDS)
+
+    async def agenerate(self, prompt, retries=None):
+        """Async generation sharing the client's concurrency limit. `retries`
+        overrides max_retries, e.g. 0 for callers that pace retries themselves."""
+        retries = self.max_retries if retries is None else retries
+        key = prompt_key(prompt, self.model_name)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        model = self.model
+        await self._acquire_slot()
+        try:
+            with metrics.timed("thrive_llm_request", method="agenerate"):
+                for attempt in range(retries + 1):
+                    try:
+                        # The REST transport used with a custom endpoint has no async client
+                        if hasattr(model, "generate_content_async") and not _settings.get("endpoint"):
+                            response = await model.generate_content_async(prompt, **self._options)
+                        else:
+                            response = await asyncio.to_thread(model.generate_content, prompt, **self._options)
+                        break
+                    except Exception as e:
+                        if attempt == retries or not is_retryable(e):
+                            raise
+                        metrics.inc("thrive_llm_retries_total", method="agenerate")
+                        await asyncio.sleep(backoff_delay(attempt))
+        finally:
+            self._slots.release()
+        self.cache.put(key, response.text)
+        return response.text
+
+    async def agenerate_many(self, prompts):
+        """Generate for many prompts concurrently; failures are returned as exception objects."""
+        return await asyncio.gather(*(self.agenerate(p) for p in prompts), return_exceptions=True)
+
+
+_client = None
+_client_lock = threading.Lock()
+_settings = {}
+_configured = False
+
+
+def configure(api_key, endpoint=os.getenv("THRIVE_LLM_ENDPOINT")):
+    """Record API settings; they are applied when the first model is built.
+
+    `endpoint` points the REST transport at another server, e.g. a local fake
+    for testing.
+    """
+    global _configured
+    with _client_lock:
+        _settings.update(api_key=api_key, endpoint=endpoint)
+        _configured = False
+
+
+def _genai():
+    # Deferred import: pages that never call the LLM do not pay for google.generativeai
+    global _configured
+    import google.generativeai as genai
+
+    with _client_lock:
+        if not _configured:
+            if _settings.get("endpoint"):
+                genai.configure(api_key=_settings.get("api_key"), transport="rest",
+                                client_options={"api_endpoint": _settings["endpoint"]})
+            else:
+                genai.configure(api_key=_settings.get("api_key"))
+            _configured = True
+    return genai
+
+
+def get_client():
+    """Process-wide shared client, so the model and cache survive Streamlit reruns."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+            metrics.register_collector("llm_response_cache", metrics.hit_miss_collector("llm_response", _client.cache))
+        return _client
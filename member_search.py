@@ -0,0 +1,234 @@
+"""Member directory search for Find Friends: type-ahead prefixes and misspellings.
+
+Every word of a member's name is a token. Tokens are kept in a sorted list,
+so the words starting with a prefix are one bisect away, and each token maps
+to the IDs of the members whose name contains it. Misspellings are found by
+generating the query word's single-edit variants (deletion, transposition,
+substitution, insertion) and looking those up, which needs no extra index.
+Private members are never returned, including members who turned private
+through another worker since the index was built: sync() follows the feed
+store's change sequence, not just new member IDs.
+
+    python member_search.py --members 1000000
+"""
+import argparse
+import random
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from itertools import chain, islice
+
+import metrics
+
+RESULTS = 10
+# Query words shorter than this are only matched as typed
+MIN_FUZZY_LENGTH = 4
+# Partial words matching more tokens than this are checked member by member
+# instead of being expanded
+MAX_PREFIX_TOKENS = 256
+# Candidate members checked one by one before intersecting with a second word
+MAX_CHECKED = 512
+
+WORD = re.compile(r"\w+")
+
+
+def tokenize(name):
+    return WORD.findall(name.casefold())
+
+
+class MemberIndex:
+    """In-memory token index over public member names, keyed by member ID."""
+
+    def __init__(self):
+        self._names = []        # member ID -> display name, None if private or unknown
+        self._postings = {}     # token -> member IDs whose name contains it
+        self._tokens = []       # every token, sorted
+        self._alphabet = set()
+        self._lock = threading.Lock()
+        self.synced = (-1, 0)   # (change, member ID) position reached in the store
+
+    # Updates
+
+    def add_many(self, members):
+        """Index (user_id, name, private) rows; a member added again replaces its
+        previous name and privacy. Words already in a superseded name stay in the
+        postings and are filtered out when searched."""
+        with self._lock:
+            new_tokens = []
+            for user_id, name, private in members:
+                if user_id >= len(self._names):
+                    self._names.extend([None] * (user_id + 1 - len(self._names)))
+                self._names[user_id] = None if private else name
+                if private:
+                    continue
+                for token in set(tokenize(name)):
+                    ids = self._postings.get(token)
+                    if ids is None:
+                        ids = self._postings[token] = array("i")
+                        new_tokens.append(token)
+                        self._alphabet.update(token)
+                    ids.append(user_id)
+            if len(new_tokens) > MAX_PREFIX_TOKENS:
+                self._tokens = sorted(self._postings)
+            else:
+                for token in new_tokens:
+                    insort(self._tokens, token)
+
+    def add(self, user_id, name, private=False):
+        self.add_many([(user_id, name, private)])
+
+    def sync(self, store):
+        """Index members added to or changed in `store` since the last sync,
+        by this or any other process; a single indexed range read."""
+        for batch in store.iter_users(after=self.synced):
+            self.add_many(row[1:] for row in batch)
+            self.synced = tuple(batch[-1][:2])
+        return self
+
+    @classmethod
+    def from_store(cls, store):
+        return cls().sync(store)
+
+    # Search
+
+    def _edits(self, word):
+        # The word itself plus every variant one edit away
+        splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+        variants = {word}
+        variants.update(a + b[1:] for a, b in splits if b)
+        variants.update(a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1)
+        variants.update(a + c + b[1:] for a, b in splits if b for c in self._alphabet)
+        variants.update(a + c + b for a, b in splits for c in self._alphabet)
+        return variants
+
+    def _prefixed(self, prefix):
+        i = bisect_left(self._tokens, prefix)
+        while i < len(self._tokens) and self._tokens[i].startswith(prefix):
+            yield self._tokens[i]
+            i += 1
+
+    def _word_tokens(self, word, partial, fuzzy):
+        """Indexed tokens matching one query word. The last word of a query is
+        `partial` and also matches as a prefix; None means that prefix is too
+        common to expand and has to be checked member by member."""
+        variants = self._edits(word) if fuzzy else [word]
+        whole = sorted(v for v in variants if v in self._postings)
+        if not partial:
+            return whole
+        tokens = set()
+        for variant in variants:
+            tokens.update(islice(self._prefixed(variant), MAX_PREFIX_TOKENS + 1 - len(tokens)))
+            if len(tokens) > MAX_PREFIX_TOKENS:
+                # Misspelled prefixes this common are matched as whole words only
+                return whole if fuzzy else None
+        return sorted(tokens)
+
+    def _candidates(self, words, token_lists):
+        # Members, possibly stale or repeated, of the query word with the fewest;
+        # the caller checks each one against every word and stops at the limit
+        sizes = sorted((sum(len(self._postings[t]) for t in tokens), i)
+                       for i, tokens in enumerate(token_lists) if tokens is not None)
+        if not sizes:
+            # Only a common prefix: walk its tokens lazily
+            return (user_id for token in self._prefixed(words[0]) for user_id in self._postings[token])
+        smallest = [self._postings[t] for t in token_lists[sizes[0][1]]]
+        if len(sizes) > 1 and sizes[0][0] > MAX_CHECKED:
+            # Checking this many names one by one is slower than a set intersection
+            second = [self._postings[t] for t in token_lists[sizes[1][1]]]
+            return sorted(set(chain.from_iterable(smallest)).intersection(chain.from_iterable(second)))
+        return chain.from_iterable(smallest)
+
+    def _still_matches(self, user_id, words, token_sets):
+        # Postings are never rewritten, so check against the member's current name
+        name = self._names[user_id]
+        if name is None:
+            return False
+        tokens = tokenize(name)
+        for word, allowed in zip(words, token_sets):
+            if allowed is None:
+                if not any(t.startswith(word) for t in tokens):
+                    return False
+            elif allowed.isdisjoint(tokens):
+                return False
+        return True
+
+    def search(self, query, limit=RESULTS):
+        """Up to `limit` public members matching `query`: names whose words start
+        with the typed words first, then names one edit away from them."""
+        words = tokenize(query)
+        if not words:
+            return []
+        results = []
+        seen = set()
+        with metrics.timed("thrive_member_search"), self._lock:
+            passes = [False]
+            if all(len(w) >= MIN_FUZZY_LENGTH for w in words):
+                passes.append(True)
+            for fuzzy in passes:
+                token_lists = [self._word_tokens(w, i == len(words) - 1, fuzzy) for i, w in enumerate(words)]
+                token_sets = [None if tokens is None else set(tokens) for tokens in token_lists]
+                for user_id in self._candidates(words, token_lists):
+                    if user_id in seen or not self._still_matches(user_id, words, token_sets):
+                        continue
+                    seen.add(user_id)
+                    results.append({"user_id": user_id, "name": self._names[user_id]})
+                    if len(results) == limit:
+                        return results
+        return results
+
+
+def synthetic_names(count, seed=0):
+    """Varied made-up names, so the vocabulary grows with the member count."""
+    rng = random.Random(seed)
+    syllables = ["al", "an", "ar", "be", "bri", "ca", "da", "del", "el", "en", "fa", "ga", "ha", "is", "ja",
+                 "ka", "la", "lo", "ma", "mi", "na", "no", "or", "pa", "ra", "ri", "sa", "son", "ta", "ton",
+                 "va", "wen", "ya", "za"]
+
+    def word(low, high):
+        return "".join(rng.choice(syllables) for _ in range(rng.randint(low, high))).capitalize()
+
+    return [f"{word(2, 3)} {word(2, 4)}" for _ in range(count)]
+
+
+def misspell(word, rng):
+    i = rng.randrange(len(word))
+    return word[:i] + rng.choice("aeioulnrst") + word[i + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    names = synthetic_names(args.members, args.seed)
+    index = MemberIndex()
+    start = time.perf_counter()
+    index.add_many((user_id, name, user_id % 10 == 0) for user_id, name in enumerate(names, start=1))
+    print(f"Indexed {args.members} members ({len(index._tokens)} distinct words) "
+          f"in {time.perf_counter() - start:.1f} s")
+
+    rng = random.Random(args.seed + 1)
+    for kind in ("prefix", "two words", "misspelled"):
+        latencies = []
+        for _ in range(args.queries):
+            first, last = rng.choice(names).lower().split()
+            if kind == "prefix":
+                query = first[:rng.randint(1, len(first))]
+            elif kind == "two words":
+                query = f"{first} {last[:rng.randint(1, len(last))]}"
+            else:
+                query = misspell(last, rng)
+            t = time.perf_counter()
+            index.search(query)
+            latencies.append((time.perf_counter() - t) * 1000)
+        latencies.sort()
+        print(f"{kind:>10}: p50 {latencies[len(latencies) // 2]:.2f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)]:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
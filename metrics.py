@@ -0,0 +1,453 @@
+"""Process-wide metrics for the Streamlit apps, in Prometheus text format.
+
+Metrics are always recorded in memory. They are exported only when configured:
+
+    THRIVE_METRICS_PORT=9464      serve http://127.0.0.1:9464/metrics
+    THRIVE_METRICS_FILE=app.prom  rewrite this file every THRIVE_METRICS_INTERVAL
+                                  seconds (node_exporter textfile collector)
+
+Opt-in sampling profiler: with THRIVE_PROFILE_SLOW_MS=500, every rerun is
+sampled and reruns slower than 500 ms write their stacks in folded format
+(flamegraph.pl, speedscope) to THRIVE_PROFILE_DIR.
+
+Only the standard library is imported here, so every app can afford it at startup.
+"""
+import functools
+import http.server
+import os
+import sys
+import threading
+import time
+import uuid
+import warnings
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+METRICS_HOST = os.getenv("THRIVE_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("THRIVE_METRICS_PORT", 0))
+METRICS_FILE = os.getenv("THRIVE_METRICS_FILE")
+METRICS_INTERVAL = float(os.getenv("THRIVE_METRICS_INTERVAL", 15))
+
+PROFILE_SLOW_MS = float(os.getenv("THRIVE_PROFILE_SLOW_MS", 0))
+PROFILE_DIR = os.getenv("THRIVE_PROFILE_DIR", ".thrive_profiles")
+PROFILE_INTERVAL = 0.005
+PROFILE_MAX_SECONDS = 120
+
+# Per-session memory gauges are kept for the most recent sessions only
+MAX_SESSIONS = 100
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# name -> (type, help)
+METRICS = {
+    "thrive_page_render_seconds": ("histogram", "Wall time of one script rerun, by app and page."),
+    "thrive_page_render_total": ("counter", "Script reruns by app, page and outcome."),
+    "thrive_cache_requests_total": ("counter", "Cache lookups by cache and result (hit or miss)."),
+    "thrive_data_load_seconds": ("histogram", "Time to load a data table or cached resource."),
+    "thrive_data_load_total": ("counter", "Data loads by table, source and outcome."),
+    "thrive_llm_request_seconds": ("histogram", "LLM request latency, including retries and streaming."),
+    "thrive_llm_request_total": ("counter", "LLM requests by method and outcome (ok or the exception type)."),
+    "thrive_llm_retries_total": ("counter", "LLM attempts retried after a retryable error."),
+    "thrive_transcription_queue_depth": ("gauge", "Transcription chunks submitted and not finished."),
+    "thrive_transcription_workers": ("gauge", "Size of the transcription process pool."),
+    "thrive_transcription_job_seconds": ("histogram", "Time from submitting a recording to its transcript."),
+    "thrive_transcription_jobs_total": ("counter", "Recordings submitted for transcription."),
+    "thrive_uploads_total": ("counter", "Uploaded documents by type and result (stored or duplicate)."),
+    "thrive_upload_bytes_total": ("counter", "Bytes streamed into the document store."),
+    "thrive_document_checks_total": ("counter", "Background document validations by result."),
+    "thrive_document_queue_depth": ("gauge", "Documents waiting for or in background validation."),
+    "thrive_application_commit_seconds": ("histogram", "Time to commit one batch of application writes."),
+    "thrive_application_commits_total": ("counter", "Application store transactions committed."),
+    "thrive_application_writes_total": ("counter", "Application submissions and status updates committed."),
+    "thrive_case_notes_commit_seconds": ("histogram", "Time to append and fsync one batch of case notes."),
+    "thrive_case_notes_written_total": ("counter", "Case notes appended to the log."),
+    "thrive_case_notes_search_seconds": ("histogram", "Time to answer one case-notes search."),
+    "thrive_case_notes_search_total": ("counter", "Case-notes searches by outcome."),
+    "thrive_case_notes_skipped_total": ("counter", "Case-notes log lines skipped as torn or not case notes."),
+    "thrive_faq_requests_total": ("counter", "Help questions by where the answer came from (faq, documents, learned or miss)."),
+    "thrive_feed_posts_total": ("counter", "Community posts appended and fanned out."),
+    "thrive_feed_read_seconds": ("histogram", "Time to read one page of a community timeline."),
+    "thrive_feed_read_total": ("counter", "Community timeline page reads by outcome."),
+    "thrive_member_search_seconds": ("histogram", "Time to answer one Find Friends member search."),
+    "thrive_member_search_total": ("counter", "Find Friends member searches by outcome."),
+    "thrive_har_batch_seconds": ("histogram", "Time to apply one micro-batch of HAR rows to the early-warning state."),
+    "thrive_har_rows_total": ("counter", "HAR rows applied to the early-warning state."),
+    "thrive_har_alerts_total": ("counter", "Early-warning alerts raised, by kind."),
+    "thrive_ingest_seconds": ("histogram", "Time to parse, validate and store the rows appended to a source file."),
+    "thrive_ingest_total": ("counter", "Ingests of appended source rows by table and outcome."),
+    "thrive_ingest_rows_total": ("counter", "Appended source rows by table and result (accepted or rejected)."),
+    "thrive_retrain_seconds": ("histogram", "Time to fit and write one version of the risk model, by mode."),
+    "thrive_retrain_total": ("counter", "Risk model retrains by mode and outcome."),
+    "thrive_process_rss_bytes": ("gauge", "Resident memory of this server process."),
+    "thrive_session_peak_rss_bytes": ("gauge", "Highest process RSS seen at the end of a session's reruns."),
+    "thrive_profiles_written_total": ("counter", "Slow reruns whose stacks were written by the sampling profiler."),
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Registry:
+    """Thread-safe counters, gauges and histograms, plus collectors read at export time."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._histograms = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1.0, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[(name, _labels_key(labels))] = float(value)
+
+    def remove(self, name, **labels):
+        with self._lock:
+            self._values.pop((name, _labels_key(labels)), None)
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def register_collector(self, key, collect):
+        """`collect()` yields (name, labels, value) samples; registering `key` again replaces it."""
+        with self._lock:
+            self._collectors[key] = collect
+
+    def value(self, name, **labels):
+        with self._lock:
+            return self._values.get((name, _labels_key(labels)))
+
+    def samples(self):
+        """All current (name, labels_key, value) samples, including collector output."""
+        with self._lock:
+            values = dict(self._values)
+            collectors = list(self._collectors.values())
+        for collect in collectors:
+            try:
+                for name, labels, value in collect():
+                    key = (name, _labels_key(labels))
+                    values[key] = values.get(key, 0.0) + value
+            except Exception as e:  # a broken collector must not break the endpoint
+                warnings.warn(f"metrics collector failed: {e!r}")
+        return [(name, labels, value) for (name, labels), value in values.items()]
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        by_name = {}
+        for name, labels, value in sorted(self.samples()):
+            by_name.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        with self._lock:
+            histograms = [(key, list(counts), total, count) for key, (counts, total, count) in self._histograms.items()]
+        for (name, labels), bucket_counts, total, count in histograms:
+            lines = by_name.setdefault(name, [])
+            for bound, cumulative in zip(self.buckets + (float("inf"),), bucket_counts + [count]):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        out = []
+        for name in sorted(by_name):
+            kind, help_text = METRICS.get(name, ("untyped", ""))
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(by_name[name])
+        return "\n".join(out) + "\n"
+
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+set_gauge = REGISTRY.set
+register_collector = REGISTRY.register_collector
+render = REGISTRY.render
+
+
+@contextmanager
+def timed(name, **labels):
+    """Observe the block's duration in `<name>_seconds` and count it in `<name>_total`
+    with an outcome label: "ok", or the type of the exception that escaped."""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException as e:
+        outcome = type(e).__name__
+        raise
+    finally:
+        observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+        inc(f"{name}_total", outcome=outcome, **labels)
+
+
+def cached(cache, name=None):
+    """Wrap a Streamlit cache decorator so hits, misses and load time are recorded.
+
+        @metrics.cached(st.cache_data)
+        def load_and_preprocess_data(): ...
+    """
+    local = threading.local()
+
+    def decorate(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def load(*args, **kwargs):
+            # Only runs on a miss; Streamlit still hashes `fn`'s source through __wrapped__
+            local.missed = True
+            with timed("thrive_data_load", table=label, source="compute"):
+                return fn(*args, **kwargs)
+
+        cached_fn = cache(load)
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            outer = getattr(local, "missed", False)
+            local.missed = False
+            try:
+                return cached_fn(*args, **kwargs)
+            finally:
+                inc("thrive_cache_requests_total", cache=label, result="miss" if local.missed else "hit")
+                local.missed = outer
+
+        call.clear = cached_fn.clear
+        return call
+    return decorate
+
+
+def hit_miss_collector(cache_name, cache):
+    """Collector for objects with `hits` and `misses` counters (ResponseCache, FigureCache)."""
+    def collect():
+        yield "thrive_cache_requests_total", {"cache": cache_name, "result": "hit"}, cache.hits
+        yield "thrive_cache_requests_total", {"cache": cache_name, "result": "miss"}, cache.misses
+    return collect
+
+
+def rss_bytes():
+    """Resident set size of this process, or the peak RSS where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _process_collector():
+    rss = rss_bytes()
+    if rss is not None:
+        yield "thrive_process_rss_bytes", {}, rss
+
+
+register_collector("process", _process_collector)
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval and counts folded stacks."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL, max_seconds=PROFILE_MAX_SECONDS):
+        super().__init__(daemon=True, name="thrive-stack-sampler")
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop_event.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path):
+        """Folded stacks, one "frame;frame;frame count" line per distinct stack."""
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+
+def _record_session_memory(app, session):
+    rss = rss_bytes()
+    if rss is None or session is None:
+        return
+    session_id = session.setdefault("_metrics_session_id", uuid.uuid4().hex[:12])
+    peak = max(session.get("_metrics_peak_rss", 0), rss)
+    session["_metrics_peak_rss"] = peak
+    with _sessions_lock:
+        _sessions[session_id] = app
+        _sessions.move_to_end(session_id)
+        while len(_sessions) > MAX_SESSIONS:
+            old_id, old_app = _sessions.popitem(last=False)
+            REGISTRY.remove("thrive_session_peak_rss_bytes", app=old_app, session=old_id)
+    set_gauge("thrive_session_peak_rss_bytes", peak, app=app, session=session_id)
+
+
+class PageRender:
+    """Times one script rerun of `app` showing `page`; optionally profiles it.
+
+    Use as a context manager, or call finish() at the end of the script for
+    apps whose pages are top-level if/elif blocks.
+    """
+
+    def __init__(self, app, page, session=None, slow_ms=PROFILE_SLOW_MS):
+        self.app = app
+        self.page = page
+        self.session = session
+        self.slow_ms = slow_ms
+        self.sampler = None
+        self.start = None
+        self.done = False
+
+    def begin(self):
+        if self.session is not None:
+            # A rerun that raised before finish() (apps without a `with` block)
+            previous = self.session.get("_metrics_render")
+            if previous is not None and not previous.done:
+                previous.abandon()
+            self.session["_metrics_render"] = self
+        self.start = time.perf_counter()
+        if self.slow_ms > 0:
+            self.sampler = StackSampler(threading.get_ident())
+            self.sampler.start()
+        return self
+
+    def finish(self, outcome="ok"):
+        if self.done:
+            return
+        self.done = True
+        elapsed = time.perf_counter() - self.start
+        observe("thrive_page_render_seconds", elapsed, app=self.app, page=self.page)
+        inc("thrive_page_render_total", app=self.app, page=self.page, outcome=outcome)
+        _record_session_memory(self.app, self.session)
+        if self.sampler is not None:
+            self.sampler.stop()
+            if elapsed * 1000 >= self.slow_ms and self.sampler.stacks:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                page = "".join(c if c.isalnum() else "_" for c in self.page)
+                stamp = time.strftime("%Y%m%d-%H%M%S")
+                self.sampler.write(os.path.join(PROFILE_DIR, f"{self.app}-{page}-{stamp}-{int(elapsed * 1000)}ms.folded"))
+                inc("thrive_profiles_written_total", app=self.app, page=self.page)
+
+    def abandon(self):
+        self.done = True
+        if self.sampler is not None:
+            self.sampler.stop()
+        inc("thrive_page_render_total", app=self.app, page=self.page, outcome="interrupted")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish("ok" if exc_type is None else exc_type.__name__)
+        return False
+
+
+def page_render(app, page, session=None):
+    return PageRender(app, page, session).begin()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_file(path):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+def _write_loop(path, interval):
+    while True:
+        try:
+            write_file(path)
+        except OSError as e:
+            warnings.warn(f"could not write metrics to {path}: {e}")
+        time.sleep(interval)
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_exporter(port=METRICS_PORT, path=METRICS_FILE, host=METRICS_HOST, interval=METRICS_INTERVAL):
+    """Start the HTTP endpoint and/or file writer once per process.
+
+    Safe to call on every Streamlit rerun; does nothing if neither is configured.
+    """
+    global _exporter_started
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+    if port:
+        try:
+            server = http.server.ThreadingHTTPServer((host, port), _Handler)
+        except OSError as e:
+            warnings.warn(f"metrics endpoint not started on {host}:{port}: {e}")
+        else:
+            threading.Thread(target=server.serve_forever, daemon=True, name="thrive-metrics-http").start()
+    if path:
+        threading.Thread(target=_write_loop, args=(path, interval), daemon=True, name="thrive-metrics-file").start()
+
+
+if __name__ == "__main__":
+    # Print what this process would export (mostly empty outside a running app)
+    sys.stdout.write(render())
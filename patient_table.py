@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+
+class IndexedTable:
+    """Read-only table with precomputed row-index buckets for categorical columns.
+
+    Filtering looks up and intersects the buckets instead of scanning rows;
+    sorting and slicing run on the selected row positions, so only the
+    visible page is ever materialized as a DataFrame.
+    """
+
+    def __init__(self, frame, index_columns):
+        self.frame = frame.reset_index(drop=True)
+        self.index_columns = list(index_columns)
+        self.buckets = {col: self._build_buckets(self.frame[col]) for col in self.index_columns}
+        self._ranks = {}
+
+    @staticmethod
+    def _build_buckets(values):
+        # One stable argsort per column, split into sorted row-position arrays per value
+        codes, uniques = pd.factorize(values)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        return {value: order[bounds[i]:bounds[i + 1]] for i, value in enumerate(uniques)}
+
+    def __len__(self):
+        return len(self.frame)
+
+    def values(self, column):
+        return list(self.buckets[column])
+
+    def select(self, filters=None):
+        """Row positions matching `filters` ({column: value or list of values}).
+
+        Values within a column are OR-ed; columns are AND-ed.
+        """
+        selected = None
+        for column, wanted in (filters or {}).items():
+            if wanted is None:
+                continue
+            if not isinstance(wanted, (list, tuple, set)):
+                wanted = [wanted]
+            buckets = self.buckets[column]
+            parts = [buckets[v] for v in wanted if v in buckets]
+            rows = np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.intp)
+            selected = rows if selected is None else np.intersect1d(selected, rows, assume_unique=True)
+        return np.arange(len(self.frame)) if selected is None else selected
+
+    def _rank(self, column):
+        # Dense rank of every row's value in `column`, computed once per column;
+        # missing values get -1
+        if column not in self._ranks:
+            values = self.frame[column]
+            try:
+                codes, uniques = pd.factorize(values, sort=True)
+            except TypeError:
+                # Mixed types (e.g. strings and numbers): order by their text
+                codes, uniques = pd.factorize(values)
+                order = np.argsort(np.asarray(uniques, dtype=str), kind="stable")
+                codes = np.where(codes >= 0, np.argsort(order)[codes], -1)
+            self._ranks[column] = (codes, len(uniques))
+        return self._ranks[column]
+
+    def sort(self, rows, by, ascending=True):
+        """`rows` ordered by column `by`. Ties keep their row order and missing
+        values go last in both directions, so pages are stable."""
+        codes, n = self._rank(by)
+        codes = codes[rows]
+        keys = np.where(codes < 0, n, codes if ascending else n - 1 - codes)
+        return rows[np.argsort(keys, kind="stable")]
+
+    def query(self, filters=None, sort_by=None, ascending=True, page=0, page_size=50, columns=None):
+        """One page of matching rows plus the total match count."""
+        rows = self.select(filters)
+        if sort_by:
+            rows = self.sort(rows, sort_by, ascending)
+        start = page * page_size
+        visible = self.frame.iloc[rows[start:start + page_size]]
+        if columns:
+            visible = visible[columns]
+        return visible, len(rows)
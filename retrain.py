@@ -0,0 +1,248 @@
+"""Retraining of the relapse-risk model on the SUD and HAR data the dashboard loads.
+
+Every run writes a new version to MODEL_DIR/<UTC time>-<digest>/: model.pkl,
+encoder.pkl and feature_order.pkl in the same form as the shipped pickles,
+plus manifest.json with the SHA-256 of each file, the data version trained
+on, the chosen hyperparameters, metrics, wall time and memory. The version is
+then promoted by rewriting MODEL_DIR/CURRENT, which RiskScorer.load() reads;
+it checks the checksums before using a version.
+
+Modes:
+  search  cross-validated grid search over C; the folds and candidates are
+          fitted in parallel (--jobs, -1 for every core)
+  warm    refit the current version's model on the grown cohort, starting
+          from its coefficients. The current model is first scored on the
+          patients it was not trained on
+  auto    warm when there is a current version to start from, else search
+
+    python retrain.py                  # daily refresh
+    python retrain.py --mode search --no-promote
+"""
+import argparse
+import copy
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import metrics
+import sud_data
+from risk_scoring import (ARTIFACT_FILES, FEATURE_ORDER_PATH, MODEL_DIR, current_version, design_matrix,
+                          feature_categories, verify_artifacts)
+
+try:
+    import resource
+except ImportError:  # no peak RSS outside Unix
+    resource = None
+
+TARGET = "Relapse_Risk"
+CATEGORICAL = [name for name, kind in sud_data.SUD_SCHEMA.items() if isinstance(kind, list) and name != TARGET]
+
+C_GRID = np.logspace(-3, 2, 6)
+FOLDS = 5
+MAX_ITER = 1000
+
+
+def training_rows(dataset):
+    """SUD rows with a known target. The model's features are all SUD columns,
+    so patients without wearable rows are kept."""
+    sud = dataset.sud
+    return sud[sud[TARGET].astype(str) != sud_data.MISSING_CATEGORY]
+
+
+def features(frame, feature_order):
+    """Design matrix as a frame, so the fitted model records feature_names_in_."""
+    categories = feature_categories(feature_order, CATEGORICAL)
+    return pd.DataFrame(design_matrix(frame, feature_order, categories), columns=feature_order)
+
+
+def fit_encoder(frame, feature_order):
+    from sklearn.preprocessing import OneHotEncoder
+
+    categories = feature_categories(feature_order, CATEGORICAL)
+    encoder = OneHotEncoder(categories=list(categories.values()), handle_unknown="ignore", sparse_output=False)
+    return encoder.fit(frame[list(categories)].astype(str))
+
+
+def evaluate(model, X, y):
+    from sklearn.metrics import accuracy_score, log_loss
+
+    return {"rows": len(y), "accuracy": float(accuracy_score(y, model.predict(X))),
+            "log_loss": float(log_loss(y, model.predict_proba(X), labels=model.classes_))}
+
+
+def search(X, y, folds=FOLDS, grid=C_GRID, jobs=-1, seed=0):
+    """Best C by stratified k-fold log loss; every (fold, C) fit is a separate joblib task."""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import log_loss, make_scorer
+    from sklearn.model_selection import GridSearchCV, StratifiedKFold
+
+    # Labels passed explicitly: a validation fold may lack a rare class
+    scoring = {"log_loss": make_scorer(log_loss, greater_is_better=False, response_method="predict_proba",
+                                       labels=np.unique(y)),
+               "accuracy": "accuracy"}
+    cv = GridSearchCV(LogisticRegression(max_iter=MAX_ITER), {"C": list(grid)}, scoring=scoring, refit="log_loss",
+                      cv=StratifiedKFold(folds, shuffle=True, random_state=seed), n_jobs=jobs)
+    cv.fit(X, y)
+    results = cv.cv_results_
+    candidates = [{"C": float(c),
+                   "log_loss": float(-results["mean_test_log_loss"][i]),
+                   "log_loss_std": float(results["std_test_log_loss"][i]),
+                   "accuracy": float(results["mean_test_accuracy"][i]),
+                   "fit_seconds": float(results["mean_fit_time"][i])}
+                  for i, c in enumerate(results["param_C"])]
+    return cv.best_estimator_, {"folds": folds, "jobs": jobs, "candidates": candidates}
+
+
+def warm_start(parent, X, y):
+    """The parent model refitted on X, y from its own coefficients."""
+    model = copy.deepcopy(parent).set_params(warm_start=True)
+    model.fit(X, y)
+    return model
+
+
+def load_parent(model_dir):
+    """(version, manifest, model, feature_order) of the promoted version, or None."""
+    version = current_version(model_dir)
+    if version is None:
+        return None
+    directory = os.path.join(model_dir, version)
+    try:
+        model_path, _, feature_order_path = verify_artifacts(directory)
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError, KeyError) as e:
+        warnings.warn(f"cannot warm-start from {version}: {e}")
+        return None
+    with open(model_path, "rb") as f:
+        model = pickle.load(f)
+    return version, manifest, model, _load_feature_order(feature_order_path)
+
+
+def _load_feature_order(path):
+    with open(path, "rb") as f:
+        return list(pickle.load(f))
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def write_version(model_dir, model, encoder, feature_order, manifest):
+    """Write the artifacts and their manifest under a new version directory.
+
+    Files are written to a staging directory that is renamed into place, so
+    a version directory is always complete.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=model_dir, prefix=".staging-")
+    try:
+        for name, obj in zip(ARTIFACT_FILES, (model, encoder, feature_order)):
+            with open(os.path.join(staging, name), "wb") as f:
+                pickle.dump(obj, f)
+        files = {name: sud_data.file_hash(os.path.join(staging, name)) for name in ARTIFACT_FILES}
+        digest = hashlib.sha256("|".join(files[name] for name in ARTIFACT_FILES).encode()).hexdigest()[:8]
+        version = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{digest}"
+        manifest = dict(manifest, version=version, files=files)
+        with open(os.path.join(staging, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(staging, os.path.join(model_dir, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return manifest
+
+
+def promote(model_dir, version):
+    """Make `version` the model RiskScorer.load() uses."""
+    tmp = os.path.join(model_dir, f"CURRENT.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, os.path.join(model_dir, "CURRENT"))
+
+
+def retrain(dataset, mode="auto", model_dir=MODEL_DIR, folds=FOLDS, grid=C_GRID, jobs=-1, seed=0, promote_version=True):
+    """Fit and write one model version from the dataset's current rows; returns its manifest."""
+    parent = load_parent(model_dir) if mode in ("auto", "warm") else None
+    frame = training_rows(dataset)
+    y = frame[TARGET].astype(str).to_numpy()
+    if parent is not None and set(y) != set(parent[2].classes_):
+        warnings.warn(f"classes changed since {parent[0]}; searching from scratch")
+        parent = None
+    if mode == "warm" and parent is None:
+        warnings.warn("no current model to warm-start from; searching from scratch")
+    used = "warm" if parent is not None else "search"
+
+    feature_order = parent[3] if parent is not None else _load_feature_order(FEATURE_ORDER_PATH)
+    X = features(frame, feature_order)
+    rss_before = metrics.rss_bytes()
+    start = time.perf_counter()
+    with metrics.timed("thrive_retrain", mode=used):
+        if parent is not None:
+            # Patients appended to the SUD table after the parent's training data
+            # were never seen by it: an honest holdout for the model being replaced
+            new = np.asarray(frame.index) >= parent[1]["sud_rows"]
+            model = warm_start(parent[2], X, y)
+            details = {"holdout": evaluate(parent[2], X[new], y[new]) if new.any() else None,
+                       "n_iter": int(np.max(model.n_iter_))}
+        else:
+            model, details = search(X, y, folds=folds, grid=grid, jobs=jobs, seed=seed)
+        encoder = fit_encoder(frame, feature_order)
+    seconds = time.perf_counter() - start
+
+    manifest = {
+        "parent": parent[0] if parent is not None else None,
+        "mode": used,
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "data_version": dataset.version,
+        "sud_rows": len(dataset.sud),
+        "rows": len(frame),
+        "classes": {str(c): int(n) for c, n in zip(*np.unique(y, return_counts=True))},
+        "params": {"C": float(model.C), "max_iter": model.max_iter},
+        "train": evaluate(model, X, y),
+        used: details,
+        "seconds": round(seconds, 3),
+        "memory": {"rss_before": rss_before, "rss_after": metrics.rss_bytes(), "peak_rss": _peak_rss()},
+    }
+    manifest = write_version(model_dir, model, encoder, feature_order, manifest)
+    if promote_version:
+        promote(model_dir, manifest["version"])
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["auto", "search", "warm"], default="auto")
+    parser.add_argument("--folds", type=int, default=FOLDS)
+    parser.add_argument("--C", type=float, nargs="+", default=list(C_GRID), help="values of C to search")
+    parser.add_argument("--jobs", type=int, default=-1, help="parallel fits; -1 for every core")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--no-promote", action="store_true", help="write the version without making it current")
+    parser.add_argument("--sud", default=sud_data.SUD_CSV)
+    parser.add_argument("--har", default=sud_data.HAR_CSV)
+    args = parser.parse_args()
+
+    dataset = ingest.Dataset(args.sud, args.har)
+    manifest = retrain(dataset, args.mode, args.model_dir, folds=args.folds, grid=args.C, jobs=args.jobs,
+                       seed=args.seed, promote_version=not args.no_promote)
+    train = manifest["train"]
+    print(f"{manifest['version']}: {manifest['mode']} on {manifest['rows']} patients, C={manifest['params']['C']:g}, "
+          f"accuracy {train['accuracy']:.3f}, log loss {train['log_loss']:.3f}, {manifest['seconds']:.1f} s"
+          + ("" if args.no_promote else " (promoted)"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from sud_data import CACHE_DIR, file_hash
+
+MODEL_PATH = "logistic_regression_retrained.pkl"
+ENCODER_PATH = "encoder_retrained.pkl"
+FEATURE_ORDER_PATH = "feature_order.pkl"
+
+# Versioned artifacts written by retrain.py; CURRENT names the promoted one
+MODEL_DIR = os.getenv("THRIVE_MODEL_DIR", "models")
+ARTIFACT_FILES = ("model.pkl", "encoder.pkl", "feature_order.pkl")
+
+NUMERIC_FEATURES = ["Age"]
+
+
+def _load_pickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def current_version(model_dir=MODEL_DIR):
+    """Version of the promoted retrained model, or None to use the shipped artifacts."""
+    try:
+        with open(os.path.join(model_dir, "CURRENT")) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def verify_artifacts(directory):
+    """Artifact paths of one retrained version after checking their recorded
+    SHA-256; raises ValueError if a file is missing or was changed."""
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    paths = tuple(os.path.join(directory, name) for name in ARTIFACT_FILES)
+    for name, path in zip(ARTIFACT_FILES, paths):
+        if not os.path.exists(path) or file_hash(path) != manifest["files"][name]:
+            raise ValueError(f"checksum mismatch for {path}")
+    return paths
+
+
+def artifact_paths(model_dir=MODEL_DIR):
+    """(model, encoder, feature_order) paths: the promoted retrained version, or
+    the shipped pickles when there is none or it fails its checksums."""
+    version = current_version(model_dir)
+    if version is not None:
+        try:
+            return verify_artifacts(os.path.join(model_dir, version))
+        except (OSError, ValueError, KeyError) as e:
+            warnings.warn(f"model {version} not used: {e}")
+    return MODEL_PATH, ENCODER_PATH, FEATURE_ORDER_PATH
+
+
+def feature_categories(feature_order, categorical):
+    """Category levels per column, read from one-hot feature names like "Gender_Female"."""
+    return {name: [f[len(name) + 1:] for f in feature_order if f.startswith(f"{name}_")]
+            for name in categorical if any(f.startswith(f"{name}_") for f in feature_order)}
+
+
+def design_matrix(frame, feature_order, categories):
+    """One-hot design matrix in feature_order; unknown categories encode as all zeros."""
+    column = {name: i for i, name in enumerate(feature_order)}
+    n = len(frame)
+    X = np.zeros((n, len(feature_order)), dtype=np.float64)
+    for name in NUMERIC_FEATURES:
+        X[:, column[name]] = pd.to_numeric(frame[name], errors="coerce").fillna(0).to_numpy()
+    rows = np.arange(n)
+    for name, levels in categories.items():
+        codes = pd.Categorical(frame[name].astype(str), categories=levels).codes
+        known = codes >= 0
+        X[rows[known], np.array([column[f"{name}_{level}"] for level in levels])[codes[known]]] = 1.0
+    return X
+
+
+class RiskScorer:
+    """Relapse-risk scoring with a fitted encoder and logistic regression: the
+    shipped ones, or the version promoted by retrain.py.
+
+    The encoder and model are only used to read their fitted parameters; scoring
+    itself is a one-hot design matrix times the coefficient matrix, done in NumPy
+    for any number of patients at once. The extracted parameters are cached as
+    JSON, so sklearn is only imported when the pickled artifacts change.
+    """
+
+    def __init__(self, feature_order, classes, categories, weights, intercept):
+        self.feature_order = list(feature_order)
+        self.classes = np.asarray(classes)
+        self.categories = {name: list(levels) for name, levels in categories.items()}
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+
+    @classmethod
+    def from_artifacts(cls, model, encoder, feature_order):
+        categories = {name: list(levels) for name, levels in zip(encoder.feature_names_in_, encoder.categories_)}
+
+        # Coefficients reordered from the model's training order to feature_order
+        model_columns = list(getattr(model, "feature_names_in_", feature_order))
+        reorder = [model_columns.index(name) for name in feature_order]
+        coef = np.asarray(model.coef_, dtype=np.float64)[:, reorder]
+        intercept = np.asarray(model.intercept_, dtype=np.float64)
+        if coef.shape[0] == 1:
+            # Binary models store one row; expand to two logits so softmax matches predict_proba
+            coef = np.vstack([np.zeros_like(coef), coef])
+            intercept = np.array([0.0, intercept[0]])
+        return cls(feature_order, model.classes_, categories, coef.T, intercept)
+
+    def to_dict(self):
+        return {
+            "feature_order": self.feature_order,
+            "classes": self.classes.tolist(),
+            "categories": self.categories,
+            "weights": self.weights.tolist(),
+            "intercept": self.intercept.tolist(),
+        }
+
+    @classmethod
+    def load(cls, model_path=None, encoder_path=None, feature_order_path=None):
+        """Scorer for the given artifacts; by default the promoted retrained
+        model, else the shipped one."""
+        if model_path is None:
+            paths = artifact_paths()
+        else:
+            paths = (model_path, encoder_path or ENCODER_PATH, feature_order_path or FEATURE_ORDER_PATH)
+        key = hashlib.sha256("|".join(file_hash(p) for p in paths).encode()).hexdigest()[:16]
+        cached = os.path.join(CACHE_DIR, f"risk-scorer-{key}.json")
+        if os.path.exists(cached):
+            with open(cached) as f:
+                return cls(**json.load(f))
+
+        # Unpickling imports sklearn; only happens when the artifacts change
+        scorer = cls.from_artifacts(*(_load_pickle(p) for p in paths))
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{cached}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(scorer.to_dict(), f)
+        os.replace(tmp, cached)
+        return scorer
+
+    def design_matrix(self, frame):
+        return design_matrix(frame, self.feature_order, self.categories)
+
+    def predict_proba(self, frame):
+        logits = self.design_matrix(frame) @ self.weights + self.intercept
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+    def score(self, frame):
+        """Predicted risk, confidence and per-class probabilities for every row of `frame`."""
+        proba = self.predict_proba(frame)
+        best = proba.argmax(axis=1)
+        out = pd.DataFrame(proba, columns=[f"P_{c}" for c in self.classes], index=frame.index)
+        out.insert(0, "Predicted_Risk", self.classes[best])
+        out.insert(1, "Confidence", proba[np.arange(len(best)), best])
+        if "Patient_ID" in frame:
+            out.insert(0, "Patient_ID", frame["Patient_ID"])
+        return out
+
+    def score_one(self, **fields):
+        """Score a single patient given as keyword fields; returns (risk, confidence)."""
+        result = self.score(pd.DataFrame([fields])).iloc[0]
+        return result["Predicted_Risk"], float(result["Confidence"])
+
+    def score_chunks(self, frames):
+        """Score an iterable of frames lazily, one chunk in memory at a time."""
+        for frame in frames:
+            yield self.score(frame)
+
+    def score_csv(self, path, out_path, chunksize=100_000):
+        """Re-score a whole census CSV in chunks, appending results to `out_path`."""
+        columns = ["Patient_ID"] + NUMERIC_FEATURES + list(self.categories)
+        reader = pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False, chunksize=chunksize)
+        total = 0
+        for i, scored in enumerate(self.score_chunks(reader)):
+            scored.to_csv(out_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+            total += len(scored)
+        return total
+
+
+if __name__ == "__main__":
+    # Nightly batch: python risk_scoring.py <census.csv> <scores.csv>
+    source, target = sys.argv[1], sys.argv[2]
+    print(f"Scored {RiskScorer.load().score_csv(source, target)} patients -> {target}")
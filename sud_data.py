@@ -0,0 +1,237 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+# Source files shipped with the repo
+SUD_CSV = "Synthetic_SUD_Patient_Data.csv"
+HAR_CSV = "Synthetic_HAR_Data_for_SUD_Patients2.csv"
+
+# On-disk column cache, shared by every Streamlit worker on the host
+CACHE_DIR = os.getenv("THRIVE_CACHE_DIR", ".thrive_cache")
+
+# Bump when the schema below changes so old caches are ignored
+SCHEMA_VERSION = 1
+
+DATE_FORMAT = "%Y-%m-%d"
+TIMESTAMP_FORMAT = "%m/%d/%Y %H:%M"
+MISSING_CATEGORY = "Unknown"
+
+# Explicit schemas: column -> kind, plus the category levels for categoricals
+SUD_SCHEMA = {
+    "Patient_ID": "str",
+    "Age": "int16",
+    "Gender": ["Female", "Male", "Non-binary"],
+    "Substance_Type": ["Alcohol", "Cannabis", "Cocaine", "Methamphetamine", "Opioids", "Polysubstance"],
+    "Treatment_Type": ["Counseling", "Detox", "Medication-Assisted Treatment (MAT)", "Residential Rehab"],
+    "Relapse_Risk": ["High", "Low", "Medium"],
+    "Support_System": ["Moderate", "Strong", "Weak"],
+    "Comorbidities": ["Anxiety", "Depression", "PTSD"],
+    "Admission_Date": "date",
+    "Discharge_Date": "date",
+    "Treatment_Outcome": ["Ongoing", "Recovered", "Relapsed"],
+}
+
+HAR_SCHEMA = {
+    "Patient_ID": "str",
+    "Timestamp": "timestamp",
+    "Activity": ["Other", "Running", "Sitting", "Sleeping", "Walking"],
+    "X_accel": "float32",
+    "Y_accel": "float32",
+    "Z_accel": "float32",
+    "Heart_Rate": "float32",
+    "Relapse_Indicator": ["No", "Yes"],
+}
+
+
+_hash_memo = {}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of a file, read in chunks so large sources are not buffered.
+
+    Results are memoized on (path, size, mtime) so repeated calls are cheap.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _hash_memo:
+        return _hash_memo[memo_key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    _hash_memo[memo_key] = digest.hexdigest()
+    return _hash_memo[memo_key]
+
+
+def data_version(paths=(SUD_CSV, HAR_CSV)):
+    """Identifier of the current source data; changes whenever any source file does."""
+    key = "|".join([str(SCHEMA_VERSION)] + [file_hash(p) for p in paths])
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def _read_dtypes(schema):
+    # Everything that is not numeric is read as a plain string and converted afterwards
+    return {col: kind if isinstance(kind, str) and kind not in ("str", "date", "timestamp") else "str"
+            for col, kind in schema.items()}
+
+
+def apply_schema(df, schema):
+    """Convert a raw frame (as read from CSV) to the typed representation."""
+    out = {}
+    for col, kind in schema.items():
+        values = df[col]
+        if isinstance(kind, list):
+            levels = kind + [MISSING_CATEGORY]
+            cat = pd.Categorical(values, categories=levels)
+            out[col] = pd.Series(cat, index=df.index).fillna(MISSING_CATEGORY)
+        elif kind == "date":
+            out[col] = pd.to_datetime(values, format=DATE_FORMAT, errors="coerce")
+        elif kind == "timestamp":
+            out[col] = pd.to_datetime(values, format=TIMESTAMP_FORMAT, errors="coerce")
+        elif kind == "str":
+            out[col] = values.astype(object)
+        else:
+            out[col] = values.astype(kind)
+    return pd.DataFrame(out, index=df.index)
+
+
+def parse_csv(path, schema, **read_kwargs):
+    """Parse a CSV once with an explicit schema."""
+    raw = pd.read_csv(path, usecols=list(schema), dtype=_read_dtypes(schema), **read_kwargs)
+    return apply_schema(raw, schema)
+
+
+def parse_rows(data, schema, columns):
+    """Parse headerless CSV lines (bytes), e.g. rows appended to a source file,
+    whose columns are named by `columns`."""
+    dtypes = _read_dtypes(schema)
+    if data.strip():
+        raw = pd.read_csv(io.BytesIO(data), header=None, names=columns, usecols=list(schema), dtype=dtypes)
+    else:
+        raw = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in dtypes.items()})
+    return apply_schema(raw, schema)
+
+
+# Column cache: one .npy per column, memory-mapped on load
+
+def _cache_path(path, schema):
+    key = json.dumps({"schema": schema, "version": SCHEMA_VERSION}, sort_keys=True)
+    schema_digest = hashlib.sha256(key.encode()).hexdigest()[:8]
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(CACHE_DIR, f"{name}-{file_hash(path)[:16]}-{schema_digest}")
+
+
+class CacheWriter:
+    """Fill a column cache chunk by chunk when the total row count is known up front.
+
+    Columns are preallocated as memory-mapped .npy files in a staging directory
+    that is renamed into place by close(), so readers never see a partial cache.
+    """
+
+    def __init__(self, target, schema, rows, str_width=16):
+        self.target = target
+        self.schema = schema
+        os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+        self.staging = tempfile.mkdtemp(dir=os.path.dirname(target) or ".")
+        self.meta = {"rows": rows, "columns": {}}
+        self.arrays = {}
+        for i, (col, kind) in enumerate(schema.items()):
+            if isinstance(kind, list):
+                dtype, info = np.int8, {"kind": "category", "categories": kind + [MISSING_CATEGORY]}
+            elif kind in ("date", "timestamp"):
+                dtype, info = "datetime64[ns]", {"kind": "datetime"}
+            elif kind == "str":
+                dtype, info = f"<U{str_width}", {"kind": "str"}
+            else:
+                dtype, info = kind, {"kind": "numeric"}
+            info["file"] = f"{i:03d}.npy"
+            self.meta["columns"][col] = info
+            self.arrays[col] = np.lib.format.open_memmap(os.path.join(self.staging, info["file"]), mode="w+",
+                                                         dtype=dtype, shape=(rows,))
+
+    def write(self, start, df):
+        """Store a typed frame (as returned by apply_schema) at row offset `start`."""
+        rows = slice(start, start + len(df))
+        for col, kind in self.schema.items():
+            values = df[col]
+            if isinstance(kind, list):
+                self.arrays[col][rows] = values.cat.codes.to_numpy()
+            elif kind in ("date", "timestamp"):
+                self.arrays[col][rows] = values.to_numpy(dtype="datetime64[ns]")
+            elif kind == "str":
+                self.arrays[col][rows] = values.to_numpy(dtype=str)
+            else:
+                self.arrays[col][rows] = values.to_numpy()
+
+    def close(self):
+        for array in self.arrays.values():
+            array.flush()
+        self.arrays = {}
+        with open(os.path.join(self.staging, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+        try:
+            os.rename(self.staging, self.target)
+        except OSError:
+            # Another worker published the same cache first
+            shutil.rmtree(self.staging, ignore_errors=True)
+
+
+def write_cache(df, schema, target):
+    """Persist a typed frame as memory-mappable NumPy columns."""
+    str_width = max([1] + [int(df[col].astype(str).str.len().max() or 1)
+                           for col, kind in schema.items() if kind == "str" and len(df)])
+    writer = CacheWriter(target, schema, len(df), str_width=str_width)
+    writer.write(0, df)
+    writer.close()
+
+
+def read_cache(target):
+    """Load a cached frame; numeric columns stay memory-mapped."""
+    with open(os.path.join(target, "meta.json")) as f:
+        meta = json.load(f)
+    out = {}
+    for col, info in meta["columns"].items():
+        array = np.load(os.path.join(target, info["file"]), mmap_mode="r")
+        if info["kind"] == "category":
+            out[col] = pd.Categorical.from_codes(np.asarray(array), categories=info["categories"])
+        elif info["kind"] == "str":
+            out[col] = pd.array(np.asarray(array), dtype=object)
+        else:
+            out[col] = array
+    return pd.DataFrame(out, copy=False)
+
+
+def _prune_stale(target):
+    # Drop caches built from older versions of the same source file
+    prefix = os.path.basename(target).rsplit("-", 2)[0] + "-"
+    for entry in os.listdir(os.path.dirname(target)):
+        if entry.startswith(prefix) and entry != os.path.basename(target):
+            shutil.rmtree(os.path.join(os.path.dirname(target), entry), ignore_errors=True)
+
+
+def load_table(path, schema):
+    """Return the typed table for `path`, parsing the CSV only on a cache miss."""
+    target = _cache_path(path, schema)
+    hit = os.path.exists(os.path.join(target, "meta.json"))
+    metrics.inc("thrive_cache_requests_total", cache="column_cache", result="hit" if hit else "miss")
+    with metrics.timed("thrive_data_load", table=os.path.basename(path), source="cache" if hit else "csv"):
+        if not hit:
+            write_cache(parse_csv(path, schema), schema, target)
+            _prune_stale(target)
+        return read_cache(target)
+
+
+def load_sud(path=SUD_CSV):
+    return load_table(path, SUD_SCHEMA)
+
+
+def load_har(path=HAR_CSV):
+    return load_table(path, HAR_SCHEMA)
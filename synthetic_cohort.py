@@ -0,0 +1,149 @@
+"""Deterministic synthetic SUD/HAR cohorts matching the shipped CSV schemas.
+
+    python synthetic_cohort.py --patients 10000 --minutes 1440 --out data/10k
+    python synthetic_cohort.py --patients 1000000 --days 14 --format npy --out data/1m
+
+CSV output mirrors Synthetic_SUD_Patient_Data.csv and
+Synthetic_HAR_Data_for_SUD_Patients2.csv. The "npy" format writes the typed
+column cache read by sud_data.read_cache. Data is generated in patient chunks
+seeded from (seed, chunk), so output is identical for a given seed and memory
+stays bounded at any scale.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import sud_data
+
+HAR_START = pd.Timestamp("2024-12-23 08:00")
+ADMISSION_RANGE = (pd.Timestamp("2024-01-01"), pd.Timestamp("2024-12-30"))
+DISCHARGE_RANGE = (pd.Timestamp("2024-01-03"), pd.Timestamp("2024-01-31"))
+COMORBIDITIES = ["Anxiety", "Depression", "PTSD", "None"]
+RELAPSE_INDICATOR_RATE = 0.21
+
+# Per-activity heart rate and horizontal accel ranges, as in the shipped HAR data
+ACTIVITY_PROFILES = {
+    "Other": ((70, 90), (0.05, 0.5)),
+    "Running": ((100, 140), (1.0, 2.0)),
+    "Sitting": ((60, 80), (0.0, 0.1)),
+    "Sleeping": ((50, 70), (0.0, 0.05)),
+    "Walking": ((80, 100), (0.1, 1.0)),
+}
+Z_ACCEL_RANGE = (9.7, 9.8)
+CHUNK_PATIENTS = 10_000
+
+
+def patient_ids(start, stop):
+    return np.array([f"PID{i:05d}" for i in range(start + 1, stop + 1)])
+
+
+def _random_dates(rng, n, date_range):
+    lo, hi = date_range
+    days = rng.integers(0, (hi - lo).days + 1, n)
+    return (lo + pd.to_timedelta(days, unit="D")).strftime("%Y-%m-%d")
+
+
+def sud_chunk(rng, start, stop):
+    n = stop - start
+    schema = sud_data.SUD_SCHEMA
+    return pd.DataFrame({
+        "Patient_ID": patient_ids(start, stop),
+        "Age": rng.integers(18, 70, n),
+        "Gender": rng.choice(schema["Gender"], n),
+        "Substance_Type": rng.choice(schema["Substance_Type"], n),
+        "Treatment_Type": rng.choice(schema["Treatment_Type"], n),
+        "Relapse_Risk": rng.choice(schema["Relapse_Risk"], n),
+        "Support_System": rng.choice(schema["Support_System"], n),
+        "Comorbidities": rng.choice(COMORBIDITIES, n),
+        "Admission_Date": _random_dates(rng, n, ADMISSION_RANGE),
+        "Discharge_Date": _random_dates(rng, n, DISCHARGE_RANGE),
+        "Treatment_Outcome": rng.choice(schema["Treatment_Outcome"], n),
+    })
+
+
+def har_chunk(rng, start, stop, minutes, timestamps):
+    n = (stop - start) * minutes
+    activities = np.array(list(ACTIVITY_PROFILES))
+    activity = rng.integers(0, len(activities), n)
+    hr_lo, hr_hi, acc_lo, acc_hi = (np.array([p[i][j] for p in ACTIVITY_PROFILES.values()])
+                                    for i in (0, 1) for j in (0, 1))
+    heart_rate = rng.integers(hr_lo[activity], hr_hi[activity] + 1)
+    x = rng.uniform(acc_lo[activity], acc_hi[activity])
+    y = rng.uniform(acc_lo[activity], acc_hi[activity])
+    z = rng.uniform(*Z_ACCEL_RANGE, n)
+    return pd.DataFrame({
+        "Patient_ID": np.repeat(patient_ids(start, stop), minutes),
+        "Timestamp": np.tile(timestamps, stop - start),
+        "Activity": activities[activity],
+        "X_accel": x.round(3),
+        "Y_accel": y.round(3),
+        "Z_accel": z.round(3),
+        "Heart_Rate": heart_rate,
+        "Relapse_Indicator": np.where(rng.random(n) < RELAPSE_INDICATOR_RATE, "Yes", "No"),
+    })
+
+
+def timestamp_strings(minutes):
+    # Same layout as the shipped file, e.g. "12/23/2024 8:00" (no zero-padded hour)
+    times = HAR_START + pd.to_timedelta(np.arange(minutes), unit="min")
+    return np.array([f"{t.month}/{t.day}/{t.year} {t.hour}:{t.minute:02d}" for t in times])
+
+
+def chunks(patients, minutes, seed=0, chunk_patients=CHUNK_PATIENTS):
+    """Yield (start, sud_frame, har_frame) raw string frames, one patient chunk at a time."""
+    timestamps = timestamp_strings(minutes)
+    for start in range(0, patients, chunk_patients):
+        stop = min(patients, start + chunk_patients)
+        rng = np.random.default_rng([seed, start // chunk_patients])
+        yield start, sud_chunk(rng, start, stop), har_chunk(rng, start, stop, minutes, timestamps)
+
+
+def generate(out_dir, patients, minutes, seed=0, fmt="csv", chunk_patients=CHUNK_PATIENTS):
+    """Write a cohort to `out_dir`; returns the paths of the SUD and HAR outputs."""
+    os.makedirs(out_dir, exist_ok=True)
+    sud_path = os.path.join(out_dir, os.path.splitext(sud_data.SUD_CSV)[0])
+    har_path = os.path.join(out_dir, os.path.splitext(sud_data.HAR_CSV)[0])
+
+    if fmt == "csv":
+        sud_path, har_path = sud_path + ".csv", har_path + ".csv"
+        for start, sud, har in chunks(patients, minutes, seed, chunk_patients):
+            header = start == 0
+            sud.to_csv(sud_path, mode="w" if header else "a", header=header, index=False)
+            har.to_csv(har_path, mode="w" if header else "a", header=header, index=False)
+        return sud_path, har_path
+
+    if fmt == "npy":
+        width = len(patient_ids(patients - 1, patients)[0])
+        sud_writer = sud_data.CacheWriter(sud_path, sud_data.SUD_SCHEMA, patients, str_width=width)
+        har_writer = sud_data.CacheWriter(har_path, sud_data.HAR_SCHEMA, patients * minutes, str_width=width)
+        for start, sud, har in chunks(patients, minutes, seed, chunk_patients):
+            sud["Comorbidities"] = sud["Comorbidities"].replace("None", np.nan)
+            sud_writer.write(start, sud_data.apply_schema(sud, sud_data.SUD_SCHEMA))
+            har_writer.write(start * minutes, sud_data.apply_schema(har, sud_data.HAR_SCHEMA))
+        sud_writer.close()
+        har_writer.close()
+        return sud_path, har_path
+
+    raise ValueError(f"Unknown output format: {fmt}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=10_000)
+    parser.add_argument("--minutes", type=int, help="HAR minutes per patient")
+    parser.add_argument("--days", type=float, default=1, help="HAR days per patient (if --minutes is not given)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=["csv", "npy"], default="csv")
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    minutes = args.minutes or int(args.days * 24 * 60)
+    sud_path, har_path = generate(args.out, args.patients, minutes, seed=args.seed, fmt=args.format)
+    print(f"Wrote {args.patients} patients -> {sud_path}")
+    print(f"Wrote {args.patients * minutes} HAR rows -> {har_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+
+
+def frame(n, seed, scale=1.0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"Gender": rng.choice(["Male", "Female"], n), "Stage": rng.choice(["A", "B", "C"], n),
+                         "Age": rng.normal(40, 10, n) * scale, "Score": rng.uniform(0, 10, n)})
+
+
+DIMS = {"Gender": ["Female", "Male"], "Stage": ["A", "B", "C"]}
+
+
+def test_rollup_matches_groupby():
+    data = frame(2000, 0)
+    cube = aggregates.AggregateCube.from_frame(data, DIMS, ["Age", "Score"])
+    expected = data.groupby("Stage")[["Age", "Score"]].mean().reset_index()
+    pd.testing.assert_frame_equal(cube.rollup(["Stage"]), expected, check_names=False)
+    assert cube.value_counts("Gender").to_dict() == data["Gender"].value_counts().to_dict()
+
+
+def test_appended_rows_outside_the_range_are_not_clipped():
+    first, more = frame(1000, 0), frame(1000, 1, scale=3.0)
+    cube = aggregates.AggregateCube.from_frame(first, DIMS, ["Age", "Score"]).append(more)
+    both = pd.concat([first, more])
+    described = cube.describe(["Age"])["Age"]
+    assert described["count"] == 2000
+    assert np.isclose(described["mean"], both["Age"].mean())
+    assert (described["min"], described["max"]) == (both["Age"].min(), both["Age"].max())
+    # Sketch quantiles are approximate to one bin width
+    width = cube.edges[0, 1] - cube.edges[0, 0]
+    assert abs(described["50%"] - both["Age"].median()) <= width
+
+
+def test_save_cube_keeps_the_most_recently_used_versions(tmp_path):
+    cache_dir = str(tmp_path)
+    built = []
+
+    def build():
+        built.append(1)
+        return aggregates.AggregateCube.from_frame(frame(100, 0), DIMS, ["Age"])
+
+    for version in ("v1", "v2", "v3"):
+        aggregates.cached_cube(cache_dir, "patients", version, build)
+    os.utime(tmp_path / "patients-v1.npz", (0, 0))
+    os.utime(tmp_path / "patients-v2.npz", (1, 1))
+    aggregates.cached_cube(cache_dir, "patients", "v2", build)
+    aggregates.cached_cube(cache_dir, "patients", "v4", build)
+    assert sorted(os.listdir(cache_dir)) == ["patients-v2.npz", "patients-v3.npz", "patients-v4.npz"]
+    assert len(built) == 4
+    assert aggregates.cached_cube(cache_dir, "patients", "v2", build).version == "v2"
@@ -0,0 +1,68 @@
+import sqlite3
+import threading
+
+import pytest
+
+import application_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = application_store.ApplicationStore(str(tmp_path / "applications.db"))
+    yield store
+    store.close()
+
+
+def test_submitted_application_is_tracked(store):
+    application_id = store.submit("Jamie  Rivera", "1990-01-01", {"household_size": 3})
+    assert store.status(application_id)["status"] == "submitted"
+    assert [a["application_id"] for a in store.find("jamie rivera", "1990-01-01")] == [application_id]
+    assert store.update_status([application_id, "APP-UNKNOWN"], "approved", note="ok") == 1
+    assert store.update_status([application_id], "approved") == 0
+    assert [h["status"] for h in store.history(application_id)] == ["submitted", "approved"]
+    assert store.status(application_id)["progress"] == 100
+    assert store.status("APP-UNKNOWN") is None
+
+
+def test_concurrent_submits_are_all_committed(store):
+    ids = []
+
+    def submit(worker):
+        for i in range(50):
+            ids.append(store.submit(f"Applicant {worker} {i}", "2000-01-01", wait=False))
+
+    threads = [threading.Thread(target=submit, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    store.flush()
+    assert store.counts() == {"submitted": 400}
+    assert all(store.status(application_id) for application_id in ids)
+
+
+def test_a_failed_write_does_not_fail_the_rest_of_its_batch(store):
+    started, release = threading.Event(), threading.Event()
+
+    def block(conn):
+        started.set()
+        release.wait()
+
+    def fail(conn):
+        raise sqlite3.IntegrityError("bad write")
+
+    # Hold the writer so the next writes are committed in one batch
+    store._enqueue(block)
+    started.wait()
+    good = [store._enqueue(lambda conn, i=i: i) for i in range(3)]
+    bad = store._enqueue(fail)
+    release.set()
+    assert [p.wait() for p in good] == [0, 1, 2]
+    with pytest.raises(sqlite3.IntegrityError):
+        bad.wait()
+    assert store.status(store.submit("Alex Kim", "1985-05-05"))["status"] == "submitted"
+
+
+def test_unknown_status_is_rejected(store):
+    with pytest.raises(ValueError):
+        store.update_status(["APP-1"], "lost")
@@ -0,0 +1,106 @@
+import pytest
+
+import case_notes
+
+
+@pytest.fixture
+def log(tmp_path):
+    return str(tmp_path / "case_notes.log")
+
+
+@pytest.fixture
+def notes(log):
+    store = case_notes.CaseNotes(log)
+    yield store
+    store.close()
+
+
+def test_history_and_search_survive_a_reopen(log):
+    store = case_notes.CaseNotes(log)
+    first = store.append("P1", "Missed appointment on Monday", status="at_risk")
+    store.append("P2", "Attended group session")
+    store.append("P1", "Rescheduled the missed appointment")
+    store.close()
+
+    store = case_notes.CaseNotes(log)
+    assert [n["text"] for n in store.history("P1")] == ["Missed appointment on Monday",
+                                                       "Rescheduled the missed appointment"]
+    assert store.history("P1", limit=1)[0]["text"] == "Rescheduled the missed appointment"
+    assert [n["patient_id"] for n in store.search("missed appointment")] == ["P1", "P1"]
+    assert store.search("appointment monday")[0]["note_id"] == first
+    assert store.search("session", patient_id="P1") == []
+    summary = {row["patient_id"]: row for row in store.summary()}
+    assert (summary["P1"]["status"], summary["P1"]["notes"]) == ("at_risk", 2)
+    store.close()
+
+
+def test_sees_notes_appended_by_another_writer(log, notes):
+    other = case_notes.CaseNotes(log)
+    other.append("P1", "Written elsewhere")
+    other.close()
+    assert [n["text"] for n in notes.history("P1")] == ["Written elsewhere"]
+
+
+def test_torn_line_is_skipped_and_later_notes_still_written(log, notes):
+    notes.append("P1", "first")
+    with open(log, "ab") as f:
+        f.write(b'{"patient_id":"P1","te')
+    with pytest.warns(UserWarning, match="not a case note"):
+        notes.append("P1", "second")
+    notes.append("P1", "third")
+    assert [n["text"] for n in notes.history("P1")] == ["first", "second", "third"]
+
+    with pytest.warns(UserWarning, match="not a case note"):
+        reopened = case_notes.CaseNotes(log)
+    assert len(reopened.history("P1")) == 3
+    reopened.close()
+
+
+def test_partial_last_line_is_not_cut_at_open(log):
+    with open(log, "wb") as f:
+        f.write(b'{"patient_id":"P1","text":"done","author":"a","created_at":1}\n{"patient_id":"P1"')
+    store = case_notes.CaseNotes(log)
+    assert [n["text"] for n in store.history("P1")] == ["done"]
+    store.close()
+    with open(log, "rb") as f:
+        assert f.read().endswith(b'{"patient_id":"P1"')
+
+
+def test_lines_longer_than_a_chunk_are_skipped(log, notes, monkeypatch):
+    monkeypatch.setattr(case_notes, "SCAN_BYTES", 128)
+    with open(log, "ab") as f:
+        f.write(b"x" * 200 + b"\n")
+    with pytest.warns(UserWarning, match="not a case note"):
+        notes.append("P1", "after a long line")
+    assert [n["text"] for n in notes.history("P1")] == ["after a long line"]
+
+
+def test_failed_write_is_reported_and_writer_keeps_going(notes, monkeypatch):
+    append = notes._append
+
+    def fail_once(data):
+        monkeypatch.setattr(notes, "_append", append)
+        raise OSError("disk full")
+
+    monkeypatch.setattr(notes, "_append", fail_once)
+    with pytest.warns(UserWarning, match="commit failed"), pytest.raises(OSError, match="disk full"):
+        notes.append("P1", "lost")
+    assert notes.append("P1", "kept") is not None
+    notes.flush()
+    assert [n["text"] for n in notes.history("P1")] == ["kept"]
+
+
+def test_indexing_error_does_not_hang_append(notes, monkeypatch):
+    catch_up = notes._catch_up
+
+    def fail_once():
+        monkeypatch.setattr(notes, "_catch_up", catch_up)
+        raise ValueError("bad index")
+
+    monkeypatch.setattr(notes, "_catch_up", fail_once)
+    with pytest.warns(UserWarning, match="commit failed"):
+        # The note is on disk, so its caller still gets its ID
+        note_id = notes.append("P1", "first")
+    assert note_id == 0
+    notes.append("P1", "second")
+    assert [n["text"] for n in notes.history("P1")] == ["first", "second"]
@@ -0,0 +1,54 @@
+import pandas as pd
+
+import case_reports
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+class FakeClient:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.prompts = []
+
+    async def agenerate(self, prompt, retries=None):
+        assert retries == 0
+        self.prompts.append(prompt)
+        if self.failures:
+            self.failures -= 1
+            raise RateLimited()
+        return f"report {len(self.prompts)}"
+
+
+def test_limiter_halves_on_rate_limits_and_recovers_additively():
+    limiter = case_reports.RateLimiter(60)
+    limiter.slow_down()
+    limiter.slow_down()
+    assert limiter.rate * 60 == 15
+    for _ in range(10):
+        limiter.speed_up()
+    assert round(limiter.rate * 60, 6) == 15 + 10 * case_reports.RECOVERY_REQUESTS_PER_MINUTE
+    for _ in range(100):
+        limiter.speed_up()
+    assert limiter.rate * 60 == 60
+
+
+def test_limiter_never_drops_below_the_minimum():
+    limiter = case_reports.RateLimiter(60)
+    for _ in range(20):
+        limiter.slow_down()
+    assert limiter.rate * 60 == case_reports.MIN_REQUESTS_PER_MINUTE
+
+
+def test_bulk_run_retries_rate_limits_and_checkpoints(tmp_path):
+    patients = pd.DataFrame({"Patient_ID": ["P1", "P2", "P3"], "Age": [30, 41, float("nan")]})
+    store = case_reports.ReportStore(str(tmp_path / "reports.db"))
+    client = FakeClient(failures=2)
+    assert case_reports.run(patients, store, client=client, requests_per_minute=60_000, in_flight=2) == 3
+    assert len(client.prompts) == 5
+    assert store.completed() == {"P1", "P2", "P3"}
+    assert not any("nan" in prompt for prompt in client.prompts)
+    # Completed patients are skipped on the next run
+    assert case_reports.run(patients, store, client=client, requests_per_minute=60_000) == 0
+    assert len(client.prompts) == 5
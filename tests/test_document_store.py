@@ -0,0 +1,78 @@
+import io
+import zlib
+
+import pytest
+
+import document_store
+
+PDF = (b"%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+       b"2 0 obj << /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 >> endobj\n"
+       b"3 0 obj << /Type /Page /Parent 2 0 R >> endobj\n"
+       b"4 0 obj << /Type /Page /Parent 2 0 R >> endobj\n"
+       b"trailer << /Root 1 0 R >>\n%%EOF\n")
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_store, "UPLOAD_DIR", str(tmp_path))
+
+
+def stored(data, name, **kwargs):
+    return document_store.store(io.BytesIO(data), name, chunk_bytes=16, **kwargs)
+
+
+def test_identical_content_is_stored_once():
+    first, second = stored(PDF, "a.pdf"), stored(PDF, "copy.PDF")
+    assert (first["kind"], first["size"], first["duplicate"]) == ("pdf", len(PDF), False)
+    assert second["sha256"] == first["sha256"] and second["duplicate"]
+    with open(document_store.blob_path(first["sha256"], "pdf"), "rb") as f:
+        assert f.read() == PDF
+
+
+@pytest.mark.parametrize("data, name, max_bytes", [
+    (b"MZ\x90\x00 not a document", "form.pdf", 1024),
+    (PDF, "form.png", 1024),
+    (PDF, "form.pdf", 64),
+])
+def test_rejected_uploads_leave_nothing_behind(tmp_path, data, name, max_bytes):
+    with pytest.raises(document_store.UploadRejected):
+        stored(data, name, max_bytes=max_bytes)
+    assert not (tmp_path / "blobs").exists()
+    assert not (tmp_path / "tmp").exists() or not list((tmp_path / "tmp").iterdir())
+
+
+def test_pdf_pages_are_counted_from_the_page_tree():
+    document = stored(PDF, "a.pdf")
+    path = document_store.blob_path(document["sha256"], "pdf")
+    assert document_store.verify(path, "pdf") == {"pages": 2}
+
+
+def test_pdf_pages_in_compressed_object_streams_are_counted(tmp_path):
+    page = b"<< /Type /Page /Parent 2 0 R >> "
+    header = b"3 0 4 %d " % len(page)
+    data = zlib.compress(header + page + page)
+    pdf = (b"%PDF-1.5\n5 0 obj << /Type /ObjStm /N 2 /First " + str(len(header)).encode()
+           + b" /Filter /FlateDecode /Length "
+           + str(len(data)).encode() + b" >>\nstream\n" + data + b"\nendstream\nendobj\n%%EOF\n")
+    path = tmp_path / "objstm.pdf"
+    path.write_bytes(pdf)
+    assert document_store.verify(str(path), "pdf") == {"pages": 2}
+
+
+def test_truncated_pdf_is_rejected(tmp_path):
+    path = tmp_path / "cut.pdf"
+    path.write_bytes(PDF[:-7])
+    with pytest.raises(ValueError):
+        document_store.verify(str(path), "pdf")
+
+
+def test_image_gets_a_thumbnail(tmp_path):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (800, 400), "white").save(buffer, "PNG")
+    document = stored(buffer.getvalue(), "card.png")
+    details = document_store.verify(document_store.blob_path(document["sha256"], "png"), "png")
+    assert (details["width"], details["height"]) == (800, 400)
+    with Image.open(details["thumbnail"]) as thumbnail:
+        assert thumbnail.size == (256, 128)
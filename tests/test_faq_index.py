@@ -0,0 +1,77 @@
+import json
+import threading
+
+import pytest
+
+import faq_index
+
+
+@pytest.fixture
+def learned(tmp_path):
+    return str(tmp_path / "faq_learned.json")
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What is Medicaid?", "What is Medicaid?"),
+    ("Is my data secure?", "Is my data secure?"),
+    ("What do I need for proof of income?", "What counts as Proof of Income? What do I need for Proof of Income?"),
+])
+def test_answers_close_matches(question, expected):
+    match = faq_index.FaqIndex(learned_path=None).answer(question)
+    assert match is not None and match["question"] == expected
+
+
+@pytest.mark.parametrize("question", [
+    "Who is eligible for Medicaid in Texas?",
+    "How long does Medicaid approval take?",
+    "Is my data shared with ICE?",
+])
+def test_one_shared_keyword_is_not_a_match(question):
+    assert faq_index.FaqIndex(learned_path=None).answer(question) is None
+
+
+def test_learned_answers_are_searchable_and_saved(learned):
+    index = faq_index.FaqIndex(learned_path=learned)
+    index.learn("How long does Medicaid approval take?", "Usually 45 days.")
+    assert index.answer("How long does Medicaid approval take?")["answer"] == "Usually 45 days."
+    assert faq_index.FaqIndex(learned_path=learned).answer("how long does medicaid approval take")["source"] == "learned"
+
+
+def test_concurrent_learns_all_reach_the_file(learned):
+    index = faq_index.FaqIndex(learned_path=learned)
+    errors = []
+
+    def learn(i):
+        try:
+            index.learn(f"question number {i}", f"answer {i}")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=learn, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with open(learned) as f:
+        assert len(json.load(f)) == 20
+
+
+def test_workers_do_not_overwrite_each_other(learned):
+    first = faq_index.FaqIndex(learned_path=learned)
+    second = faq_index.FaqIndex(learned_path=learned)
+    first.learn("Where is the nearest clinic?", "Check the clinic finder.")
+    second.learn("Can I bring my child?", "Yes.")
+    assert {e["question"] for e in faq_index.FaqIndex(learned_path=learned).learned} == {
+        "Where is the nearest clinic?", "Can I bring my child?"}
+    # A worker picks up the others' answers the next time it learns
+    assert second.answer("Where is the nearest clinic?") is not None
+
+
+def test_answer_is_kept_when_saving_fails(tmp_path):
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+    index = faq_index.FaqIndex(learned_path=str(blocker / "faq_learned.json"))
+    with pytest.raises(OSError):
+        index.learn("Where is the nearest clinic?", "Check the clinic finder.")
+    assert index.answer("Where is the nearest clinic?")["answer"] == "Check the clinic finder."
@@ -0,0 +1,52 @@
+import pytest
+
+import feed
+
+
+@pytest.fixture
+def store(tmp_path):
+    return feed.FeedStore(str(tmp_path / "feed.db"), celebrity_followers=3)
+
+
+def pages(store, user_id, limit):
+    posts, cursor = store.timeline(user_id, limit=limit)
+    out = [posts]
+    while cursor is not None:
+        posts, cursor = store.timeline(user_id, cursor, limit=limit)
+        out.append(posts)
+    return [[post["text"] for post in page] for page in out]
+
+
+def test_timeline_merges_fanned_out_and_high_follower_posts(store):
+    reader, friend, celebrity, *fans = store.add_users(["Reader", "Friend", "Celebrity", "Fan 1", "Fan 2", "Fan 3"])
+    store.follow_many([(reader, friend), (reader, celebrity)] + [(fan, celebrity) for fan in fans])
+    for i in range(5):
+        store.post(friend if i % 2 else celebrity, f"post {i}")
+    store.post(reader, "own post")
+    assert pages(store, reader, 2) == [["own post", "post 4"], ["post 3", "post 2"], ["post 1", "post 0"], []]
+    assert store.network(celebrity) == {"following": 0, "followers": 4}
+
+
+def test_cached_timeline_picks_up_new_posts(store):
+    reader, friend = store.add_users(["Reader", "Friend"])
+    store.follow(reader, friend)
+    store.post(friend, "first")
+    assert pages(store, reader, 10) == [["first"]]
+    store.post(friend, "second")
+    assert pages(store, reader, 10) == [["second", "first"]]
+
+
+def test_follow_backfills_recent_posts(store):
+    reader, friend = store.add_users(["Reader", "Friend"])
+    for i in range(3):
+        store.post(friend, f"post {i}")
+    store.follow(reader, friend)
+    assert pages(store, reader, 10) == [["post 2", "post 1", "post 0"]]
+
+
+def test_trending_shows_the_most_followed_accounts(store):
+    quiet, fan, *popular = store.add_users(["Quiet", "Fan"] + [f"Popular {i}" for i in range(20)])
+    store.follow_many([(fan, author) for author in popular])
+    store.post(popular[0], "popular post")
+    store.post(quiet, "quiet post")
+    assert [post["text"] for post in store.trending()] == ["popular post"]
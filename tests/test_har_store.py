@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+import har_store
+
+
+def rows(patients, start, minutes, seed=0):
+    rng = np.random.default_rng(seed)
+    n = len(patients) * minutes
+    return pd.DataFrame({
+        "Patient_ID": np.repeat(patients, minutes),
+        "Timestamp": np.tile(pd.date_range(start, periods=minutes, freq="min"), len(patients)),
+        "Activity": rng.choice(["Walking", "Sitting", "Running"], n),
+        "X_accel": rng.normal(size=n), "Y_accel": rng.normal(size=n), "Z_accel": rng.normal(size=n),
+        "Heart_Rate": rng.integers(60, 120, n),
+        "Relapse_Indicator": rng.choice(["Yes", "No"], n),
+    })
+
+
+def test_rows_are_grouped_by_patient_in_time_order():
+    data = rows(["PID2", "PID1"], "2024-01-01", 30).sample(frac=1, random_state=0)
+    store = har_store.HarStore(data)
+    assert list(store.patient_ids) == ["PID1", "PID2"]
+    patient = store.patient("PID2")
+    assert len(patient) == 30 and patient["Timestamp"].is_monotonic_increasing
+    assert list(store.latest(["PID1", "PID3"]).astype(str)) == ["2024-01-01T00:29:00.000000000", "NaT"]
+
+
+def test_appended_equals_a_store_built_from_all_rows():
+    first = rows(["PID1", "PID2"], "2024-01-01", 30)
+    # Later rows of known patients, and a new patient
+    more = rows(["PID2", "PID1", "PID3"], "2024-01-01 00:30", 20, seed=1)
+    appended = har_store.HarStore(first).appended(more)
+    full = har_store.HarStore(pd.concat([first, more]))
+    pd.testing.assert_frame_equal(appended.frame(), full.frame())
+    pd.testing.assert_frame_equal(appended.patient_features(), full.patient_features())
+
+
+def test_combined_features_equal_features_of_all_rows():
+    first = rows(["PID1", "PID2"], "2024-01-01", 30)
+    more = rows(["PID2", "PID3"], "2024-01-01 00:30", 20, seed=1)
+    features = har_store.HarStore(first).patient_features().set_index("Patient_ID")
+    extra = har_store.HarStore(more).patient_features().set_index("Patient_ID")
+    combined = har_store.combine_features(features, extra).sort_index()
+    full = har_store.HarStore(pd.concat([first, more])).patient_features().set_index("Patient_ID")
+    pd.testing.assert_frame_equal(combined, full, check_dtype=False)
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+import har_stream
+import sud_data
+from har_store import HarStore
+
+
+def frame(patient, minutes, heart_rate, start="2024-12-23 08:00", relapse="No"):
+    """`minutes` HAR rows for one patient, one per minute, in the CSV layout."""
+    times = pd.date_range(start, periods=minutes, freq="min")
+    heart_rate = np.broadcast_to(np.asarray(heart_rate, dtype=float), (len(times),))
+    return pd.DataFrame({
+        "Patient_ID": patient, "Timestamp": times.strftime("%m/%d/%Y %H:%M"), "Activity": "Sitting",
+        "X_accel": 0.1, "Y_accel": 0.1, "Z_accel": 9.8, "Heart_Rate": heart_rate, "Relapse_Indicator": relapse,
+    })
+
+
+def typed(rows):
+    return sud_data.apply_schema(rows, sud_data.HAR_SCHEMA)
+
+
+def feed(monitor, rows):
+    alerts = []
+    for _, minute in rows.groupby("Timestamp", sort=False):
+        alerts += monitor.update_frame(minute)
+    return alerts
+
+
+def state(monitor, patient):
+    return monitor.snapshot().set_index("Patient_ID").loc[patient]
+
+
+def test_heart_rate_jump_raises_an_alert_after_warmup():
+    monitor = har_stream.HarMonitor()
+    assert feed(monitor, frame("P1", 120, 70 + np.random.default_rng(0).normal(0, 1, 120))) == []
+    alerts = feed(monitor, frame("P1", 20, 120, start="2024-12-23 10:00"))
+    assert [a["kind"] for a in alerts if a["kind"] == "heart_rate"] == ["heart_rate"]
+    assert alerts[0]["Patient_ID"] == "P1"
+
+
+def test_non_finite_readings_leave_the_signal_untouched():
+    monitor = har_stream.HarMonitor()
+    feed(monitor, frame("P1", 10, 70))
+    rows = frame("P1", 3, [np.nan, np.inf, 70], start="2024-12-23 09:00")
+    feed(monitor, rows)
+    row = state(monitor, "P1")
+    assert row["Samples"] == 13
+    assert np.isfinite(row["heart_rate_baseline"]) and row["heart_rate_baseline"] == 70
+    assert monitor.signals["heart_rate"][3, 0] == 11
+    # The other signals of the same rows still count
+    assert monitor.signals["accel_magnitude"][3, 0] == 13
+
+
+def test_first_reading_missing_does_not_bias_the_average():
+    monitor = har_stream.HarMonitor()
+    feed(monitor, frame("P1", 2, [np.nan, 80]))
+    assert state(monitor, "P1")["heart_rate_recent"] == 80
+
+
+def test_stale_rows_are_dropped():
+    monitor = har_stream.HarMonitor()
+    feed(monitor, frame("P1", 5, 70, start="2024-12-23 09:00"))
+    before = state(monitor, "P1")
+    feed(monitor, frame("P1", 5, 150, start="2024-12-23 08:00"))
+    assert monitor.rows == 5
+    assert state(monitor, "P1")["heart_rate_recent"] == before["heart_rate_recent"]
+
+
+def test_prime_applies_history_without_alerts():
+    history = frame("P1", 120, 70 + np.random.default_rng(0).normal(0, 1, 120))
+    history = pd.concat([history, frame("P1", 20, 120, start="2024-12-23 10:00")], ignore_index=True)
+    monitor = har_stream.HarMonitor().prime(HarStore(typed(history)))
+    assert monitor.rows == 140
+    assert monitor.recent_alerts() == []
+    # Live rows continue from the primed state; history replayed again is ignored
+    feed(monitor, history)
+    assert monitor.rows == 140
+
+
+def test_replay_matches_feeding_minute_by_minute():
+    rows = pd.concat([frame("P1", 30, 70 + np.arange(30) % 5),
+                      frame("P2", 30, 90 - np.arange(30) % 7)], ignore_index=True)
+    replayed = har_stream.replay(HarStore(typed(rows)), har_stream.HarMonitor())
+    fed = har_stream.HarMonitor()
+    feed(fed, rows.sort_values("Timestamp", kind="stable"))
+    pd.testing.assert_frame_equal(replayed.snapshot().reset_index(drop=True), fed.snapshot().reset_index(drop=True))
@@ -0,0 +1,26 @@
+"""Startup import time of each Streamlit entry point stays within its budget."""
+import os
+
+import pytest
+
+import import_budget
+
+
+# Wall-clock timings are only meaningful on a quiet machine, so they run on request:
+#     THRIVE_IMPORT_BUDGET=1 python -m pytest tests/test_import_budget.py
+timed = pytest.mark.skipif(not os.getenv("THRIVE_IMPORT_BUDGET"), reason="set THRIVE_IMPORT_BUDGET=1 to time imports")
+
+
+@timed
+@pytest.mark.parametrize("entry", import_budget.ENTRY_POINTS)
+def test_startup_within_budget(entry):
+    modules, _ = import_budget.collect_imports(os.path.join(import_budget.ROOT, entry))
+    startup = import_budget.measure([], modules)
+    assert "error" not in startup, startup.get("error")
+    slowest = ", ".join(f"{name} {ms} ms" for name, ms in list(startup["modules"].items())[:5])
+    assert startup["ms"] <= import_budget.BUDGET_MS[entry], (
+        f"{entry} imports in {startup['ms']} ms, over its {import_budget.BUDGET_MS[entry]} ms budget ({slowest})")
+
+
+def test_every_entry_point_has_a_budget():
+    assert set(import_budget.ENTRY_POINTS) == set(import_budget.BUDGET_MS)
@@ -0,0 +1,189 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def source_lines(name, count):
+    with open(os.path.join(ROOT, name)) as f:
+        return [next(f) for _ in range(count + 1)]
+
+
+SUD_LINES = source_lines("Synthetic_SUD_Patient_Data.csv", 20)
+HAR_LINES = source_lines("Synthetic_HAR_Data_for_SUD_Patients2.csv", 1000)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    sud, har = str(tmp_path / "sud.csv"), str(tmp_path / "har.csv")
+    with open(sud, "w") as f:
+        f.writelines(SUD_LINES[:11])
+    with open(har, "w") as f:
+        f.writelines(HAR_LINES[:501])
+    return sud, har, str(tmp_path / "state")
+
+
+def append(path, lines):
+    with open(path, "a") as f:
+        f.writelines(lines)
+
+
+def test_derive_builds_outside_the_dataset_lock(paths):
+    dataset = ingest.Dataset(*paths)
+    lock_free = []
+
+    def take_lock():
+        if dataset._lock.acquire(timeout=5):
+            dataset._lock.release()
+            lock_free.append(True)
+
+    def build(ds):
+        # Another thread, such as a refresh, can take the lock mid-build
+        taker = threading.Thread(target=take_lock)
+        taker.start()
+        taker.join()
+        return len(ds.har)
+
+    derived = dataset.derive(build, lambda value, delta: value + len(delta.har))
+    assert lock_free == [True]
+    assert derived.value == 500
+    append(paths[1], HAR_LINES[501:601])
+    dataset.refresh()
+    assert derived.value == 600
+
+
+def test_derive_rebuilds_when_a_refresh_lands_mid_build(paths):
+    dataset = ingest.Dataset(*paths)
+    builds = []
+
+    def build(ds):
+        rows = len(ds.har)
+        builds.append(rows)
+        if len(builds) == 1:
+            # Published while building; the update for it is skipped, so the
+            # build has to run again to include it
+            append(paths[1], HAR_LINES[501:601])
+            ds.refresh()
+        return rows
+
+    derived = dataset.derive(build, lambda value, delta: value + len(delta.har))
+    assert builds == [500, 600]
+    assert derived.value == 600
+
+
+def test_reload_marks_derived_values_for_rebuild(paths):
+    dataset = ingest.Dataset(*paths)
+    derived = dataset.derive(lambda ds: len(ds.har), lambda value, delta: value + len(delta.har))
+    # Rewritten rather than appended: a full reload, rebuilt on the next read
+    with open(paths[1], "w") as f:
+        f.writelines(HAR_LINES[:301])
+    assert dataset.refresh().reset
+    assert derived.value == 300
+
+
+def sorted_patients(dataset):
+    return dataset.patients().sort_values("Patient_ID").reset_index(drop=True)
+
+
+def in_memory(frame):
+    # Stored numeric columns are memory-mapped; compare values, not array types
+    return pd.DataFrame({name: column if isinstance(column.dtype, pd.CategoricalDtype) else np.array(column)
+                         for name, column in frame.items()})
+
+
+def assert_same_rows(incremental, full):
+    for left, right in [(incremental.sud, full.sud), (incremental.har.frame(), full.har.frame()),
+                        (incremental.har.patient_features(), full.har.patient_features()),
+                        (sorted_patients(incremental), sorted_patients(full))]:
+        pd.testing.assert_frame_equal(in_memory(left), in_memory(right))
+
+
+def minutes(patients, start, stop):
+    # The sample HAR file has 100 rows per patient, one per minute
+    return [line for p in patients for line in HAR_LINES[1 + 100 * p + start:1 + 100 * p + stop]]
+
+
+def test_incremental_ingest_equals_a_full_reload(paths, tmp_path):
+    sud, har, state = paths
+    with open(sud, "w") as f:
+        f.writelines(SUD_LINES[:9])
+    with open(har, "w") as f:
+        f.writelines(HAR_LINES[:1] + minutes(range(5), 0, 40))
+    dataset = ingest.Dataset(sud, har, state)
+    published = []
+    dataset.subscribe(published.append)
+
+    # Later minutes of known patients, first rows of enrolled patients, a
+    # new patient, and sensor rows of a patient who enrolls later
+    append(sud, SUD_LINES[9:10])
+    append(har, minutes(range(5), 40, 70) + minutes(range(5, 9), 0, 50) + minutes([9], 0, 10))
+    delta = dataset.refresh()
+    assert (len(delta.sud), len(delta.har), delta.reset) == (1, 360, False)
+    append(sud, SUD_LINES[10:21])
+    append(har, minutes(range(10), 70, 100))
+    dataset.refresh()
+    assert len(published) == 2
+
+    full = ingest.Dataset(sud, har, str(tmp_path / "fresh-state"))
+    assert (len(dataset.sud), len(dataset.har)) == (20, 200 + 150 + 200 + 10 + 300)
+    assert_same_rows(dataset, full)
+
+
+def test_nothing_new_publishes_nothing(paths):
+    dataset = ingest.Dataset(*paths)
+    version = dataset.version
+    assert dataset.refresh() is None
+    assert dataset.version == version
+
+
+def test_invalid_appended_rows_are_rejected(paths):
+    sud, har, state = paths
+    dataset = ingest.Dataset(sud, har, state)
+    # A patient already enrolled, and sensor rows no later than ones already stored
+    append(sud, SUD_LINES[1:2] + SUD_LINES[11:12])
+    append(har, HAR_LINES[1:3] + HAR_LINES[501:502])
+    delta = dataset.refresh()
+    assert list(delta.sud["Patient_ID"]) == [SUD_LINES[11].split(",")[0]]
+    assert len(delta.har) == 1
+    assert (len(dataset.sud), len(dataset.har)) == (11, 501)
+
+
+def test_partial_last_line_waits_for_the_next_refresh(paths):
+    sud, har, state = paths
+    dataset = ingest.Dataset(sud, har, state)
+    line = HAR_LINES[501]
+    append(har, [line[:10]])
+    assert dataset.refresh() is None
+    append(har, [line[10:]])
+    assert len(dataset.refresh().har) == 1
+
+
+def test_rows_stored_by_another_worker_are_loaded_not_parsed_again(paths):
+    sud, har, state = paths
+    first = ingest.Dataset(sud, har, state)
+    second = ingest.Dataset(sud, har, state)
+    append(har, HAR_LINES[501:601])
+    first.refresh()
+    delta = second.refresh()
+    assert len(delta.har) == 100
+    assert second.version == first.version
+    assert_same_rows(second, first)
+
+
+def test_rewritten_source_is_reloaded_with_a_new_version(paths):
+    sud, har, state = paths
+    dataset = ingest.Dataset(sud, har, state)
+    version = dataset.version
+    # As many rows as before, but different ones
+    with open(har, "w") as f:
+        f.writelines(HAR_LINES[:1] + HAR_LINES[501:1001])
+    delta = dataset.refresh()
+    assert delta.reset
+    assert dataset.version != version
+    assert len(dataset.har) == 500
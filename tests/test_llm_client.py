@@ -0,0 +1,226 @@
+"""llm_client against a local fake of the Gemini REST API, reached through configure(endpoint)."""
+import asyncio
+import http.server
+import json
+import threading
+
+import pytest
+
+import llm_client
+
+
+def _response(*texts):
+    return {"candidates": [{"content": {"parts": [{"text": t}], "role": "model"}, "finishReason": "STOP", "index": 0}
+                           for t in texts]}
+
+
+class FakeGemini(http.server.ThreadingHTTPServer):
+    """Answers generateContent with `text`, and streamGenerateContent with `chunks`
+    (the REST transport reads a stream as one JSON array). Queued errors are
+    returned first, one per request."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.reset()
+
+    def reset(self):
+        self.text = "hello"
+        self.chunks = ["hel", "lo"]
+        self.errors = []
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def fail(self, status, times=1):
+        self.errors.extend([status] * times)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server.requests.append((self.path.split("?")[0], body["contents"][0]["parts"][0]["text"]))
+        if server.errors:
+            status = server.errors.pop(0)
+            self._send(status, {"error": {"code": status, "message": "fake error"}})
+        elif ":streamGenerateContent" in self.path:
+            self._send(200, [_response(c) for c in server.chunks])
+        else:
+            self._send(200, _response(server.text))
+
+    def _send(self, status, payload):
+        out = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def fake_gemini():
+    fake = FakeGemini()
+    threading.Thread(target=fake.serve_forever, daemon=True).start()
+    yield fake
+    fake.shutdown()
+    fake.server_close()
+
+
+@pytest.fixture
+def server(fake_gemini, monkeypatch):
+    fake = fake_gemini
+    fake.reset()
+    monkeypatch.setattr(llm_client, "_settings", {})
+    monkeypatch.setattr(llm_client, "_configured", False)
+    monkeypatch.setattr(llm_client, "_client", None)
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE_SECONDS", 0.001)
+    llm_client.configure("test-key", endpoint=fake.url)
+    return fake
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_configure_endpoint_routes_requests(server):
+    client = llm_client.LLMClient(model_name="gemini-pro")
+    assert client.generate("Hi") == "hello"
+    assert server.requests == [("/v1beta/models/gemini-pro:generateContent", "Hi")]
+
+
+def test_generate_is_cached_by_normalized_prompt(server):
+    client = llm_client.LLMClient()
+    assert client.generate("Summarize  the NOTES") == "hello"
+    server.text = "changed"
+    assert client.generate("summarize the notes") == "hello"
+    assert len(server.requests) == 1
+    assert (client.cache.hits, client.cache.misses) == (1, 1)
+
+
+def test_stream_yields_chunks_and_caches_the_whole_response(server):
+    client = llm_client.LLMClient(model_name="gemini-pro")
+    assert list(client.stream("Hi")) == ["hel", "lo"]
+    assert server.requests == [("/v1beta/models/gemini-pro:streamGenerateContent", "Hi")]
+    # A repeat is served from the cache as one chunk, and generate shares the entry
+    assert list(client.stream("Hi")) == ["hello"]
+    assert client.generate("Hi") == "hello"
+    assert len(server.requests) == 1
+
+
+def test_stream_releases_its_slot_when_closed_early(server):
+    client = llm_client.LLMClient(max_concurrency=1)
+    chunks = client.stream("Hi")
+    assert next(chunks) == "hel"
+    chunks.close()
+    assert client.generate("other") == "hello"
+    # An unfinished stream is not cached
+    assert list(client.stream("Hi")) == ["hel", "lo"]
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retries_transient_errors(server, status):
+    server.fail(status, times=2)
+    client = llm_client.LLMClient(max_retries=2)
+    assert client.generate("Hi") == "hello"
+    assert len(server.requests) == 3
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_only_the_client_retries(server, status):
+    server.fail(status)
+    client = llm_client.LLMClient(max_retries=0)
+    with pytest.raises(Exception) as raised:
+        client.generate("Hi")
+    assert raised.value.code == status
+    assert len(server.requests) == 1
+
+
+def test_retries_stream_requests(server):
+    server.fail(429)
+    client = llm_client.LLMClient()
+    assert list(client.stream("Hi")) == ["hel", "lo"]
+    assert len(server.requests) == 2
+
+
+def test_gives_up_after_max_retries(server):
+    server.fail(429, times=3)
+    client = llm_client.LLMClient(max_retries=2)
+    with pytest.raises(Exception) as raised:
+        client.generate("Hi")
+    assert raised.value.code == 429
+    assert len(server.requests) == 3
+    assert client.generate("Hi") == "hello"
+
+
+def test_does_not_retry_client_errors(server):
+    server.fail(400)
+    client = llm_client.LLMClient()
+    with pytest.raises(Exception) as raised:
+        client.generate("Hi")
+    assert not llm_client.is_retryable(raised.value)
+    assert len(server.requests) == 1
+
+
+def test_agenerate_retries_and_can_leave_retries_to_the_caller(server):
+    client = llm_client.LLMClient()
+    server.fail(429)
+    assert asyncio.run(client.agenerate("first")) == "hello"
+    assert len(server.requests) == 2
+
+    server.fail(503)
+    with pytest.raises(Exception) as raised:
+        asyncio.run(client.agenerate("second", retries=0))
+    assert raised.value.code == 503
+    assert len(server.requests) == 3
+
+
+def test_agenerate_many_returns_failures_in_place(server):
+    server.fail(400)
+    client = llm_client.LLMClient(max_concurrency=1)
+    results = asyncio.run(client.agenerate_many(["a", "b", "c"]))
+    assert sum(isinstance(r, Exception) for r in results) == 1
+    assert results.count("hello") == 2
+
+
+def test_cached_responses_expire_after_ttl(server):
+    clock = Clock()
+    client = llm_client.LLMClient(cache=llm_client.ResponseCache(ttl=60, clock=clock))
+    assert client.generate("Hi") == "hello"
+    server.text = "fresh"
+    clock.now = 60
+    assert client.generate("Hi") == "hello"
+    clock.now = 60.5
+    assert client.generate("Hi") == "fresh"
+    assert len(server.requests) == 2
+
+
+def test_expired_entries_are_dropped():
+    clock = Clock()
+    cache = llm_client.ResponseCache(maxsize=2, ttl=10, clock=clock)
+    cache.put("a", 1)
+    clock.now = 5
+    cache.put("b", 2)
+    clock.now = 11
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = llm_client.ResponseCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+import feed
+import member_search
+
+
+@pytest.fixture
+def store(tmp_path):
+    return feed.FeedStore(str(tmp_path / "feed.db"))
+
+
+def names(hits):
+    return [hit["name"] for hit in hits]
+
+
+def test_prefix_and_misspelled_matches():
+    index = member_search.MemberIndex()
+    index.add_many([(1, "Jamie Rivera", False), (2, "Jordan Rivers", False), (3, "Alex Kim", False)])
+    assert names(index.search("jam")) == ["Jamie Rivera"]
+    assert names(index.search("jordan riv")) == ["Jordan Rivers"]
+    assert set(names(index.search("rivera"))) == {"Jamie Rivera", "Jordan Rivers"}
+    assert names(index.search("Rievra")) == ["Jamie Rivera"]
+
+
+def test_private_members_are_never_returned():
+    index = member_search.MemberIndex()
+    index.add_many([(1, "Jamie Rivera", True), (2, "Jamie Stone", False)])
+    assert names(index.search("jamie")) == ["Jamie Stone"]
+    index.add(2, "Jamie Stone", private=True)
+    assert index.search("jamie") == []
+
+
+def test_sync_picks_up_privacy_changed_by_another_worker(store, tmp_path):
+    member = store.add_user("Jamie Rivera")
+    index = member_search.MemberIndex.from_store(store)
+    assert names(index.search("jamie")) == ["Jamie Rivera"]
+
+    other_worker = feed.FeedStore(str(tmp_path / "feed.db"))
+    other_worker.update_profile(member, "Jamie Rivera", private=True)
+    assert index.sync(store).search("jamie") == []
+
+    other_worker.update_profile(member, "Jamie R", private=False)
+    other_worker.add_user("Jamie Stone")
+    assert sorted(names(index.sync(store).search("jamie"))) == ["Jamie R", "Jamie Stone"]
+
+
+def test_sync_reads_only_what_changed(store):
+    store.add_users([f"Member {i}" for i in range(5)])
+    index = member_search.MemberIndex.from_store(store)
+    assert list(store.iter_users(after=index.synced)) == []
+    store.update_profile(3, "Renamed Member", private=False)
+    assert [row[1:] for batch in store.iter_users(after=index.synced) for row in batch] == [
+        (3, "Renamed Member", 0)]
+
+
+def test_databases_without_change_numbers_are_upgraded(tmp_path):
+    path = str(tmp_path / "feed.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        "CREATE TABLE users (user_id INTEGER PRIMARY KEY, name TEXT NOT NULL, private INTEGER NOT NULL DEFAULT 0,"
+        " followers INTEGER NOT NULL DEFAULT 0, following INTEGER NOT NULL DEFAULT 0);"
+        "INSERT INTO users (user_id, name, private) VALUES (1, 'Jamie Rivera', 0), (2, 'Alex Kim', 1);")
+    conn.close()
+
+    store = feed.FeedStore(path)
+    index = member_search.MemberIndex.from_store(store)
+    assert names(index.search("jamie")) == ["Jamie Rivera"]
+    assert index.search("alex") == []
+    store.update_profile(1, "Jamie Rivera", private=True)
+    assert index.sync(store).search("jamie") == []
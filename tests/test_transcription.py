@@ -0,0 +1,56 @@
+from concurrent.futures import Future
+
+import pytest
+
+import transcription
+
+
+def done(text):
+    future = Future()
+    future.set_result(text)
+    return future
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    monkeypatch.setattr(transcription, "_jobs", {})
+    return transcription._jobs
+
+
+def test_chunk_spans_cover_the_file_with_overlap():
+    spans = transcription.chunk_spans(n_frames=100, rate=1, chunk_seconds=30, overlap_seconds=2)
+    assert spans == [(0, 30), (28, 30), (56, 30), (84, 16)]
+    assert transcription.chunk_spans(10, 1, 30, 2) == [(0, 10)]
+
+
+def test_stitch_drops_words_repeated_in_the_overlap():
+    assert transcription.stitch(["we talked about the", "About the next appointment", ""]) == \
+        "we talked about the next appointment"
+
+
+def test_status_of_a_finished_job(jobs):
+    job = transcription.TranscriptionJob("a.wav", [done("hello there"), done("there friend")])
+    jobs[job.id] = job
+    assert transcription.status(job.id) == {"state": "done", "progress": 1.0, "text": "hello there friend",
+                                            "error": None}
+    transcription.forget(job.id)
+    assert transcription.status(job.id)["state"] == "unknown"
+
+
+def test_finished_jobs_are_evicted_after_the_ttl(jobs, monkeypatch):
+    monkeypatch.setattr(transcription, "FINISHED_TTL_SECONDS", 60)
+    finished = transcription.TranscriptionJob("a.wav", [done("hi")])
+    running = transcription.TranscriptionJob("b.wav", [Future()])
+    jobs.update({finished.id: finished, running.id: running})
+
+    assert not finished.expired(now=1000)
+    assert not finished.expired(now=1060)
+    assert finished.expired(now=1061)
+    assert not running.expired(now=10 ** 9)
+
+    finished.seen_done = None
+    transcription._evict_finished()
+    assert len(jobs) == 2
+    monkeypatch.setattr(transcription, "FINISHED_TTL_SECONDS", -1)
+    transcription._evict_finished()
+    assert list(jobs) == [running.id]
@@ -1,103 +1,264 @@
 import streamlit as st
-from streamlit_webrtc import webrtc_streamer, AudioProcessorBase, WebRtcMode
-import google.generativeai as genai
 import os
-import tempfile
-import wave
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.preprocessing import OneHotEncoder
-import pickle
+import sud_data
+import ingest
+import har_stream
+import risk_scoring
+import llm_client
+import case_reports
+import case_notes
+import aggregates
+from patient_table import IndexedTable
+import metrics
+
+# Heavy, page-specific dependencies are imported inside the page that uses them:
+# plotting for Data Visualization, WebRTC/av/SpeechRecognition for Case Management.
 
 # Set page configuration
 st.set_page_config(page_title="SUD Patient Analysis", page_icon="📊", layout="wide")
 
 # Configure Google Generative AI
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY', st.secrets.get("GOOGLE_API_KEY"))
-genai.configure(api_key=GOOGLE_API_KEY)
+llm_client.configure(GOOGLE_API_KEY)
 
-# Audio Processor for Streamlit WebRTC
-class AudioProcessor(AudioProcessorBase):
-    def __init__(self):
-        self.audio_frames = []
-
-    def recv_audio(self, frame):
-        self.audio_frames.append(frame)
-        return frame
-
-    def save_audio(self, filename):
-        audio_data = b"".join([frame.to_ndarray().tobytes() for frame in self.audio_frames])
-        with wave.open(filename, 'wb') as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)  # 16-bit audio
-            wf.setframerate(16000)
-            wf.writeframes(audio_data)
+# Render latency, cache hit rates, LLM and transcription metrics; exported when
+# THRIVE_METRICS_PORT or THRIVE_METRICS_FILE is set
+metrics.start_exporter()
 
 # Data Loading and Preprocessing
-@st.cache_data
-def load_and_preprocess_data():
-    # Load data from CSV files
-    sud_df = pd.read_csv("Synthetic_SUD_Patient_Data.csv")
-    har_df = pd.read_csv("Synthetic_HAR_Data_for_SUD_Patients2.csv")
-
-    # Merge datasets on Patient_ID
-    combined_df = pd.merge(sud_df, har_df, on="Patient_ID", how="inner")
+# SUD and HAR tables shared by every session on this worker, kept current with
+# rows appended to the source CSVs: a background refresh parses only the new
+# rows and publishes a new data version
+@metrics.cached(st.cache_resource)
+def load_dataset():
+    return ingest.Dataset().watch(ingest.WATCH_INTERVAL)
+
+# Early-warning state for every wearable. Primed from the stored HAR rows
+# without alerting, then fed the newly ingested rows as they arrive; rebuilt
+# if a source file is reloaded
+@metrics.cached(st.cache_resource)
+def load_har_monitor():
+    def build(dataset):
+        return har_stream.HarMonitor().prime(dataset.har)
+
+    def feed(monitor, delta):
+        monitor.update_frame(delta.har)
+        return monitor
+    return load_dataset().derive(build, feed)
+
+# Encoder + logistic regression: the version promoted by retrain.py, else the
+# shipped one. Loaded once per worker and model version
+@metrics.cached(st.cache_resource(max_entries=2))
+def load_risk_scorer(model_version):
+    return risk_scoring.RiskScorer.load()
+
+@metrics.cached(st.cache_data)
+def score_cohort(data, model_version):
+    return load_risk_scorer(model_version).score(data)
+
+# Bulk report store and the background run started from this worker, if any
+@metrics.cached(st.cache_resource)
+def load_report_store():
+    return case_reports.ReportStore()
+
+@metrics.cached(st.cache_resource)
+def bulk_report_runs():
+    return {}
+
+# Case notes log, shared with the community app's Case Management page
+@metrics.cached(st.cache_resource)
+def load_case_notes():
+    return case_notes.CaseNotes()
+
+# Materialized aggregates per data version; pages read these instead of scanning rows
+PATIENT_DIMS = ["Relapse_Risk", "Gender", "Substance_Type", "Treatment_Type", "Support_System"]
+PATIENT_CUBE_DIMS = {name: sud_data.SUD_SCHEMA[name] + [sud_data.MISSING_CATEGORY] for name in PATIENT_DIMS}
+SENSOR_DIMS = dict(PATIENT_CUBE_DIMS, Activity=sud_data.HAR_SCHEMA["Activity"] + [sud_data.MISSING_CATEGORY])
+SENSOR_MEASURES = ["Heart_Rate", "X_accel", "Y_accel", "Z_accel"]
+
+# One row per patient, so rebuilt for each data version. The leading underscore
+# keeps Streamlit from hashing the rows; `version` identifies them
+@metrics.cached(st.cache_resource(max_entries=2))
+def load_patient_cube(version, _data):
+    return aggregates.cached_cube(
+        sud_data.CACHE_DIR, "patients", version,
+        lambda: aggregates.AggregateCube.from_frame(_data, PATIENT_CUBE_DIMS, _data.select_dtypes("number").columns),
+    )
 
-    # Fill missing values with a placeholder
-    combined_df.fillna(value="Unknown", inplace=True)
+# Built once, then only the newly ingested sensor rows are folded in
+@metrics.cached(st.cache_resource)
+def load_sensor_cube():
+    dataset = load_dataset()
+
+    def build(dataset):
+        return aggregates.cached_cube(
+            sud_data.CACHE_DIR, "sensors", dataset.version,
+            lambda: aggregates.build_sensor_cube(dataset.har, dataset.sud, SENSOR_DIMS, SENSOR_MEASURES),
+        )
+
+    def update(cube, delta):
+        cube = aggregates.append_sensor_rows(cube, dataset.har, dataset.sud, delta.har, delta.sud["Patient_ID"])
+        cube.version = delta.version
+        aggregates.save_cube(sud_data.CACHE_DIR, "sensors", cube)
+        return cube
+
+    return dataset.derive(build, update)
+
+def load_aggregates(version, data):
+    return load_patient_cube(version, data), load_sensor_cube().value
+
+# Per-patient table with row-index buckets per categorical value, built once per data version
+TABLE_FILTER_COLUMNS = ["Relapse_Risk", "Substance_Type", "Treatment_Type", "Gender", "Support_System"]
+
+@metrics.cached(st.cache_resource(max_entries=2))
+def load_patient_table(version, model_version, _data):
+    scored = _data.join(score_cohort(_data, model_version)[['Predicted_Risk', 'Confidence']])
+    return IndexedTable(scored, TABLE_FILTER_COLUMNS + ['Predicted_Risk'])
+
+# Filter, sort and paginate on the server; only the visible page is sent to the browser
+def paginated_table(table, key, filter_columns=(), filters=None, columns=None, page_size=25):
+    filters = dict(filters or {})
+    for column in filter_columns:
+        chosen = st.multiselect(f"Filter by {column.replace('_', ' ')}", sorted(table.values(column)), key=f"{key}-{column}")
+        if chosen:
+            filters[column] = chosen
+
+    sort_by = st.selectbox("Sort by", ["(none)"] + list(columns or table.frame.columns), key=f"{key}-sort")
+    ascending = st.checkbox("Ascending", value=True, key=f"{key}-ascending")
+
+    total = len(table.select(filters))
+    pages = max(1, -(-total // page_size))
+    page_number = st.number_input("Page", min_value=1, max_value=pages, step=1, key=f"{key}-page")
+    visible, total = table.query(
+        filters, sort_by=None if sort_by == "(none)" else sort_by, ascending=ascending,
+        page=page_number - 1, page_size=page_size, columns=columns,
+    )
+    st.caption(f"{total} matching rows, page {page_number} of {pages}")
+    st.dataframe(visible, hide_index=True)
 
-    return combined_df
+# Rendered chart images shared by all sessions on this worker
+@metrics.cached(st.cache_resource)
+def load_figure_cache():
+    import figure_cache
+    figures = figure_cache.FigureCache()
+    metrics.register_collector("figure_cache", metrics.hit_miss_collector("figure", figures))
+    return figures
 
 # Dashboard Page
-def dashboard(data):
+def dashboard(version, data):
     st.title("Dashboard: SUD Patient Insights")
     st.write("Overview of relapse risks and patient statistics.")
 
     st.subheader("Relapse Risk Distribution")
-    relapse_counts = data['Relapse_Risk'].value_counts()
+    patient_cube, _ = load_aggregates(version, data)
+    relapse_counts = patient_cube.value_counts('Relapse_Risk')
     st.bar_chart(relapse_counts)
 
     st.subheader("High-Risk Patients (Relapse Risk: High)")
-    high_risk = data[data['Relapse_Risk'] == 'High']
-    st.write(high_risk[['Patient_ID', 'Substance_Type', 'Treatment_Type']])
+    patient_table = load_patient_table(version, risk_scoring.current_version(), data)
+    high_risk = patient_table.frame.iloc[patient_table.select({'Relapse_Risk': 'High'})]
+    paginated_table(
+        patient_table, "high-risk", filters={'Relapse_Risk': 'High'},
+        columns=['Patient_ID', 'Substance_Type', 'Treatment_Type', 'Predicted_Risk', 'Confidence'],
+    )
+
+    st.subheader("Bulk Case Reports")
+    report_store = load_report_store()
+    runs = bulk_report_runs()
+    running = "high_risk" in runs and runs["high_risk"].is_alive()
+    done_ids = report_store.completed()
+    remaining = int((~high_risk['Patient_ID'].isin(done_ids)).sum())
+    st.write(f"{len(high_risk) - remaining} of {len(high_risk)} high-risk reports generated.")
+    if running:
+        st.info("Generating reports in the background. Refresh to update progress.")
+    elif remaining and st.button("Generate Reports for All High-Risk Patients"):
+        # Already-finished patients are skipped, so this also resumes an interrupted run
+        runs["high_risk"] = case_reports.start_background(high_risk, report_store)
+        st.info("Started bulk report generation.")
+
+    page_size = 10
+    pages = max(1, -(-report_store.count() // page_size))
+    page_number = st.number_input("Report page", min_value=1, max_value=pages, step=1)
+    for entry in report_store.page(page_number - 1, page_size):
+        with st.expander(entry['patient_id']):
+            st.write(entry['report'])
 
     st.subheader("Key Statistics")
-    st.write(data.describe())
+    st.write(patient_cube.describe())
 
 # Data Visualization Page
-def data_visualization(data):
+def data_visualization(version, data):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    import figure_cache
+
     st.title("Data Visualization")
     st.write("Explore visual trends in patient data.")
 
+    _, sensor_cube = load_aggregates(version, data)
+    figures = load_figure_cache()
+    # Browser-rendered charts ship a small spec plus the aggregated rows instead of an image
+    client_side = st.toggle("Render charts in the browser", value=False)
+
     st.subheader("Average Heart Rate by Relapse Risk")
-    avg_heart_rate = data.groupby('Relapse_Risk')['Heart_Rate'].mean().reset_index()
-    fig, ax = plt.subplots()
-    sns.barplot(data=avg_heart_rate, x='Relapse_Risk', y='Heart_Rate', ax=ax)
-    ax.set_title("Average Heart Rate by Relapse Risk")
-    st.pyplot(fig)
+    avg_heart_rate = sensor_cube.rollup(['Relapse_Risk'], ['Heart_Rate'])
+    if client_side:
+        spec = figure_cache.bar_chart_spec('Relapse_Risk', 'Heart_Rate', "Average Heart Rate by Relapse Risk")
+        st.vega_lite_chart(avg_heart_rate, spec, use_container_width=True)
+    else:
+        def draw_heart_rate():
+            fig, ax = plt.subplots()
+            sns.barplot(data=avg_heart_rate, x='Relapse_Risk', y='Heart_Rate', ax=ax)
+            ax.set_title("Average Heart Rate by Relapse Risk")
+            return fig
+        key = figure_cache.figure_key(sensor_cube.version, "avg_heart_rate")
+        st.image(figures.get_or_render(key, draw_heart_rate))
 
     st.subheader("Activity Levels by Relapse Risk")
-    avg_activity = data.groupby('Relapse_Risk')[['X_accel', 'Y_accel', 'Z_accel']].mean().reset_index()
-    fig, ax = plt.subplots()
-    avg_activity.set_index('Relapse_Risk').plot(kind='bar', stacked=True, ax=ax)
-    ax.set_title("Average Activity Levels by Relapse Risk")
-    st.pyplot(fig)
+    avg_activity = sensor_cube.rollup(['Relapse_Risk'], ['X_accel', 'Y_accel', 'Z_accel'])
+    if client_side:
+        spec = figure_cache.stacked_bar_chart_spec('Relapse_Risk', "Average Activity Levels by Relapse Risk")
+        long_activity = figure_cache.long_format(avg_activity, 'Relapse_Risk', ['X_accel', 'Y_accel', 'Z_accel'])
+        st.vega_lite_chart(long_activity, spec, use_container_width=True)
+    else:
+        def draw_activity():
+            fig, ax = plt.subplots()
+            avg_activity.set_index('Relapse_Risk').plot(kind='bar', stacked=True, ax=ax)
+            ax.set_title("Average Activity Levels by Relapse Risk")
+            return fig
+        key = figure_cache.figure_key(sensor_cube.version, "avg_activity")
+        st.image(figures.get_or_render(key, draw_activity))
+
+    st.subheader("Early Warnings")
+    early_warnings()
 
     st.subheader("Filter Data")
-    relapse_risk_filter = st.selectbox("Select Relapse Risk Level", options=data['Relapse_Risk'].unique())
-    filtered_data = data[data['Relapse_Risk'] == relapse_risk_filter]
-    st.write(filtered_data)
+    paginated_table(load_patient_table(version, risk_scoring.current_version(), data), "filter-data", filter_columns=TABLE_FILTER_COLUMNS)
+
+# Polls the early-warning monitor for new alerts
+@st.fragment(run_every=2)
+def early_warnings():
+    monitor = load_har_monitor().value
+    st.write(f"{monitor.rows} sensor readings from {len(monitor)} wearables processed.")
+    alerts = monitor.recent_alerts(20)
+    if alerts:
+        st.dataframe(pd.DataFrame(alerts)[['Timestamp', 'Patient_ID', 'message']], hide_index=True)
+    else:
+        st.info("No alerts so far.")
+    st.write("Largest heart rate changes against each patient's baseline:")
+    columns = ['Patient_ID', 'Last_Seen', 'heart_rate_recent', 'heart_rate_baseline', 'heart_rate_z',
+               'accel_magnitude_z', 'relapse_indicator_recent', 'Activity_Changes']
+    st.dataframe(monitor.snapshot()[columns].head(10), hide_index=True)
 
 # ML Prediction Prototype
 def ml_prediction_prototype():
     st.title("ML Prediction: Relapse Risk")
-    st.write("Enter patient details to simulate a relapse risk prediction.")
+    st.write("Enter patient details to predict relapse risk with the trained model.")
 
     with st.form("prediction_form"):
         age = st.number_input("Age", min_value=0, max_value=120, value=30)
-        gender = st.selectbox("Gender", ["Male", "Female"])
+        gender = st.selectbox("Gender", ["Male", "Female", "Non-binary"])
         substance_type = st.selectbox("Substance Type", ["Alcohol", "Cannabis", "Opioids", "Cocaine", "Methamphetamine", "Polysubstance"])
         treatment_type = st.selectbox("Treatment Type", ["Residential Rehab", "Detox", "Counseling", "Medication-Assisted Treatment (MAT)"])
         support_system = st.selectbox("Support System", ["Strong", "Moderate", "Weak"])
@@ -106,28 +267,69 @@ def ml_prediction_prototype():
 
     if submit:
         with st.spinner("Generating prediction..."):
-            if treatment_outcome == "Ongoing" or support_system == "Weak" or substance_type in ["Cocaine", "Methamphetamine"]:
-                predicted_risk = "High"
-                confidence = 85
-            elif treatment_outcome == "Relapsed" or age > 50:
-                predicted_risk = "Medium"
-                confidence = 65
-            else:
-                predicted_risk = "Low"
-                confidence = 95
+            predicted_risk, probability = load_risk_scorer(risk_scoring.current_version()).score_one(
+                Age=age,
+                Gender=gender,
+                Substance_Type=substance_type,
+                Treatment_Type=treatment_type,
+                Support_System=support_system,
+                Treatment_Outcome=treatment_outcome,
+            )
+            confidence = round(probability * 100)
 
         st.subheader("Prediction Result")
         st.write(f"**Predicted Relapse Risk:** {predicted_risk}")
         st.write(f"**Confidence:** {confidence}%")
 
+# Polls the background transcription job while it runs; once it finishes, one
+# full rerun shows the result and this fragment is no longer rendered
+@st.fragment(run_every=2)
+def transcription_progress():
+    import transcription
+
+    job_status = transcription.status(st.session_state.transcription_job)
+    if job_status["state"] != "running":
+        st.rerun()
+    st.info("Transcribing audio...")
+    st.progress(job_status["progress"])
+
+# Transcript of a finished job and the case report generated from it, kept in
+# session state so later reruns still show the report
+def transcription_result(job_status):
+    if job_status["state"] != "done":
+        st.error(f"Error transcribing audio: {job_status['error']}")
+        return
+    transcript = job_status["text"]
+    st.success("Transcription completed!")
+    st.text_area("Transcription", transcript, height=200)
+
+    # Generate a case report
+    if st.button("Generate Report"):
+        prompt = f"Generate a detailed case report based on the following conversation:\n{transcript}"
+        st.subheader("Generated Case Report")
+        try:
+            st.session_state.transcript_report = st.write_stream(llm_client.get_client().stream(prompt))
+        except Exception as e:
+            st.error(f"Error generating report: {e}")
+    elif st.session_state.get("transcript_report"):
+        st.subheader("Generated Case Report")
+        st.markdown(st.session_state.transcript_report)
+
 # Case Management page updated with live audio recording and report generation
 def case_management(data):
+    from streamlit_webrtc import webrtc_streamer, WebRtcMode
+    from audio_recorder import AudioProcessor
+    import transcription
+
     st.title("Case Management")
     st.write("Manage and monitor patient cases with live audio recording and AI-generated reports.")
 
     # Live Audio Recording
     st.subheader("Live Audio Recording")
-    audio_processor = AudioProcessor()
+    # One recorder per session so reruns keep the take in progress
+    if "audio_processor" not in st.session_state:
+        st.session_state.audio_processor = AudioProcessor()
+    audio_processor = st.session_state.audio_processor
 
     webrtc_ctx = webrtc_streamer(
         key="audio-recording",
@@ -139,46 +341,37 @@ def case_management(data):
     )
 
     if webrtc_ctx.state.playing:
-        st.info("Recording...")
-
-    # Temporary storage for audio
-    temp_audio_path = None
+        st.info(f"Recording... {audio_processor.duration:.0f}s captured")
 
     if st.button("Stop and Process Recording"):
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio_file:
-            audio_processor.save_audio(temp_audio_file.name)
-            temp_audio_path = temp_audio_file.name
-            st.success("Audio recorded successfully!")
-
-            # Provide download button for the recorded audio
-            with open(temp_audio_path, "rb") as audio_file:
-                st.download_button(
-                    label="Download Audio",
-                    data=audio_file,
-                    file_name="recorded_audio.wav",
-                    mime="audio/wav"
-                )
-
-            # Transcribe audio (Placeholder for actual transcription)
-            st.info("Transcribing audio...")
-            try:
-                transcription = "Transcribed text from audio goes here..."  # Placeholder for transcription
-                st.success("Transcription completed!")
-                st.text_area("Transcription", transcription, height=200)
-
-                # Generate a case report
-                if st.button("Generate Report"):
-                    prompt = f"Generate a detailed case report based on the following conversation:\n{transcription}"
-                    try:
-                        model = genai.GenerativeModel('gemini-pro')
-                        response = model.generate_content(prompt)
-                        st.subheader("Generated Case Report")
-                        st.write(response.text)
-                    except Exception as e:
-                        st.error(f"Error generating report: {e}")
-
-            except Exception as e:
-                st.error(f"Error transcribing audio: {e}")
+        temp_audio_path = audio_processor.finish()
+        st.session_state.recording_path = temp_audio_path
+        # Transcription runs in the background worker pool; the page polls for progress
+        st.session_state.transcription_job = transcription.submit(temp_audio_path)
+        st.session_state.pop("transcription_status", None)
+        st.session_state.pop("transcript_report", None)
+        st.success("Audio recorded successfully!")
+
+    if "recording_path" in st.session_state:
+        # Provide download button for the recorded audio
+        with open(st.session_state.recording_path, "rb") as audio_file:
+            st.download_button(
+                label="Download Audio",
+                data=audio_file,
+                file_name="recorded_audio.wav",
+                mime="audio/wav"
+            )
+
+        job_status = st.session_state.get("transcription_status")
+        if job_status is None:
+            job_status = transcription.status(st.session_state.transcription_job)
+        if job_status["state"] == "running":
+            transcription_progress()
+        else:
+            # The result is kept in the session from here on, so the job is dropped
+            st.session_state.transcription_status = job_status
+            transcription.forget(st.session_state.transcription_job)
+            transcription_result(job_status)
 
     # Patient ID and additional notes
     st.subheader("Patient Details")
@@ -190,48 +383,42 @@ def case_management(data):
         if not patient_id:
             st.error("Patient ID is required to generate a report.")
         else:
-            combined_notes = notes
+            notes_log = load_case_notes()
+            if notes.strip():
+                notes_log.append(patient_id, notes.strip(), author="case management")
+            # Earlier notes for this patient, newest last, come from the log's patient index
+            combined_notes = notes_log.prior_notes(patient_id) or notes
 
-            # Generate the case report
-            report = generate_case_report(patient_id, combined_notes)
+            # Generate the case report, streamed into the page as it is produced
             st.subheader("Generated Case Report")
-            st.write(report)
+            try:
+                st.write_stream(generate_case_report(patient_id, combined_notes))
+            except Exception as e:
+                st.error(f"Error generating report: {e}")
+                st.write("Sorry, I couldn't process your request.")
 
 # Function to generate a case report using Google Generative AI
 def generate_case_report(patient_id, notes):
-    try:
-        prompt = f"""
-        Generate a detailed case report for a Substance Use Disorder (SUD) patient.
-        Patient ID: {patient_id}.
-        Case notes:
-        {notes}
-        Include the following sections:
-        1. Patient Overview
-        2. Diagnosis
-        3. Treatment Plan
-        4. Medication Dosage and Instructions (if applicable)
-        5. Recommendations and Referrals
-        6. Follow-Up Plan
-        Format the report for professional documentation.
-        """
-
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        st.error(f"Error generating report: {e}")
-        return "Sorry, I couldn't process your request."
+    # Shared client: cached responses, retries on rate limits, streamed text chunks
+    return llm_client.get_client().stream(case_reports.case_report_prompt(patient_id, notes))
 
 # Navigation
 page = st.sidebar.selectbox("Select a Page", ["Dashboard", "Data Visualization", "ML Prediction", "Case Management"])
 
-data = load_and_preprocess_data()
-
-if page == "Dashboard":
-    dashboard(data)
-elif page == "Data Visualization":
-    data_visualization(data)
-elif page == "ML Prediction":
-    ml_prediction_prototype()
-elif page == "Case Management":
-    case_management(data)
+with metrics.page_render("thriveapp", page, st.session_state):
+    # One row per patient: demographics joined with the compact HAR feature table.
+    # The dataset recomputes only the rows of patients with new records and
+    # replaces the frame rather than changing it, so pages use it directly.
+    # Missing categorical values are already filled with "Unknown" by the schema.
+    # The version and its rows come from one locked read, so a refresh in
+    # between cannot cache one version's rows under the other's key
+    version, data = load_dataset().snapshot()
+
+    if page == "Dashboard":
+        dashboard(version, data)
+    elif page == "Data Visualization":
+        data_visualization(version, data)
+    elif page == "ML Prediction":
+        ml_prediction_prototype()
+    elif page == "Case Management":
+        case_management(data)
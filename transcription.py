@@ -0,0 +1,166 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+import speech_recognition as sr
+
+import metrics
+
+# Recognizer backend. "sphinx" (pocketsphinx) and "vosk" run fully offline;
+# "google" uses the free web API and needs network access.
+BACKEND = os.getenv("THRIVE_TRANSCRIBE_BACKEND", "sphinx")
+WORKERS = int(os.getenv("THRIVE_TRANSCRIBE_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+
+# Long recordings are cut into overlapping chunks that are transcribed in parallel
+CHUNK_SECONDS = 30
+OVERLAP_SECONDS = 2
+MAX_OVERLAP_WORDS = 12
+# Finished jobs nobody forgot, e.g. from a closed browser tab, are dropped this
+# long after they were first seen finished
+FINISHED_TTL_SECONDS = float(os.getenv("THRIVE_TRANSCRIBE_TTL", 3600))
+
+_pool = None
+_pool_lock = threading.Lock()
+_jobs = {}
+
+
+def _get_pool():
+    # One pool per server process, created on first use. "spawn" avoids forking
+    # the threaded Streamlit server.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def chunk_spans(n_frames, rate, chunk_seconds=CHUNK_SECONDS, overlap_seconds=OVERLAP_SECONDS):
+    """(start, length) frame spans covering the file with overlapping chunks."""
+    size = int(chunk_seconds * rate)
+    step = max(1, size - int(overlap_seconds * rate))
+    spans = []
+    start = 0
+    while True:
+        spans.append((start, min(size, n_frames - start)))
+        if start + size >= n_frames:
+            return spans
+        start += step
+
+
+def transcribe_span(path, start, length, backend=BACKEND, language="en-US"):
+    """Transcribe one span of a WAV file. Runs in a worker process."""
+    with wave.open(path, "rb") as wf:
+        wf.setpos(start)
+        frames = wf.readframes(length)
+        audio = sr.AudioData(frames, wf.getframerate(), wf.getsampwidth())
+
+    recognizer = sr.Recognizer()
+    try:
+        if backend == "sphinx":
+            return recognizer.recognize_sphinx(audio, language=language)
+        if backend == "vosk":
+            return recognizer.recognize_vosk(audio)
+        if backend == "google":
+            return recognizer.recognize_google(audio, language=language)
+    except sr.UnknownValueError:
+        # Silence or unintelligible speech in this chunk
+        return ""
+    raise ValueError(f"Unknown transcription backend: {backend}")
+
+
+def stitch(texts, max_overlap_words=MAX_OVERLAP_WORDS):
+    """Join chunk transcripts, dropping words repeated in the overlap between chunks."""
+    words = []
+    for text in texts:
+        new = text.split()
+        overlap = 0
+        for k in range(min(max_overlap_words, len(words), len(new)), 0, -1):
+            if [w.lower() for w in words[-k:]] == [w.lower() for w in new[:k]]:
+                overlap = k
+                break
+        words.extend(new[overlap:])
+    return " ".join(words)
+
+
+class TranscriptionJob:
+    def __init__(self, path, futures, backend=BACKEND):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.futures = futures
+        self.backend = backend
+        self.submitted = time.monotonic()
+        self.finished = None
+        self.seen_done = None
+
+    def expired(self, now):
+        if not all(f.done() for f in self.futures):
+            return False
+        if self.seen_done is None:
+            self.seen_done = now
+        return now - self.seen_done > FINISHED_TTL_SECONDS
+
+    @property
+    def progress(self):
+        return sum(f.done() for f in self.futures) / len(self.futures)
+
+    def status(self):
+        """Snapshot for polling: state is "running", "done" or "failed"."""
+        if not all(f.done() for f in self.futures):
+            return {"state": "running", "progress": self.progress, "text": None, "error": None}
+        if self.finished is None:
+            # First poll after completion; close enough for end-to-end latency at a 2 s poll
+            self.finished = time.monotonic()
+            metrics.observe("thrive_transcription_job_seconds", self.finished - self.submitted, backend=self.backend)
+        errors = [f.exception() for f in self.futures if f.exception() is not None]
+        if errors:
+            return {"state": "failed", "progress": 1.0, "text": None, "error": str(errors[0])}
+        return {"state": "done", "progress": 1.0, "text": stitch(f.result() for f in self.futures), "error": None}
+
+
+def submit(path, backend=BACKEND, language="en-US"):
+    """Queue a saved WAV recording for background transcription; returns a job id."""
+    with wave.open(path, "rb") as wf:
+        spans = chunk_spans(wf.getnframes(), wf.getframerate())
+    pool = _get_pool()
+    futures = [pool.submit(transcribe_span, path, start, length, backend, language) for start, length in spans]
+    job = TranscriptionJob(path, futures, backend)
+    _evict_finished()
+    _jobs[job.id] = job
+    metrics.inc("thrive_transcription_jobs_total", backend=backend)
+    return job.id
+
+
+def status(job_id):
+    job = _jobs.get(job_id)
+    if job is None:
+        return {"state": "unknown", "progress": 0.0, "text": None, "error": "No such transcription job"}
+    return job.status()
+
+
+def forget(job_id):
+    """Drop a job once its result has been read."""
+    _jobs.pop(job_id, None)
+
+
+def _evict_finished():
+    now = time.monotonic()
+    for job_id, job in list(_jobs.items()):
+        if job.expired(now):
+            _jobs.pop(job_id, None)
+
+
+def queue_depth():
+    """Chunks submitted to the pool that have not finished yet."""
+    return sum(1 for job in list(_jobs.values()) for f in job.futures if not f.done())
+
+
+def _collect_metrics():
+    yield "thrive_transcription_queue_depth", {}, queue_depth()
+    yield "thrive_transcription_workers", {}, WORKERS
+
+
+metrics.register_collector("transcription", _collect_metrics)
@@ -1,10 +1,16 @@
 import streamlit as st
-import google.generativeai as genai
 import os
+import warnings
+import llm_client
+import metrics
+import document_store
+import application_store
+import faq_index
 
 # Configure Google Generative AI
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY', st.secrets.get("GOOGLE_API_KEY"))
-genai.configure(api_key=GOOGLE_API_KEY)
+llm_client.configure(GOOGLE_API_KEY)
+metrics.start_exporter()
 
 # App title and description
 st.title("Anchor: Your Medicaid Enrollment Assistant")
@@ -13,8 +19,31 @@ This application simplifies the Medicaid enrollment process for high-needs indiv
 providing guided steps for document preparation and full Medicaid enrollment.
 """)
 
+# Enrollment applications and status history, shared by all sessions on this server
+@metrics.cached(st.cache_resource)
+def load_application_store():
+    return application_store.ApplicationStore()
+
+# FAQ and document-requirement index, built once per server; answers close
+# matches locally and only sends other questions to the LLM
+@metrics.cached(st.cache_resource)
+def load_faq_index():
+    return faq_index.FaqIndex()
+
+# Polls the background checks of this session's uploads
+@st.fragment(run_every=2)
+def document_status(documents):
+    rows = [document_store.describe(d) for d in documents]
+    st.dataframe(rows, hide_index=True)
+    if any(row["Status"] == "queued" for row in rows):
+        st.info("Checking your documents...")
+    else:
+        st.info("Our team will verify your documents shortly.")
+
 # Navigation menu
 menu = st.sidebar.radio("Navigation", ["Home", "Document Hub", "Medicaid Enrollment", "Progress Tracker", "Help"])
+# Time this rerun; finished after the footer
+render = metrics.page_render("turbo", menu, st.session_state)
 
 # Home page
 if menu == "Home":
@@ -50,10 +79,13 @@ elif menu == "Document Hub":
 
     # Document upload
     st.write("### Upload Documents")
-    uploaded_files = st.file_uploader("Upload your required documents (PDF, PNG, JPG)", accept_multiple_files=True)
+    uploaded_files = st.file_uploader("Upload your required documents (PDF, PNG, JPG)", type=["pdf", "png", "jpg", "jpeg"], accept_multiple_files=True)
     if uploaded_files:
-        st.success(f"{len(uploaded_files)} document(s) uploaded successfully.")
-        st.info("Our team will verify your documents shortly.")
+        # Streamed to disk in chunks and stored once per content hash
+        documents = document_store.store_uploads(uploaded_files, st.session_state.setdefault("documents", {}))
+        accepted = sum("error" not in d for d in documents)
+        st.success(f"{accepted} document(s) uploaded successfully.")
+        document_status(documents)
 
 # Medicaid Enrollment page
 elif menu == "Medicaid Enrollment":
@@ -76,17 +108,42 @@ elif menu == "Medicaid Enrollment":
     insurance_status = st.selectbox("Do you currently have health insurance?", ["Yes", "No"], key="insurance_status")
 
     if st.button("Submit Application"):
-        st.success("Your Medicaid application has been submitted.")
-        st.info("Track your application status in the Progress Tracker.")
+        if not name.strip():
+            st.error("Please enter your full name.")
+        else:
+            st.session_state.application_id = load_application_store().submit(name, dob, {
+                "address": address,
+                "income": income,
+                "employment_status": employment_status,
+                "household_size": household_size,
+                "health_conditions": health_conditions,
+                "insurance_status": insurance_status,
+            })
+            st.success(f"Your Medicaid application has been submitted. Application ID: {st.session_state.application_id}")
+            st.info("Track your application status in the Progress Tracker.")
 
 # Progress Tracker page
 elif menu == "Progress Tracker":
     st.header("Track Your Application Progress")
     st.write("Check the status of your Medicaid application.")
 
-    # Simulated progress tracker
-    progress = st.progress(70)
-    st.write("Current Status: Application Submitted. Awaiting Review.")
+    applications = load_application_store()
+    if "application_id" not in st.session_state:
+        # Returning applicants look up their most recent application
+        lookup_name = st.text_input("Full Name", key="tracker_name")
+        lookup_dob = st.date_input("Date of Birth", key="tracker_dob")
+        if st.button("Find My Application"):
+            found = applications.find(lookup_name, lookup_dob)
+            if found:
+                st.session_state.application_id = found[0]["application_id"]
+            else:
+                st.warning("No application found for that name and date of birth.")
+
+    current = applications.status(st.session_state.get("application_id"))
+    if current is not None:
+        progress = st.progress(current["progress"])
+        st.write(f"Current Status: {current['message']}")
+        st.caption(f"Application ID: {current['application_id']}")
 
 # Help Section
 elif menu == "Help":
@@ -96,12 +153,23 @@ elif menu == "Help":
     # AI Chatbot for Help
     user_query = st.text_input("Type your question here:")
     if user_query:
-        try:
-            # Generate response from Google Generative AI
-            response = genai.chat(prompt=user_query)
-            st.text_area("Chatbot Response", response["output"], height=200)
-        except Exception as e:
-            st.error("Sorry, I couldn't process your request. Please try again later.")
+        faq = load_faq_index()
+        match = faq.answer(user_query)
+        st.write("**Chatbot Response**")
+        if match is not None:
+            st.write(match["answer"])
+        else:
+            try:
+                # Stream the response from Google Generative AI through the shared client
+                response = st.write_stream(llm_client.get_client().stream(user_query))
+            except Exception as e:
+                st.error("Sorry, I couldn't process your request. Please try again later.")
+            else:
+                # The answer is already shown; failing to keep it is not the user's problem
+                try:
+                    faq.learn(user_query, response)
+                except Exception as e:
+                    warnings.warn(f"could not save the learned help answer: {e!r}")
     
     # Static FAQ (Optional for fallback)
     st.write("Frequently Asked Questions:")
@@ -114,3 +182,5 @@ elif menu == "Help":
 
 # Footer
 st.sidebar.write("© 2025 Medicaid Enrollment Assistant. All rights reserved.")
+
+render.finish()